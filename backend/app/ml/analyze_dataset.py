@@ -1,60 +1,389 @@
-import os
+import argparse
+import hashlib
 import json
+import os
+from collections import Counter
+from multiprocessing import Pool
 from pathlib import Path
+
+import numpy as np
 from PIL import Image
-import matplotlib.pyplot as plt
 
-def analyze_dataset():
-    # Chemins
-    base_dir = Path(__file__).parent.parent.parent.parent
-    image_dir = base_dir / "usable_images"
-    annotation_dir = base_dir / "annotations"
-    
-    # Statistiques
-    stats = {
-        "total_images": 0,
-        "good_grapes": 0,
-        "bad_grapes": 0,
-        "image_sizes": [],
-        "annotations": {}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Plus petit côté : repères du pipeline (Resize(256), CenterCrop(224), cache d'images à 320)
+MIN_SIDE_BINS = (0, 64, 128, 224, 256, 320, 512, 1024, 2048, 4096, 8192)
+
+def _file_key(path):
+    return hashlib.sha256(str(Path(path).resolve()).encode()).hexdigest()[:16]
+
+def _pack_strings(strings):
+    """Liste de chaînes -> tableau uint8 compact (une chaîne par ligne)."""
+    return np.frombuffer('\n'.join(strings).encode(), dtype=np.uint8)
+
+def _unpack_strings(array):
+    text = array.tobytes().decode()
+    return text.split('\n') if text else []
+
+def scan_images(image_dir):
+    """
+    Liste les images d'un dossier (récursivement) avec leur taille et leur date de modification.
+
+    Les dossiers cachés (.cache...) sont ignorés.
+
+    Returns:
+        tuple: (chemins relatifs à image_dir, tailles en octets, mtimes en ns)
+    """
+    image_dir = Path(image_dir)
+    paths, sizes, mtimes = [], [], []
+    stack = ['']
+    while stack:
+        relative = stack.pop()
+        with os.scandir(image_dir / relative) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                name = f"{relative}/{entry.name}" if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    stat = entry.stat()
+                    paths.append(name)
+                    sizes.append(stat.st_size)
+                    mtimes.append(stat.st_mtime_ns)
+    order = sorted(range(len(paths)), key=paths.__getitem__)
+    return ([paths[i] for i in order], np.array(sizes, dtype=np.int64)[order],
+            np.array(mtimes, dtype=np.int64)[order])
+
+def read_header(args):
+    """
+    Lit l'en-tête d'une image, sans décoder les pixels.
+
+    Args:
+        args (tuple): (chemin, vérifier l'intégrité du fichier entier)
+
+    Returns:
+        tuple: (largeur, hauteur, format, mode, erreur ou None)
+    """
+    path, verify = args
+    try:
+        with Image.open(path) as image:
+            result = (image.width, image.height, image.format or '', image.mode, None)
+            if verify:
+                # Parcourt tout le fichier (détecte les troncatures) sans décoder les pixels
+                image.verify()
+        return result
+    except Exception as e:
+        return 0, 0, '', '', f"{type(e).__name__}: {e}"
+
+def _load_profile_cache(cache_file):
+    try:
+        with np.load(cache_file) as data:
+            cached = {key: data[key] for key in data.files}
+    except (OSError, ValueError):
+        return None
+    cached['paths'] = _unpack_strings(cached['paths'])
+    cached['formats'] = _unpack_strings(cached['formats'])
+    cached['modes'] = _unpack_strings(cached['modes'])
+    cached['errors'] = {int(k): v for k, v in json.loads(cached['errors'].tobytes().decode()).items()}
+    return cached
+
+def _save_profile_cache(cache_file, profile):
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **{
+            **{key: profile[key] for key in ('file_size', 'mtime', 'width', 'height', 'format', 'mode')},
+            'paths': _pack_strings(profile['paths']),
+            'formats': _pack_strings(profile['formats']),
+            'modes': _pack_strings(profile['modes']),
+            'errors': np.frombuffer(json.dumps(profile['errors']).encode(), dtype=np.uint8),
+            'verified': np.array(profile['verified']),
+        })
+    os.replace(tmp_file, cache_file)
+
+def profile_images(image_dir, cache_dir=None, num_workers=None, verify=False, chunksize=256):
+    """
+    Profile toutes les images d'un dossier à partir de leurs en-têtes.
+
+    Les en-têtes sont lus par un pool de processus et rangés directement dans des
+    tableaux NumPy (un élément par image). Le résultat est mis en cache : seules les
+    images nouvelles ou modifiées (taille ou mtime différents) sont relues.
+
+    Args:
+        image_dir (str): Dossier des images
+        cache_dir (str, optional): Dossier du cache (False pour désactiver)
+        num_workers (int, optional): Processus de lecture (tous les cœurs par défaut)
+        verify (bool): Vérifier aussi l'intégrité de chaque fichier (plus lent)
+        chunksize (int): Images envoyées à la fois à chaque processus
+
+    Returns:
+        dict: Tableaux 'file_size', 'mtime', 'width', 'height', 'format', 'mode'
+            (codes dans 'formats' et 'modes'), 'paths', 'errors' {index: message}
+            et 'reused' (nombre d'images reprises du cache)
+    """
+    image_dir = Path(image_dir)
+    paths, sizes, mtimes = scan_images(image_dir)
+    count = len(paths)
+    profile = {
+        'paths': paths,
+        'file_size': sizes,
+        'mtime': mtimes,
+        'width': np.zeros(count, dtype=np.int32),
+        'height': np.zeros(count, dtype=np.int32),
+        'format': np.zeros(count, dtype=np.int16),
+        'mode': np.zeros(count, dtype=np.int16),
+        'formats': [''],
+        'modes': [''],
+        'errors': {},
+        'verified': verify,
     }
-    
-    # Parcourir les images
-    for img_name in os.listdir(image_dir):
-        if img_name.endswith(('.jpg', '.jpeg', '.png')):
-            stats["total_images"] += 1
-            img_id = os.path.splitext(img_name)[0]
-            
-            # Vérifier la taille de l'image
-            img_path = image_dir / img_name
-            with Image.open(img_path) as img:
-                stats["image_sizes"].append(img.size)
-            
-            # Par défaut, considérer comme mauvaise grappe
-            stats["annotations"][img_id] = {"is_good": False}
-            stats["bad_grapes"] += 1
-    
-    # Sauvegarder les annotations
-    output_file = annotation_dir / "grape_annotations.json"
-    with open(output_file, 'w') as f:
-        json.dump(stats["annotations"], f, indent=2)
-    
-    # Afficher les statistiques
+
+    cache_file = None
+    cache_stale = True
+    todo = np.ones(count, dtype=bool)
+    if cache_dir is not False:
+        cache_file = Path(cache_dir or image_dir / '.cache') / f"profile-{_file_key(image_dir)}.npz"
+        cached = _load_profile_cache(cache_file) if cache_file.exists() else None
+        # Un cache non vérifié ne suffit pas pour une analyse avec vérification
+        if cached is not None and (bool(cached['verified']) or not verify):
+            profile['formats'], profile['modes'] = cached['formats'], cached['modes']
+            position = {path: i for i, path in enumerate(cached['paths'])}
+            current = np.array([position.get(path, -1) for path in paths], dtype=np.int64)
+            known = current >= 0
+            source = current[known]
+            unchanged = known.copy()
+            unchanged[known] = (cached['mtime'][source] == mtimes[known]) & (cached['file_size'][source] == sizes[known])
+            source = current[unchanged]
+            for key in ('width', 'height', 'format', 'mode'):
+                profile[key][unchanged] = cached[key][source]
+            for i in np.flatnonzero(unchanged):
+                if int(current[i]) in cached['errors']:
+                    profile['errors'][int(i)] = cached['errors'][int(current[i])]
+            todo = ~unchanged
+            # Images supprimées depuis le dernier passage : le cache est à réécrire aussi
+            cache_stale = len(cached['paths']) != int(unchanged.sum())
+    profile['reused'] = int(count - todo.sum())
+
+    format_codes = {name: i for i, name in enumerate(profile['formats'])}
+    mode_codes = {name: i for i, name in enumerate(profile['modes'])}
+    indices = np.flatnonzero(todo)
+    if len(indices):
+        jobs = ((str(image_dir / paths[i]), verify) for i in indices)
+        with Pool(num_workers) as pool:
+            for n, (i, (width, height, fmt, mode, error)) in enumerate(
+                    zip(indices, pool.imap(read_header, jobs, chunksize=chunksize))):
+                profile['width'][i], profile['height'][i] = width, height
+                profile['format'][i] = format_codes.setdefault(fmt, len(format_codes))
+                profile['mode'][i] = mode_codes.setdefault(mode, len(mode_codes))
+                if error is not None:
+                    profile['errors'][int(i)] = error
+                if (n + 1) % 100000 == 0:
+                    print(f"En-têtes: {n + 1}/{len(indices)} images lues")
+        profile['formats'] = list(format_codes)
+        profile['modes'] = list(mode_codes)
+
+    if cache_file is not None and (cache_stale or len(indices)):
+        _save_profile_cache(cache_file, profile)
+    return profile
+
+def _percentiles(values, qs=(0, 5, 50, 95, 100)):
+    if not len(values):
+        return {}
+    return {f"p{q}": float(v) for q, v in zip(qs, np.percentile(values, qs))}
+
+def _counts(codes, names, valid):
+    counts = np.bincount(codes[valid], minlength=len(names))
+    return {name: int(n) for name, n in zip(names, counts) if n}
+
+def summarize_profile(profile, top_sizes=10):
+    """
+    Agrégats du profil : formats, modes, dimensions, tailles de fichiers et fichiers illisibles.
+
+    Returns:
+        dict: Résumé sérialisable en JSON
+    """
+    count = len(profile['paths'])
+    valid = np.ones(count, dtype=bool)
+    valid[list(profile['errors'])] = False
+    width, height = profile['width'][valid], profile['height'][valid]
+    min_side = np.minimum(width, height)
+
+    # Dimensions les plus fréquentes (largeur et hauteur codées dans un seul entier)
+    packed = width.astype(np.int64) << 32 | height.astype(np.int64)
+    sizes, size_counts = np.unique(packed, return_counts=True)
+    top = np.argsort(-size_counts, kind='stable')[:top_sizes]
+    min_side_counts, _ = np.histogram(min_side, bins=MIN_SIDE_BINS)
+    size_bins = 2.0 ** np.arange(10, 31)
+    file_size_counts, _ = np.histogram(profile['file_size'], bins=np.concatenate([[0], size_bins]))
+
+    return {
+        'num_images': count,
+        'num_corrupt': len(profile['errors']),
+        'total_mb': float(profile['file_size'].sum()) / 2 ** 20,
+        'formats': _counts(profile['format'], profile['formats'], valid),
+        'modes': _counts(profile['mode'], profile['modes'], valid),
+        'width': _percentiles(width),
+        'height': _percentiles(height),
+        'aspect_ratio': _percentiles(width / np.maximum(height, 1)),
+        'common_sizes': [{'size': [int(sizes[i] >> 32), int(sizes[i] & 0xFFFFFFFF)], 'count': int(size_counts[i])}
+                         for i in top],
+        'min_side_histogram': {f"{lo}-{hi}": int(n) for lo, hi, n in
+                               zip(MIN_SIDE_BINS[:-1], MIN_SIDE_BINS[1:], min_side_counts)},
+        # Images agrandies par le Resize(256) de l'inférence
+        'smaller_than_256': int((min_side < 256).sum()),
+        'file_size_kb': {k: v / 1024 for k, v in _percentiles(profile['file_size']).items()},
+        'file_size_histogram': {f"<{int(hi) >> 10} Ko": int(n) for hi, n in zip(size_bins, file_size_counts) if n},
+        'corrupt': [{'path': profile['paths'][i], 'error': error} for i, error in sorted(profile['errors'].items())],
+    }
+
+def join_annotations(profile, annotation_dir):
+    """
+    Croise le profil avec les splits d'annotations (mimc_<split>_images.json).
+
+    Returns:
+        dict: Par split, images annotées, absentes du disque, illisibles, sans catégorie et
+            effectif de chaque classe ; plus le nombre d'images du disque dans aucun split
+    """
+    from .predict import CLASS_NAMES
+
+    position = {path: i for i, path in enumerate(profile['paths'])}
+    in_split = np.zeros(len(profile['paths']), dtype=bool)
+    splits = {}
+    for annotation_file in sorted(Path(annotation_dir).glob('mimc_*_images.json')):
+        split = annotation_file.stem[len('mimc_'):-len('_images')]
+        with open(annotation_file, 'r') as f:
+            annotations = json.load(f)
+        # Première catégorie de chaque image, comme dataset.build_image_table
+        first_category = {}
+        for ann in annotations.get('annotations', []):
+            first_category.setdefault(ann['image_id'], ann['category_id'])
+
+        classes = Counter()
+        missing, corrupt, unlabeled = [], 0, 0
+        for img_info in annotations.get('images', []):
+            i = position.get(img_info['file_name'])
+            if i is None:
+                missing.append(img_info['file_name'])
+                continue
+            in_split[i] = True
+            if i in profile['errors']:
+                corrupt += 1
+                continue
+            category = first_category.get(img_info['id'])
+            if category is None:
+                unlabeled += 1
+            else:
+                classes[CLASS_NAMES.get(category - 1, f"Label {category - 1}")] += 1
+        splits[split] = {
+            'annotated': len(annotations.get('images', [])),
+            'missing': len(missing),
+            'missing_examples': missing[:10],
+            'corrupt': corrupt,
+            'unlabeled': unlabeled,
+            'classes': dict(sorted(classes.items())),
+        }
+    return {'splits': splits, 'not_in_any_split': int((~in_split).sum())}
+
+def plot_size_distribution(profile, output_file):
+    """Histogramme 2D largeur x hauteur (échelles log), lisible même avec des millions d'images."""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import LogNorm
+    except ImportError:
+        print("matplotlib absent : graphique ignoré")
+        return
+
+    valid = profile['width'] > 0
+    width, height = profile['width'][valid], profile['height'][valid]
+    if not len(width):
+        return
+    bins = np.geomspace(16, max(int(width.max()), int(height.max()), 32) + 1, 60)
+    counts, x_edges, y_edges = np.histogram2d(width, height, bins=bins)
+    plt.figure(figsize=(10, 5))
+    plt.pcolormesh(x_edges, y_edges, counts.T, norm=LogNorm(vmin=1), cmap='viridis')
+    plt.colorbar(label="Images")
+    plt.xscale('log')
+    plt.yscale('log')
+    plt.title("Distribution des tailles d'images")
+    plt.xlabel("Largeur (pixels)")
+    plt.ylabel("Hauteur (pixels)")
+    plt.savefig(output_file)
+    plt.close()
+
+def analyze_dataset(image_dir=None, annotation_dir=None, cache_dir=None, num_workers=None, verify=False,
+                    output_file=None, plot_file="image_sizes_distribution.png"):
+    """
+    Profile le dataset : en-têtes des images, agrégats et croisement avec les annotations.
+
+    Args:
+        image_dir (str, optional): Dossier des images (usable_images par défaut)
+        annotation_dir (str, optional): Dossier des annotations (annotations par défaut)
+        cache_dir (str, optional): Dossier du cache par image (False pour désactiver)
+        num_workers (int, optional): Processus de lecture des en-têtes
+        verify (bool): Vérifier l'intégrité complète des fichiers
+        output_file (str, optional): Rapport JSON à écrire
+        plot_file (str, optional): Graphique des tailles d'images (None pour ne pas le tracer)
+
+    Returns:
+        dict: Rapport complet
+    """
+    base_dir = Path(__file__).parent.parent.parent.parent
+    image_dir = Path(image_dir or base_dir / "usable_images")
+    annotation_dir = Path(annotation_dir or base_dir / "annotations")
+
+    profile = profile_images(image_dir, cache_dir, num_workers, verify)
+    report = {'summary': summarize_profile(profile)}
+    if annotation_dir.exists():
+        report['annotations'] = join_annotations(profile, annotation_dir)
+
+    summary = report['summary']
     print("\nStatistiques du dataset:")
-    print(f"Nombre total d'images: {stats['total_images']}")
-    print(f"Grappes bonnes: {stats['good_grapes']}")
-    print(f"Grappes mauvaises: {stats['bad_grapes']}")
-    
-    # Afficher la distribution des tailles d'images
-    if stats["image_sizes"]:
-        widths, heights = zip(*stats["image_sizes"])
-        plt.figure(figsize=(10, 5))
-        plt.scatter(widths, heights, alpha=0.5)
-        plt.title("Distribution des tailles d'images")
-        plt.xlabel("Largeur (pixels)")
-        plt.ylabel("Hauteur (pixels)")
-        plt.savefig("image_sizes_distribution.png")
-        plt.close()
+    print(f"Nombre total d'images: {summary['num_images']} ({summary['total_mb']:.0f} Mo, "
+          f"{profile['reused']} reprises du cache)")
+    print(f"Fichiers illisibles: {summary['num_corrupt']}")
+    for entry in summary['corrupt'][:10]:
+        print(f"  {entry['path']}: {entry['error']}")
+    print(f"Formats: {summary['formats']}, modes: {summary['modes']}")
+    if summary['width']:
+        print(f"Largeur médiane: {summary['width']['p50']:.0f} px, hauteur médiane: {summary['height']['p50']:.0f} px")
+        print(f"Plus petit côté < 256 px (agrandies à l'inférence): {summary['smaller_than_256']}")
+        print("Tailles les plus fréquentes: " + ", ".join(
+            f"{w}x{h} ({entry['count']})" for entry in summary['common_sizes'][:5] for w, h in [entry['size']]))
+    for split, entry in report.get('annotations', {}).get('splits', {}).items():
+        print(f"Split {split}: {entry['annotated']} images annotées, {entry['missing']} absentes, "
+              f"{entry['corrupt']} illisibles, {entry['unlabeled']} sans catégorie")
+        for name, n in entry['classes'].items():
+            print(f"  {name}: {n}")
+    if 'annotations' in report:
+        print(f"Images dans aucun split: {report['annotations']['not_in_any_split']}")
+
+    if output_file:
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if plot_file:
+        plot_size_distribution(profile, plot_file)
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Profil du dataset (en-têtes d'images et annotations)")
+    parser.add_argument('--image-dir', default=None, help="Dossier des images (usable_images par défaut)")
+    parser.add_argument('--annotation-dir', default=None, help="Dossier des annotations")
+    parser.add_argument('--cache-dir', default=None, help="Dossier du cache par image (défaut: <images>/.cache)")
+    parser.add_argument('--no-cache', action='store_true', help="Relire toutes les images")
+    parser.add_argument('--workers', type=int, default=None, help="Processus de lecture (défaut: tous les cœurs)")
+    parser.add_argument('--verify', action='store_true', help="Vérifier l'intégrité complète des fichiers")
+    parser.add_argument('--output', default=None, help="Rapport JSON à écrire")
+    parser.add_argument('--plot', default="image_sizes_distribution.png",
+                        help="Graphique des tailles d'images ('' pour ne pas le tracer)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    analyze_dataset(args.image_dir, args.annotation_dir, False if args.no_cache else args.cache_dir,
+                    args.workers, args.verify, args.output, args.plot or None)
 
 if __name__ == "__main__":
-    analyze_dataset() 
\ No newline at end of file
+    main()
@@ -0,0 +1,121 @@
+import torch
+
+from .cascade import CascadeModel
+from .model import load_model
+from .prediction_cache import checkpoint_identity
+
+# Artefacts produits par défaut pour chaque backend
+DEFAULT_PATHS = {
+    'eager': "grape_classifier.pth",
+    'quantized': "grape_classifier_int8.pt",
+    'onnx': "grape_classifier.onnx",
+    'cascade': "cascade.json",
+}
+
+class EagerBackend:
+    """Inférence PyTorch classique en float32."""
+
+    name = 'eager'
+
+    def __init__(self, model):
+        self.model = model.eval()
+
+    @classmethod
+    def load(cls, path):
+        return cls(load_model(path))
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(batch)
+
+class QuantizedBackend:
+    """Inférence sur le modèle INT8 exporté en TorchScript."""
+
+    name = 'quantized'
+
+    def __init__(self, module):
+        self.module = module.eval()
+
+    @classmethod
+    def load(cls, path):
+        if 'x86' in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = 'x86'
+        return cls(torch.jit.load(path, map_location='cpu'))
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.module(batch.contiguous())
+
+class OnnxBackend:
+    """Inférence avec ONNX Runtime sur CPU."""
+
+    name = 'onnx'
+
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    @classmethod
+    def load(cls, path, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "Le backend 'onnx' nécessite onnxruntime (pip install onnxruntime)"
+            ) from e
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        session = ort.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+        return cls(session)
+
+    def __call__(self, batch):
+        outputs = self.session.run(None, {self.input_name: batch.contiguous().numpy()})
+        return torch.from_numpy(outputs[0])
+
+BACKENDS = {
+    'eager': EagerBackend,
+    'quantized': QuantizedBackend,
+    'onnx': OnnxBackend,
+    # Petit modèle puis ResNet50 sur les images incertaines (python -m app.ml.cascade)
+    'cascade': CascadeModel,
+}
+
+def load_backend(backend='eager', path=None):
+    """
+    Charge un backend d'inférence utilisable partout où un modèle est attendu.
+
+    Chaque backend est un appelable qui prend un batch prétraité (N, 3, 224, 224)
+    et renvoie les logits (N, num_classes).
+
+    Args:
+        backend (str): 'eager', 'quantized', 'onnx' ou 'cascade'
+        path (str, optional): Artefact à charger (chemin par défaut du backend sinon)
+
+    Returns:
+        Le backend prêt à l'emploi
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend inconnu: {backend} (choix: {', '.join(BACKENDS)})")
+    return BACKENDS[backend].load(path or DEFAULT_PATHS[backend])
+
+def backend_identity(backend='eager', path=None):
+    """
+    Identité du modèle servi par un backend, pour le cache des prédictions.
+
+    Empreinte de l'artefact, sauf pour la cascade dont le fichier ne fait que
+    désigner les modèles (voir CascadeModel.identity).
+
+    Args:
+        backend (str): 'eager', 'quantized', 'onnx' ou 'cascade'
+        path (str, optional): Artefact chargé (chemin par défaut du backend sinon)
+
+    Returns:
+        str: Empreinte hexadécimale
+    """
+    path = path or DEFAULT_PATHS[backend]
+    backend_class = BACKENDS[backend]
+    if hasattr(backend_class, 'identity'):
+        return backend_class.identity(path)
+    return checkpoint_identity(path)
@@ -0,0 +1,577 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Code exécuté dans un interpréteur neuf pour mesurer un vrai démarrage à froid
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import torch
+t_torch = time.perf_counter()
+from app.ml.model import load_model
+t_import = time.perf_counter()
+model = load_model(sys.argv[1], mmap=sys.argv[2] == '1')
+t_load = time.perf_counter()
+with torch.no_grad():
+    model(torch.zeros(1, 3, 224, 224))
+t_first = time.perf_counter()
+print(json.dumps({
+    'import_torch_s': t_torch - start,
+    'import_app_s': t_import - t_torch,
+    'load_model_s': t_load - t_import,
+    'first_inference_s': t_first - t_load,
+    'total_s': t_first - start,
+    'torchvision_loaded': 'torchvision' in sys.modules,
+}))
+"""
+
+def measure_startup(model_path, repeats=3, mmap=True):
+    """
+    Mesure le temps de démarrage à froid (imports + chargement + première inférence).
+
+    Chaque mesure est faite dans un nouveau processus Python.
+
+    Args:
+        model_path (str): Chemin vers le checkpoint
+        repeats (int): Nombre de démarrages mesurés
+        mmap (bool): Charger le checkpoint avec memory-mapping
+
+    Returns:
+        dict: Meilleure mesure et liste de toutes les mesures
+    """
+    backend_dir = Path(__file__).parent.parent.parent
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, '-c', _STARTUP_SCRIPT, str(Path(model_path).resolve()), '1' if mmap else '0'],
+            cwd=backend_dir, capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run['total_s'])
+    return {'best': best, 'runs': runs}
+
+# Décodage + Resize(256) d'une image, mesuré dans un processus neuf (pic mémoire isolé)
+_DECODE_SCRIPT = """
+import json, resource, sys, time
+from PIL import Image
+from app.ml.decode import decode_image
+path, reduced, repeats = sys.argv[1], sys.argv[2] == '1', int(sys.argv[3])
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+times = []
+for _ in range(repeats):
+    start = time.perf_counter()
+    image = decode_image(path, 256 if reduced else None)
+    width, height = image.size
+    scale = 256 / min(width, height)
+    image = image.resize((round(width * scale), round(height * scale)), Image.BILINEAR)
+    times.append(time.perf_counter() - start)
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'ms': 1000 * min(times), 'peak_mb': (peak - baseline) / 1024}))
+"""
+
+def make_synthetic_image(path, width, height, seed=0):
+    """
+    Génère une photo synthétique (dégradés + grappes + bruit) pour les mesures.
+
+    Args:
+        path (str): Fichier à écrire (le format suit l'extension)
+        width (int): Largeur en pixels
+        height (int): Hauteur en pixels
+        seed (int): Graine du bruit
+    """
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[..., 0] = 90 + 60 * np.sin(x / width * 6.0)
+    image[..., 1] = 120 + 50 * np.cos(y / height * 4.0)
+    image[..., 2] = 60 + 40 * np.sin((x + y) / (width + height) * 9.0)
+    # Quelques « baies » sombres pour donner du contenu texturé
+    for _ in range(40):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        radius = rng.uniform(0.01, 0.04) * min(width, height)
+        mask = (x - cx) ** 2 + (y - cy) ** 2 < radius ** 2
+        image[mask] = rng.uniform(30, 120, size=3)
+    image += rng.normal(0, 8, size=image.shape).astype(np.float32)
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).save(path, quality=90)
+
+def benchmark_decode(sizes=((4000, 3000), (8000, 6000)), repeats=3):
+    """
+    Compare décodage complet et décodage JPEG réduit sur de grandes images synthétiques.
+
+    Chaque mesure tourne dans un processus neuf pour isoler le pic mémoire (ru_maxrss).
+
+    Args:
+        sizes (tuple): Dimensions (largeur, hauteur) des images testées
+        repeats (int): Nombre de décodages par mesure (meilleur temps retenu)
+
+    Returns:
+        list: Une entrée par image et par format
+    """
+    backend_dir = Path(__file__).parent.parent.parent
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for width, height in sizes:
+            for extension in ('jpg', 'png'):
+                path = Path(tmp_dir) / f"synthetic_{width}x{height}.{extension}"
+                # Génération dans un processus séparé : ru_maxrss est hérité par les
+                # processus enfants, ce processus doit donc rester léger
+                subprocess.run(
+                    [sys.executable, '-c', 'import sys; from app.ml.benchmark import make_synthetic_image; '
+                     'make_synthetic_image(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))',
+                     str(path), str(width), str(height)],
+                    cwd=backend_dir, check=True
+                )
+                entry = {'image': f"{width}x{height} ({width * height / 1e6:.0f} MP)", 'format': extension}
+                for mode, reduced in (('full', '0'), ('reduced', '1')):
+                    output = subprocess.run(
+                        [sys.executable, '-c', _DECODE_SCRIPT, str(path), reduced, str(repeats)],
+                        cwd=backend_dir, capture_output=True, text=True, check=True
+                    ).stdout
+                    entry[mode] = json.loads(output.strip().splitlines()[-1])
+                results.append(entry)
+    return results
+
+# Classes attribuées aux images synthétiques, à tour de rôle (catégories COCO 1 à 3)
+_NUM_CLASSES = 3
+
+def make_synthetic_dataset(root, num_images=64, size=(640, 480), seed=0):
+    """
+    Crée un petit dataset synthétique au format du projet (images + annotations COCO).
+
+    Args:
+        root (str): Dossier à remplir
+        num_images (int): Nombre d'images par split
+        size (tuple): Dimensions (largeur, hauteur) des images
+        seed (int): Graine de la première image
+
+    Returns:
+        tuple: (dossier des images, dossier des annotations)
+    """
+    image_dir = Path(root) / "images"
+    annotation_dir = Path(root) / "annotations"
+    image_dir.mkdir(parents=True, exist_ok=True)
+    annotation_dir.mkdir(parents=True, exist_ok=True)
+    for split_index, split in enumerate(('train', 'valid')):
+        images, annotations = [], []
+        for i in range(num_images):
+            image_id = split_index * num_images + i
+            file_name = f"{split}_{i:04d}.jpg"
+            make_synthetic_image(image_dir / file_name, *size, seed=seed + image_id)
+            images.append({'id': image_id, 'file_name': file_name})
+            annotations.append({'image_id': image_id, 'category_id': i % _NUM_CLASSES + 1})
+        with open(annotation_dir / f"mimc_{split}_images.json", 'w') as f:
+            json.dump({'images': images, 'annotations': annotations}, f)
+    return image_dir, annotation_dir
+
+def machine_metadata():
+    """Machine, versions et configuration des threads, pour interpréter et comparer les mesures."""
+    import platform
+
+    import numpy
+    import PIL
+    import torch
+
+    from .distributed import available_cpus
+
+    cpu_model = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpu_model = next(line.split(':', 1)[1].strip() for line in f if line.startswith('model name'))
+    except (OSError, StopIteration):
+        pass
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        import torchvision
+        torchvision_version = torchvision.__version__
+    except ImportError:
+        torchvision_version = None
+    return {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'cpu_model': cpu_model,
+        'cpu_count': os.cpu_count(),
+        'available_cpus': available_cpus(),
+        'torch_threads': torch.get_num_threads(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'torchvision': torchvision_version,
+        'numpy': numpy.__version__,
+        'pillow': PIL.__version__,
+        'git_commit': commit,
+    }
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+def benchmark_preprocess(image_paths, batch_size=32):
+    """
+    Débit de décodage + prétraitement (géométrie par image puis normalisation par batch).
+
+    Returns:
+        dict: images_per_s et ms_per_image
+    """
+    import torch
+
+    from .predict import get_inference_transform, load_image
+    from .preprocessing import normalize_batch
+
+    transform = get_inference_transform()
+    start = time.perf_counter()
+    for i in range(0, len(image_paths), batch_size):
+        normalize_batch(torch.stack([transform(load_image(path)) for path in image_paths[i:i + batch_size]]))
+    elapsed = time.perf_counter() - start
+    return {'images_per_s': len(image_paths) / elapsed, 'ms_per_image': 1000 * elapsed / len(image_paths)}
+
+def benchmark_latency(model, image_path, repeats=50, warmup=3):
+    """
+    Latence de predict_image sur une image (décodage compris), en percentiles.
+
+    Returns:
+        dict: mean_ms, p50_ms, p90_ms, p99_ms
+    """
+    from .predict import predict_image
+
+    timings = []
+    for i in range(warmup + repeats):
+        start = time.perf_counter()
+        predict_image(model, image_path)
+        if i >= warmup:
+            timings.append(1000 * (time.perf_counter() - start))
+    timings.sort()
+    return {
+        'mean_ms': sum(timings) / len(timings),
+        'p50_ms': _percentile(timings, 0.50),
+        'p90_ms': _percentile(timings, 0.90),
+        'p99_ms': _percentile(timings, 0.99),
+    }
+
+def benchmark_throughput(model, batch_sizes=(1, 8, 32), thread_counts=None, repeats=3):
+    """
+    Débit de la passe avant pour plusieurs tailles de batch et nombres de threads.
+
+    Args:
+        model (nn.Module): Modèle en mode eval
+        batch_sizes (tuple): Tailles de batch testées
+        thread_counts (tuple, optional): Nombres de threads testés (défaut: 1, moitié, tous)
+        repeats (int): Mesures par configuration (meilleure retenue)
+
+    Returns:
+        dict: {'threads_<n>': {'batch_<b>': {'images_per_s', 'ms_per_batch'}}}
+    """
+    import torch
+
+    from .distributed import available_cpus
+
+    if thread_counts is None:
+        cpus = available_cpus()
+        thread_counts = sorted({1, max(1, cpus // 2), cpus})
+    previous_threads = torch.get_num_threads()
+    results = {}
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            results[f"threads_{threads}"] = entry = {}
+            for batch_size in batch_sizes:
+                generator = torch.Generator().manual_seed(batch_size)
+                inputs = torch.randn(batch_size, 3, 224, 224, generator=generator)
+                inputs = inputs.contiguous(memory_format=torch.channels_last)
+                timings = []
+                with torch.no_grad():
+                    model(inputs)
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        model(inputs)
+                        timings.append(time.perf_counter() - start)
+                best = min(timings)
+                entry[f"batch_{batch_size}"] = {'images_per_s': batch_size / best, 'ms_per_batch': 1000 * best}
+    finally:
+        torch.set_num_threads(previous_threads)
+    return results
+
+def benchmark_dataloader(image_dir, annotation_dir, batch_size=16, num_workers=2):
+    """
+    Débit du DataLoader d'entraînement (create_dataloaders) sur une époque, démarrage des workers compris.
+
+    Returns:
+        dict: images_per_s et first_batch_s
+    """
+    from .dataset import create_dataloaders
+
+    train_loader, _ = create_dataloaders(str(image_dir), str(annotation_dir), batch_size=batch_size,
+                                         num_workers=num_workers)
+    start = time.perf_counter()
+    first_batch = None
+    images = 0
+    for inputs, _ in train_loader:
+        if first_batch is None:
+            first_batch = time.perf_counter() - start
+        images += inputs.shape[0]
+    elapsed = time.perf_counter() - start
+    return {'images_per_s': images / elapsed, 'first_batch_s': first_batch, 'num_workers': num_workers}
+
+def benchmark_training(arch='resnet50', batch_size=16, steps=5, amp=False):
+    """
+    Pas d'entraînement par seconde (avant + arrière + Adam) sur des batchs synthétiques.
+
+    Returns:
+        dict: steps_per_s et images_per_s
+    """
+    import torch
+    import torch.nn as nn
+
+    from .engine import TrainingEngine
+    from .model import GrapeClassifier
+
+    torch.manual_seed(0)
+    model = GrapeClassifier(_NUM_CLASSES, pretrained=False, arch=arch)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    engine = TrainingEngine(model, nn.CrossEntropyLoss(), optimizer, amp=amp, channels_last=True)
+    generator = torch.Generator().manual_seed(0)
+    batches = [(torch.randn(batch_size, 3, 224, 224, generator=generator),
+                torch.randint(0, _NUM_CLASSES, (batch_size,), generator=generator))
+               for _ in range(steps)]
+    # Premier pas à part : allocations et initialisation de l'optimiseur
+    engine.train_epoch(batches[:1])
+    stats = engine.train_epoch(batches)
+    return {'steps_per_s': stats['images_per_s'] / batch_size, 'images_per_s': stats['images_per_s']}
+
+def run_suite(model_path=None, arch='resnet50', quick=False, num_workers=2):
+    """
+    Lance toutes les mesures sur des données synthétiques (ni dataset ni réseau).
+
+    Args:
+        model_path (str, optional): Checkpoint à mesurer (défaut: modèle initialisé
+            aléatoirement avec une graine fixe, les poids ne changent pas les temps)
+        arch (str): Architecture du modèle synthétique et de l'entraînement
+        quick (bool): Moins d'images, de répétitions et de configurations
+        num_workers (int): Workers du DataLoader mesuré
+
+    Returns:
+        dict: 'metadata', 'config' et 'results'
+    """
+    import torch
+
+    from .model import GrapeClassifier, load_model
+
+    config = {
+        'arch': arch,
+        'quick': quick,
+        'num_images': 16 if quick else 64,
+        'image_size': [640, 480],
+        'batch_sizes': [1, 8] if quick else [1, 8, 32],
+        'latency_repeats': 10 if quick else 50,
+        'startup_repeats': 1 if quick else 3,
+        'training_batch_size': 8 if quick else 16,
+        'training_steps': 2 if quick else 5,
+        'num_workers': num_workers,
+    }
+    report = {'metadata': machine_metadata(), 'config': config, 'results': {}}
+    results = report['results']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print("Génération des images synthétiques...")
+        image_dir, annotation_dir = make_synthetic_dataset(tmp_dir, config['num_images'],
+                                                           tuple(config['image_size']))
+        config['model'] = str(model_path) if model_path else f"synthetic:{arch}"
+        if model_path is None:
+            torch.manual_seed(0)
+            model_path = Path(tmp_dir) / "model.pth"
+            GrapeClassifier(_NUM_CLASSES, pretrained=False, arch=arch).save_model(model_path)
+
+        print("Démarrage à froid...")
+        results['startup'] = measure_startup(model_path, config['startup_repeats'])['best']
+        model = load_model(model_path)
+
+        print("Décodage et prétraitement...")
+        image_paths = sorted(str(p) for p in image_dir.glob('*.jpg'))
+        results['preprocess'] = benchmark_preprocess(image_paths)
+
+        print("Latence d'une image...")
+        results['latency'] = benchmark_latency(model, image_paths[0], config['latency_repeats'])
+
+        print("Débit par taille de batch et nombre de threads...")
+        thread_counts = [torch.get_num_threads()] if quick else None
+        results['throughput'] = benchmark_throughput(model, config['batch_sizes'], thread_counts)
+
+        print("DataLoader...")
+        results['dataloader'] = benchmark_dataloader(image_dir, annotation_dir, num_workers=num_workers)
+
+        print("Entraînement...")
+        results['training'] = {
+            precision: benchmark_training(arch, config['training_batch_size'], config['training_steps'],
+                                          amp=precision == 'bf16')
+            for precision in ('fp32', 'bf16')
+        }
+    return report
+
+def _flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def _higher_is_better(metric):
+    """True pour un débit, False pour une durée, None pour une valeur non comparée (compteurs...)."""
+    name = metric.rsplit('.', 1)[-1]
+    if name.endswith('_per_s'):
+        return True
+    if name.endswith('_ms') or name.endswith('_s') or name.startswith('ms_per'):
+        return False
+    return None
+
+def compare_results(baseline, current, tolerance=0.10):
+    """
+    Compare deux rapports et signale les régressions.
+
+    Args:
+        baseline (dict): Rapport de référence (sortie de run_suite)
+        current (dict): Nouveau rapport
+        tolerance (float): Dégradation relative tolérée (0.10 : 10 %)
+
+    Returns:
+        tuple: (lignes de comparaison, différences de machine ou de versions)
+    """
+    old, new = _flatten(baseline['results']), _flatten(current['results'])
+    rows = []
+    for metric in sorted(old.keys() & new.keys()):
+        higher_is_better = _higher_is_better(metric)
+        if higher_is_better is None or not old[metric]:
+            continue
+        change = (new[metric] - old[metric]) / old[metric]
+        # Variation dans le sens « meilleur » positive
+        gain = change if higher_is_better else -change
+        status = 'regression' if gain < -tolerance else 'improvement' if gain > tolerance else 'ok'
+        rows.append({'metric': metric, 'baseline': old[metric], 'current': new[metric],
+                     'change': change, 'status': status})
+    environment = {
+        key: (baseline['metadata'].get(key), current['metadata'].get(key))
+        for key in ('cpu_model', 'available_cpus', 'torch_threads', 'torch', 'python')
+        if baseline['metadata'].get(key) != current['metadata'].get(key)
+    }
+    for key in baseline.get('config', {}).keys() | current.get('config', {}).keys():
+        old, new = baseline.get('config', {}).get(key), current.get('config', {}).get(key)
+        if old != new:
+            environment[f"config.{key}"] = (old, new)
+    return rows, environment
+
+def print_comparison(rows, environment, tolerance):
+    if environment:
+        print("Attention, machines, versions ou configurations différentes :")
+        for key, (old, new) in environment.items():
+            print(f"  {key}: {old} -> {new}")
+    print(f"\n{'Mesure':<48} {'Référence':>11} {'Actuel':>11} {'Écart':>8}")
+    for row in rows:
+        flag = {'regression': '  RÉGRESSION', 'improvement': '  amélioration'}.get(row['status'], '')
+        print(f"{row['metric']:<48} {row['baseline']:>11.2f} {row['current']:>11.2f} {row['change']:>+7.1%}{flag}")
+    regressions = sum(row['status'] == 'regression' for row in rows)
+    print(f"\n{regressions} régression(s) au-delà de {tolerance:.0%}")
+    return regressions
+
+def print_suite(report):
+    results = report['results']
+    startup, latency = results['startup'], results['latency']
+    print(f"\nDémarrage à froid: {startup['total_s']*1000:.0f} ms "
+          f"(chargement {startup['load_model_s']*1000:.0f} ms)")
+    print(f"Décodage + prétraitement: {results['preprocess']['images_per_s']:.1f} images/s")
+    print(f"Latence predict_image: p50 {latency['p50_ms']:.1f} ms, p90 {latency['p90_ms']:.1f} ms, "
+          f"p99 {latency['p99_ms']:.1f} ms")
+    for threads, entries in results['throughput'].items():
+        line = ", ".join(f"{batch.split('_')[1]}: {entry['images_per_s']:.1f}" for batch, entry in entries.items())
+        print(f"Débit ({threads.split('_')[1]} threads), images/s par taille de batch: {line}")
+    print(f"DataLoader ({results['dataloader']['num_workers']} workers): "
+          f"{results['dataloader']['images_per_s']:.1f} images/s")
+    for precision, entry in results['training'].items():
+        print(f"Entraînement {precision}: {entry['steps_per_s']:.2f} pas/s ({entry['images_per_s']:.1f} images/s)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mesures de performance du classificateur de grappes")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    startup = subparsers.add_parser('startup', help="Temps de démarrage à froid du modèle")
+    startup.add_argument('--model', default="grape_classifier.pth", help="Chemin vers le modèle entraîné")
+    startup.add_argument('--repeats', type=int, default=3, help="Nombre de démarrages mesurés")
+    startup.add_argument('--no-mmap', action='store_true', help="Lire le checkpoint sans memory-mapping")
+    startup.add_argument('--output', default=None, help="Fichier JSON où écrire les résultats")
+
+    decode = subparsers.add_parser('decode', help="Décodage complet vs décodage JPEG réduit")
+    decode.add_argument('--repeats', type=int, default=3, help="Nombre de décodages par mesure")
+    decode.add_argument('--output', default=None, help="Fichier JSON où écrire les résultats")
+
+    suite = subparsers.add_parser('suite', help="Toutes les mesures, sur des images synthétiques")
+    suite.add_argument('--model', default=None, help="Checkpoint à mesurer (défaut: modèle synthétique)")
+    suite.add_argument('--arch', default='resnet50', help="Architecture du modèle synthétique et de l'entraînement")
+    suite.add_argument('--quick', action='store_true', help="Version courte (moins de répétitions)")
+    suite.add_argument('--num-workers', type=int, default=2, help="Workers du DataLoader mesuré")
+    suite.add_argument('--output', default=None, help="Fichier JSON où écrire les résultats")
+    suite.add_argument('--baseline', default=None, help="Rapport de référence à comparer")
+    suite.add_argument('--tolerance', type=float, default=0.10, help="Dégradation relative tolérée")
+
+    compare = subparsers.add_parser('compare', help="Compare deux rapports de la suite")
+    compare.add_argument('baseline', help="Rapport de référence")
+    compare.add_argument('current', help="Nouveau rapport")
+    compare.add_argument('--tolerance', type=float, default=0.10, help="Dégradation relative tolérée")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.command == 'startup':
+        results = measure_startup(args.model, args.repeats, mmap=not args.no_mmap)
+        best = results['best']
+        print("\nDémarrage à froid (meilleure mesure):")
+        print(f"Import de torch: {best['import_torch_s']*1000:.0f} ms")
+        print(f"Import de l'application: {best['import_app_s']*1000:.0f} ms")
+        print(f"Chargement du modèle: {best['load_model_s']*1000:.0f} ms")
+        print(f"Première inférence: {best['first_inference_s']*1000:.0f} ms")
+        print(f"Total: {best['total_s']*1000:.0f} ms")
+
+    elif args.command == 'decode':
+        results = benchmark_decode(repeats=args.repeats)
+        print(f"\n{'Image':<22} {'Format':<7} {'Complet':>18} {'Réduit':>18}")
+        for entry in results:
+            full, reduced = entry['full'], entry['reduced']
+            print(f"{entry['image']:<22} {entry['format']:<7} "
+                  f"{full['ms']:>7.1f} ms {full['peak_mb']:>5.0f} Mo "
+                  f"{reduced['ms']:>7.1f} ms {reduced['peak_mb']:>5.0f} Mo")
+
+    elif args.command == 'suite':
+        results = run_suite(args.model, args.arch, args.quick, args.num_workers)
+        print_suite(results)
+
+    elif args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        if print_comparison(*compare_results(baseline, current, args.tolerance), args.tolerance):
+            sys.exit(1)
+        return
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.command == 'suite' and args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if print_comparison(*compare_results(baseline, results, args.tolerance), args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+from array import array
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from .backends import BACKENDS, load_backend
+from .loader_tuning import loader_options, tune_bulk_loader
+from .metrics import enable_metrics, metrics, profile_run
+from .predict import (
+    CLASS_NAMES,
+    format_predictions,
+    get_inference_transform,
+    load_image,
+)
+from .preprocessing import normalize_batch
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def iter_directory(image_dir):
+    """
+    Parcourt récursivement un dossier et renvoie les chemins d'images au fil de l'eau.
+
+    L'ordre de parcours est trié pour être identique d'une exécution à l'autre.
+
+    Args:
+        image_dir (str): Dossier racine à parcourir
+
+    Yields:
+        str: Chemin de chaque image trouvée
+    """
+    for root, dirnames, filenames in os.walk(image_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, filename)
+
+def iter_manifest(manifest_file):
+    """
+    Lit un fichier manifeste (un chemin d'image par ligne).
+
+    Les lignes vides et celles commençant par '#' sont ignorées.
+
+    Args:
+        manifest_file (str): Fichier texte listant les images
+
+    Yields:
+        str: Chemin de chaque image listée
+    """
+    with open(manifest_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+def iter_source(image_dir=None, manifest_file=None):
+    """Chemins d'un dossier (parcours trié) ou d'un manifeste, dans un ordre stable."""
+    if (image_dir is None) == (manifest_file is None):
+        raise ValueError("Il faut fournir soit image_dir, soit manifest_file")
+    if image_dir is not None:
+        return iter_directory(image_dir)
+    return iter_manifest(manifest_file)
+
+def write_path_list(paths, list_file):
+    """
+    Écrit une liste de chemins sur disque, lisible par position sans la charger en mémoire.
+
+    Le fichier contient un chemin par ligne ; list_file + '.offsets' contient la
+    position (int64) du début de chaque ligne, plus la fin du fichier.
+
+    Args:
+        paths (iterable): Chemins, consommés au fil de l'eau
+        list_file (str): Fichier à écrire
+
+    Returns:
+        int: Nombre de chemins écrits
+    """
+    count = 0
+    position = 0
+    offsets = array('q', [0])
+    with open(list_file, 'wb') as f, open(f"{list_file}.offsets", 'wb') as index:
+        for path in paths:
+            data = path.encode('utf-8') + b'\n'
+            f.write(data)
+            position += len(data)
+            offsets.append(position)
+            count += 1
+            if len(offsets) >= 65536:
+                index.write(offsets.tobytes())
+                offsets = array('q')
+        index.write(offsets.tobytes())
+    return count
+
+class ImageListDataset(Dataset):
+    """
+    Images listées dans un fichier écrit par write_path_list, décodées dans les workers du DataLoader.
+
+    Les workers ne reçoivent que le nom du fichier : chacun lit les chemins de ses
+    batchs par position (offsets mappés en mémoire), sans parcourir le dossier ni
+    garder la liste en mémoire. Le DataLoader rend les batchs dans l'ordre de la liste.
+    """
+
+    def __init__(self, list_file, transform=None):
+        """
+        Args:
+            list_file (str): Liste de chemins (voir write_path_list)
+            transform (callable, optional): Géométrie appliquée à chaque image (-> tensor uint8)
+        """
+        self.list_file = str(list_file)
+        self.transform = transform or get_inference_transform()
+        self._file = None
+        self._offsets = None
+        self._length = os.path.getsize(f"{self.list_file}.offsets") // 8 - 1
+
+    def __len__(self):
+        return self._length
+
+    def __getstate__(self):
+        # Fichiers rouverts dans chaque worker
+        state = self.__dict__.copy()
+        state['_file'] = None
+        state['_offsets'] = None
+        return state
+
+    def path(self, idx):
+        if self._file is None:
+            self._file = open(self.list_file, 'rb')
+            self._offsets = np.memmap(f"{self.list_file}.offsets", dtype=np.int64, mode='r')
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        self._file.seek(start)
+        return self._file.read(end - start - 1).decode('utf-8')
+
+    def __getitem__(self, idx):
+        # Étapes chronométrées ici, dans le worker : les durées sont renvoyées avec
+        # l'image et enregistrées dans les métriques du processus principal
+        path = self.path(idx)
+        timings = []
+        try:
+            start = time.perf_counter()
+            image = load_image(path)
+            decoded = time.perf_counter()
+            tensor = self.transform(image)
+            timings = [('decode', decoded - start), ('preprocess', time.perf_counter() - decoded)]
+            return path, tensor, None, timings
+        except Exception as e:
+            return path, None, f"{type(e).__name__}: {e}", timings
+
+def collate_images(items):
+    """
+    Regroupe les éléments décodés en un batch normalisé, en mettant de côté les images illisibles.
+
+    Returns:
+        tuple: (tous les chemins dans l'ordre, tensor des images valides ou None,
+            erreur de chaque chemin ou None, durées (étape, secondes) mesurées dans le worker)
+    """
+    paths = [item[0] for item in items]
+    tensors = [tensor for _, tensor, error, _ in items if error is None]
+    errors = [item[2] for item in items]
+    timings = [timing for item in items for timing in item[3]]
+    batch = None
+    if tensors:
+        start = time.perf_counter()
+        batch = normalize_batch(torch.stack(tensors))
+        timings.append(('normalize', time.perf_counter() - start))
+    return paths, batch, errors, timings
+
+class ResultWriter:
+    """Écrit les résultats au fur et à mesure dans un fichier JSONL ou CSV."""
+
+    def __init__(self, output_file, output_format=None):
+        """
+        Args:
+            output_file (str): Fichier de sortie (ouvert en ajout)
+            output_format (str, optional): 'jsonl' ou 'csv', déduit de l'extension par défaut
+        """
+        self.output_file = Path(output_file)
+        self.output_format = output_format or (
+            'csv' if self.output_file.suffix.lower() == '.csv' else 'jsonl'
+        )
+        self.fieldnames = ['path', 'predicted_class', 'confidence'] + \
+            [CLASS_NAMES[i] for i in sorted(CLASS_NAMES)] + ['error']
+
+    def _iter_recorded_paths(self):
+        with open(self.output_file, 'r', newline='') as f:
+            if self.output_format == 'csv':
+                for row in csv.DictReader(f):
+                    yield row['path']
+            else:
+                for line in f:
+                    try:
+                        yield json.loads(line)['path']
+                    except (ValueError, KeyError):
+                        continue
+
+    def iter_done(self):
+        """
+        Chemins déjà présents dans le fichier de sortie, relus au fil de l'eau (mémoire constante).
+
+        Une dernière ligne incomplète (arrêt brutal pendant l'écriture) est supprimée.
+
+        Yields:
+            str: Chemins déjà traités, dans l'ordre d'écriture
+        """
+        if not self.output_file.exists():
+            return
+        self._truncate_partial_line()
+        yield from self._iter_recorded_paths()
+
+    def load_done(self):
+        """
+        Chemins déjà présents dans le fichier de sortie.
+
+        Returns:
+            set: Chemins déjà traités
+        """
+        return set(self.iter_done())
+
+    def _truncate_partial_line(self):
+        with open(self.output_file, 'rb+') as f:
+            content_end = f.seek(0, os.SEEK_END)
+            position = content_end
+            # Remonter jusqu'au dernier saut de ligne
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                chunk = f.read(step)
+                newline = chunk.rfind(b'\n')
+                if newline != -1:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position != content_end:
+                f.truncate(position)
+
+    def __enter__(self):
+        write_header = not self.output_file.exists() or self.output_file.stat().st_size == 0
+        self._file = open(self.output_file, 'a', newline='')
+        if self.output_format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+            if write_header:
+                self._csv.writeheader()
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+    def write(self, path, result=None, error=None):
+        if self.output_format == 'csv':
+            row = {'path': path, 'error': error or ''}
+            if result is not None:
+                row['predicted_class'] = result['predicted_class']
+                row['confidence'] = result['confidence']
+                row.update(result['all_probabilities'])
+            self._csv.writerow(row)
+        else:
+            record = {'path': path}
+            if result is not None:
+                record.update(result)
+            if error is not None:
+                record['error'] = error
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self._file.flush()
+
+def pending_paths(writer, image_dir=None, manifest_file=None):
+    """
+    Chemins restant à classer après une interruption.
+
+    Les résultats sont écrits dans l'ordre du parcours : si le fichier de sortie
+    reprend exactement le début du parcours, ces chemins sont sautés en relisant
+    les deux en parallèle, sans rien garder en mémoire. Sinon (dossier modifié
+    entre-temps, sortie écrite par une autre version), les chemins déjà traités
+    sont relus dans un ensemble, gardé dans ce processus seulement.
+
+    Args:
+        writer (ResultWriter): Fichier de sortie
+        image_dir (str, optional): Dossier à parcourir récursivement
+        manifest_file (str, optional): Manifeste listant les images
+
+    Returns:
+        tuple: (itérateur des chemins à classer, nombre d'images ignorées)
+    """
+    paths = iter_source(image_dir, manifest_file)
+    skipped = 0
+    for recorded in writer.iter_done():
+        if next(paths, None) != recorded:
+            break
+        skipped += 1
+    else:
+        return paths, skipped
+    done = writer.load_done()
+    return (path for path in iter_source(image_dir, manifest_file) if path not in done), len(done)
+
+def classify_images(model, output_file, image_dir=None, manifest_file=None,
+                    batch_size=32, num_workers=4, output_format=None, resume=True, prefetch_factor=None):
+    """
+    Classifie un grand nombre d'images en écrivant les résultats au fil de l'eau.
+
+    Args:
+        model: Le modèle entraîné
+        output_file (str): Fichier JSONL ou CSV de sortie
+        image_dir (str, optional): Dossier à parcourir récursivement
+        manifest_file (str, optional): Manifeste listant les images
+        batch_size (int): Taille des batchs d'inférence
+        num_workers (int): Nombre de workers de décodage
+        output_format (str, optional): 'jsonl' ou 'csv'
+        resume (bool): Ignorer les images déjà présentes dans le fichier de sortie
+        prefetch_factor (int, optional): Batchs décodés à l'avance par worker
+
+    Returns:
+        dict: Nombre d'images classifiées, en erreur et ignorées
+    """
+    writer = ResultWriter(output_file, output_format)
+    paths, skipped = pending_paths(writer, image_dir, manifest_file) if resume else \
+        (iter_source(image_dir, manifest_file), 0)
+    if skipped:
+        print(f"Reprise: {skipped} images déjà traitées seront ignorées")
+
+    stats = {'classified': 0, 'errors': 0, 'skipped': skipped}
+    with tempfile.TemporaryDirectory(prefix="bulk_predict-") as tmp_dir:
+        # Un seul parcours, dans ce processus ; les workers lisent la liste par position
+        list_file = os.path.join(tmp_dir, "paths.txt")
+        write_path_list(paths, list_file)
+        dataset = ImageListDataset(list_file)
+        # Une seule passe sur les images : pas de workers persistants
+        loader = DataLoader(
+            dataset,
+            batch_size=batch_size,
+            collate_fn=collate_images,
+            **loader_options(num_workers, prefetch_factor, persistent_workers=False)
+        )
+
+        start = time.perf_counter()
+        next_report = 1000
+        with writer:
+            for batch_paths, batch, errors, timings in loader:
+                if metrics.enabled:
+                    for stage, seconds in timings:
+                        metrics.record(stage, seconds)
+                results = iter(())
+                if batch is not None:
+                    with torch.no_grad():
+                        with metrics.stage('forward'):
+                            outputs = model(batch)
+                        with metrics.stage('postprocess'):
+                            probabilities = torch.nn.functional.softmax(outputs.float(), dim=1)
+                            results = iter(format_predictions(probabilities))
+                # Résultats dans l'ordre du parcours : la reprise n'a qu'à compter les lignes
+                for path, error in zip(batch_paths, errors):
+                    if error is None:
+                        writer.write(path, result=next(results))
+                        stats['classified'] += 1
+                    else:
+                        writer.write(path, error=error)
+                        stats['errors'] += 1
+                # Écrire sur disque à chaque batch pour pouvoir reprendre après un arrêt
+                writer.flush()
+
+                processed = stats['classified'] + stats['errors']
+                if processed >= next_report:
+                    elapsed = time.perf_counter() - start
+                    print(f"{processed} images traitées ({processed / elapsed:.1f} images/s)")
+                    next_report += 1000
+
+    return stats
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Classification en masse d'images de grappes de raisin"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input-dir', help="Dossier d'images à parcourir récursivement")
+    source.add_argument('--manifest', help="Fichier listant un chemin d'image par ligne")
+    parser.add_argument('--output', required=True, help="Fichier de résultats (.jsonl ou .csv)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="Format de sortie (déduit de l'extension par défaut)")
+    parser.add_argument('--model', default=None, help="Chemin vers le modèle (artefact par défaut du backend sinon)")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='eager', help="Backend d'inférence")
+    parser.add_argument('--batch-size', type=int, default=32, help="Taille des batchs d'inférence")
+    parser.add_argument('--num-workers', type=int, default=None,
+                        help="Nombre de workers de décodage (défaut: réglage mesuré une fois par machine, "
+                             "voir app.ml.loader_tuning)")
+    parser.add_argument('--retune-loader', action='store_true',
+                        help="Refaire la mesure du réglage du DataLoader sur cette machine")
+    parser.add_argument('--metrics-json', default=None, help="Écrire les latences par étape (decode, preprocess et normalize mesurées "
+                             "dans les workers, forward, postprocess) dans ce fichier JSON")
+    parser.add_argument('--profile-trace', default=None, help="Exécuter sous torch.profiler et écrire la trace dans ce fichier")
+    parser.add_argument('--no-resume', action='store_true', help="Retraiter les images déjà présentes dans la sortie")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("Chargement du modèle...")
+    model = load_backend(args.backend, args.model)
+
+    if args.num_workers is None:
+        # Mesuré sur les premières images à classer, puis mémorisé pour cette machine
+        loader = tune_bulk_loader(args.input_dir, args.manifest, args.batch_size, retune=args.retune_loader)
+    else:
+        loader = loader_options(args.num_workers)
+
+    if args.metrics_json:
+        enable_metrics()
+
+    with profile_run(args.profile_trace) if args.profile_trace else nullcontext():
+        stats = classify_images(
+            model,
+            output_file=args.output,
+            image_dir=args.input_dir,
+            manifest_file=args.manifest,
+            batch_size=args.batch_size,
+            num_workers=loader['num_workers'],
+            output_format=args.format,
+            resume=not args.no_resume,
+            prefetch_factor=loader.get('prefetch_factor')
+        )
+
+    if args.metrics_json:
+        metrics.dump_json(args.metrics_json)
+        for stage, summary in metrics.snapshot().items():
+            print(f"{stage}: p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms, "
+                  f"p99 {summary['p99_ms']:.2f} ms")
+
+    print("\nClassification terminée:")
+    print(f"Images classifiées: {stats['classified']}")
+    print(f"Images en erreur: {stats['errors']}")
+    print(f"Images déjà traitées (ignorées): {stats['skipped']}")
+
+if __name__ == "__main__":
+    main()
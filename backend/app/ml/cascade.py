@@ -0,0 +1,340 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from .dataset import create_datasets
+from .distill import count_macs, measure_latency
+from .metrics import metrics
+from .model import load_model
+from .predict import format_predictions, get_inference_transform, load_image
+from .prediction_cache import as_image_source, checkpoint_identity, read_image_bytes
+from .preprocessing import eval_collate, normalize_batch
+
+class CascadeModel:
+    """
+    Inférence en cascade : un petit modèle classe d'abord chaque image, seules celles
+    dont la probabilité maximale est sous le seuil passent dans le modèle complet.
+
+    S'utilise comme un modèle (batch prétraité -> log-probabilités), ce qui le rend
+    utilisable par le serveur et la classification en masse. predict_images regroupe
+    en plus les images escaladées de plusieurs batchs en batchs complets.
+    """
+
+    name = 'cascade'
+
+    def __init__(self, fast_model, full_model, threshold=0.9):
+        """
+        Args:
+            fast_model: Petit modèle (ex: élève distillé)
+            full_model: Modèle complet (GrapeClassifier ResNet50)
+            threshold (float): Confiance minimale pour garder la réponse du petit modèle
+        """
+        self.fast_model = fast_model.eval()
+        self.full_model = full_model.eval()
+        self.threshold = threshold
+        self._costs = None
+        self._lock = threading.Lock()
+        self.images = 0
+        self.escalated = 0
+        self.fast_seconds = 0.0
+        self.full_seconds = 0.0
+
+    def eval(self):
+        return self
+
+    def _fast(self, batch):
+        start = time.perf_counter()
+        with torch.no_grad(), metrics.stage('forward_fast'):
+            probabilities = F.softmax(self.fast_model(batch).float(), dim=1)
+        with self._lock:
+            self.fast_seconds += time.perf_counter() - start
+            self.images += len(batch)
+        return probabilities
+
+    def _full(self, batch):
+        start = time.perf_counter()
+        with torch.no_grad(), metrics.stage('forward_full'):
+            probabilities = F.softmax(self.full_model(batch).float(), dim=1)
+        with self._lock:
+            self.full_seconds += time.perf_counter() - start
+            self.escalated += len(batch)
+        return probabilities
+
+    def _needs_escalation(self, probabilities):
+        return probabilities.max(dim=1).values < self.threshold
+
+    def __call__(self, batch):
+        """
+        Classe un batch prétraité ; les images incertaines forment un sous-batch
+        envoyé au modèle complet.
+
+        Returns:
+            Tensor: Log-probabilités (N, num_classes) (softmax les ramène aux probabilités)
+        """
+        probabilities = self._fast(batch)
+        escalate = self._needs_escalation(probabilities)
+        if escalate.any():
+            probabilities[escalate] = self._full(batch[escalate])
+        return probabilities.clamp_min(1e-12).log()
+
+    def predict_images(self, inputs, batch_size=16, cache=None):
+        """
+        Même contrat que predict.predict_images, avec regroupement des escalades.
+
+        Les images escaladées sont mises de côté et passées au modèle complet par
+        batchs pleins de batch_size, quel que soit le batch dont elles viennent.
+        Chaque résultat indique en plus si l'image a été escaladée.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size doit être supérieur ou égal à 1")
+
+        inference_transform = get_inference_transform()
+        results = []
+        pending = []
+        escalation = []
+
+        def finish(index, key, result):
+            results[index] = result
+            if cache is not None:
+                cache.put(key, result)
+
+        def run_escalation():
+            batch = torch.stack([tensor for _, _, tensor in escalation])
+            for (index, key, _), result in zip(escalation, format_predictions(self._full(batch))):
+                result['escalated'] = True
+                finish(index, key, result)
+            escalation.clear()
+
+        def run_fast():
+            tensors = []
+            for _, source, _ in pending:
+                with metrics.stage('decode'):
+                    image = load_image(source)
+                with metrics.stage('preprocess'):
+                    tensors.append(inference_transform(image))
+            with metrics.stage('normalize'):
+                batch = normalize_batch(torch.stack(tensors))
+            probabilities = self._fast(batch)
+            escalate = self._needs_escalation(probabilities).tolist()
+            with metrics.stage('postprocess'):
+                fast_results = format_predictions(probabilities)
+            for position, ((index, _, key), result) in enumerate(zip(pending, fast_results)):
+                if escalate[position]:
+                    escalation.append((index, key, batch[position]))
+                    if len(escalation) == batch_size:
+                        run_escalation()
+                else:
+                    result['escalated'] = False
+                    finish(index, key, result)
+            pending.clear()
+
+        for index, image_input in enumerate(inputs):
+            results.append(None)
+            source, key = image_input, None
+            if cache is not None:
+                data = read_image_bytes(image_input)
+                key = cache.key(data)
+                cached = cache.get(key)
+                if cached is not None:
+                    results[index] = cached
+                    continue
+                source = as_image_source(image_input, data)
+            pending.append((index, source, key))
+            if len(pending) == batch_size:
+                run_fast()
+
+        if pending:
+            run_fast()
+        if escalation:
+            run_escalation()
+        return results
+
+    def costs(self):
+        """Coût d'une image (en GMACs) pour chaque modèle, calculé une seule fois."""
+        if self._costs is None:
+            self._costs = {'fast_gmacs': count_macs(self.fast_model), 'full_gmacs': count_macs(self.full_model)}
+        return self._costs
+
+    def stats(self):
+        """Part d'images escaladées et coût moyen par image."""
+        costs = self.costs()
+        fraction = self.escalated / self.images if self.images else 0.0
+        return {
+            'threshold': self.threshold,
+            'images': self.images,
+            'escalated': self.escalated,
+            'escalated_fraction': fraction,
+            'mean_gmacs_per_image': costs['fast_gmacs'] + fraction * costs['full_gmacs'],
+            'full_gmacs_per_image': costs['full_gmacs'],
+            'mean_ms_per_image': 1000 * (self.fast_seconds + self.full_seconds) / self.images if self.images else 0.0,
+        }
+
+    @staticmethod
+    def _read_config(path):
+        path = Path(path)
+        with open(path, 'r') as f:
+            config = json.load(f)
+        # Chemins des modèles relatifs au fichier de configuration
+        return config, path.parent / config['fast_model'], path.parent / config['full_model']
+
+    @classmethod
+    def load(cls, path):
+        """Charge une cascade décrite par un fichier JSON produit par la calibration."""
+        config, fast_path, full_path = cls._read_config(path)
+        return cls(load_model(fast_path), load_model(full_path), config['threshold'])
+
+    @classmethod
+    def identity(cls, path):
+        """
+        Identité de la cascade pour le cache des prédictions.
+
+        Le fichier JSON ne fait que désigner les modèles : l'identité combine les
+        empreintes des deux checkpoints et le seuil, pour qu'un modèle réentraîné
+        ou un seuil recalibré n'utilise pas les prédictions déjà en cache.
+
+        Returns:
+            str: Empreinte hexadécimale
+        """
+        config, fast_path, full_path = cls._read_config(path)
+        digest = hashlib.sha256()
+        digest.update(checkpoint_identity(fast_path).encode())
+        digest.update(checkpoint_identity(full_path).encode())
+        digest.update(repr(float(config['threshold'])).encode())
+        return digest.hexdigest()
+
+def collect_probabilities(model, loader):
+    """Probabilités (N, C) d'un modèle sur tout un loader, et labels (N,)."""
+    probabilities, labels = [], []
+    with torch.no_grad():
+        for inputs, targets in loader:
+            probabilities.append(F.softmax(model(inputs).float(), dim=1))
+            labels.append(torch.as_tensor(targets))
+    return torch.cat(probabilities), torch.cat(labels)
+
+def evaluate_thresholds(fast_probabilities, full_probabilities, labels, thresholds, fast_gmacs, full_gmacs):
+    """
+    Précision, part escaladée et coût moyen de la cascade pour chaque seuil.
+
+    Returns:
+        list: Une entrée par seuil
+    """
+    confidence, fast_predicted = fast_probabilities.max(dim=1)
+    full_correct = full_probabilities.argmax(dim=1) == labels
+    fast_correct = fast_predicted == labels
+    rows = []
+    for threshold in thresholds:
+        escalate = confidence < threshold
+        correct = torch.where(escalate, full_correct, fast_correct)
+        fraction = escalate.float().mean().item()
+        rows.append({
+            'threshold': float(threshold),
+            'accuracy': correct.float().mean().item(),
+            'escalated_fraction': fraction,
+            'mean_gmacs_per_image': fast_gmacs + fraction * full_gmacs,
+        })
+    return rows
+
+def calibrate_threshold(fast_model, full_model, loader, max_accuracy_loss=0.005):
+    """
+    Choisit le seuil le plus bas (le moins d'escalades) dont la perte de précision
+    par rapport au modèle complet seul reste sous max_accuracy_loss.
+
+    Args:
+        fast_model: Petit modèle
+        full_model: Modèle complet
+        loader (DataLoader): Split de validation
+        max_accuracy_loss (float): Perte de précision tolérée (ex: 0.005 = 0,5 point)
+
+    Returns:
+        dict: Seuil choisi, résumé et table complète des seuils testés
+    """
+    fast_model.eval()
+    full_model.eval()
+    fast_probabilities, labels = collect_probabilities(fast_model, loader)
+    full_probabilities, _ = collect_probabilities(full_model, loader)
+    fast_gmacs, full_gmacs = count_macs(fast_model), count_macs(full_model)
+    full_accuracy = (full_probabilities.argmax(dim=1) == labels).float().mean().item()
+
+    # Seuils candidats : chaque confiance observée (coupures exactes) plus une grille fixe
+    confidences = fast_probabilities.max(dim=1).values
+    candidates = sorted(set(confidences.tolist()) | {i / 100 for i in range(30, 101)})
+    candidates.append(1.0 + 1e-6)  # tout escalader : précision du modèle complet
+    rows = evaluate_thresholds(fast_probabilities, full_probabilities, labels, candidates, fast_gmacs, full_gmacs)
+    chosen = next(row for row in rows if full_accuracy - row['accuracy'] <= max_accuracy_loss)
+
+    # Latences mesurées pour traduire le coût en temps
+    fast_ms, full_ms = measure_latency(fast_model, 1), measure_latency(full_model, 1)
+    grid = [row for row in rows if round(row['threshold'], 2) == row['threshold'] and row['threshold'] <= 1.0]
+    return {
+        'threshold': chosen['threshold'],
+        'max_accuracy_loss': max_accuracy_loss,
+        'full_accuracy': full_accuracy,
+        'fast_accuracy': (fast_probabilities.argmax(dim=1) == labels).float().mean().item(),
+        'cascade_accuracy': chosen['accuracy'],
+        'escalated_fraction': chosen['escalated_fraction'],
+        'mean_gmacs_per_image': chosen['mean_gmacs_per_image'],
+        'full_gmacs_per_image': full_gmacs,
+        'fast_latency_ms': fast_ms,
+        'full_latency_ms': full_ms,
+        'mean_latency_ms_per_image': fast_ms + chosen['escalated_fraction'] * full_ms,
+        'thresholds': grid,
+    }
+
+def parse_args(argv=None):
+    base_dir = Path(__file__).parent.parent.parent.parent
+    parser = argparse.ArgumentParser(description="Calibration du seuil de l'inférence en cascade")
+    parser.add_argument('--fast-model', default="grape_classifier_mobilenet_v3_large.pth", help="Petit modèle")
+    parser.add_argument('--full-model', default="grape_classifier.pth", help="Modèle complet")
+    parser.add_argument('--max-accuracy-loss', type=float, default=0.005,
+                        help="Perte de précision tolérée par rapport au modèle complet (0.005 = 0,5 point)")
+    parser.add_argument('--output', default="cascade.json", help="Configuration de cascade écrite")
+    parser.add_argument('--batch-size', type=int, default=32, help="Taille des batchs")
+    parser.add_argument('--image-dir', default=str(base_dir / "usable_images"), help="Dossier des images")
+    parser.add_argument('--annotation-dir', default=str(base_dir / "annotations"), help="Dossier des annotations")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    _, val_dataset = create_datasets(args.image_dir, args.annotation_dir, augment=False)
+    loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False, num_workers=4,
+                        collate_fn=eval_collate)
+    report = calibrate_threshold(load_model(args.fast_model), load_model(args.full_model),
+                                 loader, args.max_accuracy_loss)
+
+    print(f"\n{'Seuil':>6} {'Précision':>10} {'Escaladées':>11} {'GMACs/image':>12}")
+    for row in report['thresholds'][::5]:
+        print(f"{row['threshold']:>6.2f} {row['accuracy'] * 100:>9.2f}% "
+              f"{row['escalated_fraction'] * 100:>10.1f}% {row['mean_gmacs_per_image']:>12.2f}")
+    print(f"\nSeuil retenu: {report['threshold']:.4f}")
+    print(f"Précision: {report['cascade_accuracy'] * 100:.2f}% "
+          f"(modèle complet seul: {report['full_accuracy'] * 100:.2f}%, "
+          f"petit modèle seul: {report['fast_accuracy'] * 100:.2f}%)")
+    print(f"Images escaladées: {report['escalated_fraction'] * 100:.1f}%")
+    print(f"Coût moyen: {report['mean_gmacs_per_image']:.2f} GMACs/image "
+          f"(contre {report['full_gmacs_per_image']:.2f}), "
+          f"~{report['mean_latency_ms_per_image']:.1f} ms/image (contre {report['full_latency_ms']:.1f})")
+
+    output = Path(args.output)
+    # Chemins relatifs au fichier de configuration (comme les relit CascadeModel.load) :
+    # la configuration reste valable si le dossier est déplacé avec les modèles
+    config_dir = output.resolve().parent
+    config = {
+        'fast_model': os.path.relpath(Path(args.fast_model).resolve(), config_dir),
+        'full_model': os.path.relpath(Path(args.full_model).resolve(), config_dir),
+        'threshold': report['threshold'],
+        'calibration': {k: v for k, v in report.items() if k != 'thresholds'},
+    }
+    with open(output, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"Configuration écrite dans {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import os
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+CHECKPOINT_PREFIX = "checkpoint-"
+
+def _snapshot(value):
+    # Copie des tenseurs (poids, états de l'optimiseur) : l'entraînement peut les modifier
+    # pendant que le thread d'écriture sérialise la copie
+    if isinstance(value, torch.Tensor):
+        return value.detach().clone()
+    if isinstance(value, dict):
+        return {k: _snapshot(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_snapshot(v) for v in value)
+    return value
+
+def rng_state():
+    """États des générateurs aléatoires (torch, random, numpy), sérialisables en weights_only."""
+    name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    return {
+        'torch': torch.get_rng_state(),
+        'python': random.getstate(),
+        'numpy': (name, keys.tolist(), position, has_gauss, cached_gaussian),
+    }
+
+def set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    version, internal, gauss = state['python']
+    random.setstate((version, tuple(internal), gauss))
+    name, keys, position, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
+
+def list_checkpoints(directory):
+    """
+    Checkpoints d'entraînement d'un dossier, du plus ancien au plus récent.
+
+    Returns:
+        list: Chemins (Path) ; les fichiers temporaires d'une écriture interrompue sont ignorés
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    # Le numéro de pas est écrit sur 8 chiffres : l'ordre alphabétique est l'ordre chronologique
+    return sorted(p for p in directory.glob(f"{CHECKPOINT_PREFIX}*.pt"))
+
+def latest_checkpoint(directory):
+    checkpoints = list_checkpoints(directory)
+    return checkpoints[-1] if checkpoints else None
+
+def checkpoint_step(path):
+    """Numéro de pas d'un checkpoint, lu dans son nom."""
+    return int(Path(path).stem[len(CHECKPOINT_PREFIX):])
+
+def discard_newer_checkpoints(directory, step):
+    """
+    Met de côté les checkpoints postérieurs à un pas de reprise.
+
+    Après une reprise depuis un checkpoint plus ancien que le dernier, les
+    checkpoints plus récents appartiennent à l'entraînement abandonné : laissés
+    en place, ils seraient repris par --resume (le plus récent) et la rotation
+    supprimerait les nouveaux avant eux. Ils sont renommés en .discarded plutôt
+    que supprimés.
+
+    Args:
+        directory (str): Dossier des checkpoints
+        step (int): Pas d'optimiseur du checkpoint repris
+
+    Returns:
+        list: Chemins mis de côté
+    """
+    discarded = []
+    for path in list_checkpoints(directory):
+        if checkpoint_step(path) > step:
+            target = path.with_name(f"{path.name}.discarded")
+            os.replace(path, target)
+            discarded.append(target)
+    return discarded
+
+def load_training_checkpoint(path):
+    """
+    Lit un checkpoint d'entraînement (sans exécuter de code arbitraire).
+
+    Le fichier contient aussi les clés 'arch', 'num_classes' et 'state_dict' :
+    il se charge directement avec model.load_model pour l'inférence.
+
+    Returns:
+        dict: Poids, état de l'optimiseur, position (époque, batch, pas), générateurs aléatoires
+    """
+    return torch.load(path, map_location='cpu', weights_only=True)
+
+class CheckpointWriter:
+    """
+    Écrit les checkpoints d'entraînement dans un thread séparé.
+
+    save() copie l'état en mémoire (quelques dizaines de ms) puis rend la main ;
+    la sérialisation et l'écriture disque se font en arrière-plan. Chaque fichier
+    est écrit sous un nom temporaire, synchronisé sur le disque puis renommé : un
+    arrêt brutal laisse au pire un fichier .tmp, jamais un checkpoint tronqué.
+    Seuls les keep_last checkpoints les plus récents sont conservés.
+
+    Au plus une écriture attend pendant qu'une autre est en cours : si le disque
+    est plus lent que la fréquence des checkpoints, save() attend la précédente
+    plutôt que d'accumuler des copies en mémoire.
+    """
+
+    def __init__(self, directory, keep_last=3):
+        """
+        Args:
+            directory (str): Dossier des checkpoints
+            keep_last (int): Nombre de checkpoints conservés (0: tous)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.keep_last = keep_last
+        self.error = None
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, state = item
+                self._write(path, state)
+                self._prune()
+            except Exception as e:
+                self.error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, path, state):
+        start = time.perf_counter()
+        tmp_file = path.with_suffix('.tmp')
+        with open(tmp_file, 'wb') as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+        print(f"Checkpoint écrit: {path} ({time.perf_counter() - start:.1f} s en arrière-plan)")
+
+    def _prune(self):
+        if not self.keep_last:
+            return
+        for old in list_checkpoints(self.directory)[:-self.keep_last]:
+            old.unlink(missing_ok=True)
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f"Échec de l'écriture d'un checkpoint: {error}") from error
+
+    def save(self, state, step):
+        """
+        Envoie un état à écrire.
+
+        Args:
+            state (dict): État d'entraînement (tenseurs copiés avant de rendre la main)
+            step (int): Numéro du pas d'optimiseur (nom du fichier)
+
+        Returns:
+            Path: Chemin du checkpoint une fois écrit
+        """
+        self._raise_error()
+        path = self.directory / f"{CHECKPOINT_PREFIX}{step:08d}.pt"
+        self._queue.put((path, _snapshot(state)))
+        return path
+
+    def wait(self):
+        """Attend la fin des écritures en cours."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
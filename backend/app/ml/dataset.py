@@ -1,52 +1,173 @@
 import torch
 from torch.utils.data import Dataset, DataLoader
-from torchvision import transforms
-from PIL import Image
+from torch.utils.data.distributed import DistributedSampler
+import hashlib
 import json
 import os
 from pathlib import Path
 from collections import Counter
+from .decode import INFERENCE_DECODE_SIZE, TRAIN_DECODE_SIZE, decode_image
+from .distributed import ResumableSampler
+from .image_cache import open_image_cache
+from .loader_tuning import loader_options
+from .preprocessing import eval_collate, eval_geometry, train_collate, train_geometry
+
+def _file_hash(path):
+    """Calcule l'empreinte SHA-256 d'un fichier."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _listing_signature(image_dir):
+    """
+    Empreinte des noms de fichiers d'un dossier d'images (récursivement, dossiers cachés exclus).
+
+    Un seul listing par dossier, sans lire la date ou la taille de chaque image : la
+    table ne dépend que de l'existence des fichiers. Contrairement à la date du
+    dossier, l'empreinte change aussi après un ajout ou une suppression dans un
+    sous-dossier.
+    """
+    digest = hashlib.sha256()
+    pending = [Path(image_dir)]
+    while pending:
+        folder = pending.pop()
+        names, subfolders = [], []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                # Type lu dans le listing (d_type) : pas d'appel stat par image
+                if entry.is_dir():
+                    subfolders.append(Path(entry.path))
+                names.append(entry.name)
+        # Parcours trié : même empreinte quel que soit l'ordre du listing
+        pending.extend(sorted(subfolders, reverse=True))
+        digest.update(f"{folder}\n".encode())
+        for name in sorted(names):
+            digest.update(f"{name}\0".encode())
+    return digest.hexdigest()
+
+def build_image_table(image_dir, annotations):
+    """
+    Construit la liste des images disponibles et de leurs labels.
+    
+    Les annotations sont indexées par image_id en un seul passage et l'existence
+    des fichiers est vérifiée avec un seul listing par dossier.
+    
+    Args:
+        image_dir (Path): Dossier contenant les images
+        annotations (dict): Annotations au format COCO
+        
+    Returns:
+        tuple: (noms de fichiers relatifs à image_dir, labels 0-based)
+    """
+    # Première catégorie rencontrée pour chaque image
+    first_category = {}
+    for ann in annotations['annotations']:
+        first_category.setdefault(ann['image_id'], ann['category_id'])
+    
+    # Contenu des dossiers, listé une seule fois chacun
+    listings = {}
+    def is_available(file_name):
+        folder, name = os.path.split(file_name)
+        if folder not in listings:
+            try:
+                listings[folder] = set(os.listdir(image_dir / folder))
+            except FileNotFoundError:
+                listings[folder] = set()
+        return name in listings[folder]
+    
+    file_names = []
+    labels = []
+    for img_info in annotations['images']:
+        if is_available(img_info['file_name']):
+            file_names.append(img_info['file_name'])
+            # Convertir les labels pour qu'ils commencent à 0
+            category = first_category.get(img_info['id'])
+            labels.append((category - 1) if category is not None else 0)
+    return file_names, labels
+
+def load_image_table(image_dir, annotation_file, cache_dir=None):
+    """
+    Charge la table images/labels, en passant par un cache disque.
+    
+    Le cache est indexé par l'empreinte du fichier d'annotations, le chemin du
+    dossier d'images et l'empreinte des noms qu'il contient (ajout ou suppression
+    d'images, sous-dossiers compris), obtenue avec un seul listing par dossier.
+    
+    Args:
+        image_dir (Path): Dossier contenant les images
+        annotation_file (str): Fichier JSON des annotations
+        cache_dir (str, optional): Dossier du cache, False pour désactiver
+        
+    Returns:
+        tuple: (liste des chemins d'images, liste des labels)
+    """
+    image_dir = Path(image_dir)
+    annotation_file = Path(annotation_file)
+    
+    cache_file = None
+    if cache_dir is not False:
+        cache_dir = Path(cache_dir) if cache_dir else annotation_file.parent / '.cache'
+        key = hashlib.sha256()
+        key.update(_file_hash(annotation_file).encode())
+        key.update(str(image_dir.resolve()).encode())
+        key.update(_listing_signature(image_dir).encode())
+        cache_file = cache_dir / f"{annotation_file.stem}-{key.hexdigest()[:16]}.json"
+        
+        if cache_file.exists():
+            with open(cache_file, 'r') as f:
+                table = json.load(f)
+            return [image_dir / name for name in table['file_names']], table['labels']
+    
+    with open(annotation_file, 'r') as f:
+        annotations = json.load(f)
+    file_names, labels = build_image_table(image_dir, annotations)
+    
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({'file_names': file_names, 'labels': labels}, f)
+        os.replace(tmp_file, cache_file)
+    
+    return [image_dir / name for name in file_names], labels
 
 class GrapeDataset(Dataset):
     """Dataset personnalisé pour les images de grappes de raisin."""
     
-    def __init__(self, image_dir, annotation_file, transform=None, split='train'):
+    def __init__(self, image_dir, annotation_file, transform=None, split='train', cache_dir=None,
+                 image_cache_dir=None, decode_size=None):
         """
         Args:
             image_dir (str): Dossier contenant les images
             annotation_file (str): Fichier JSON des annotations
-            transform (callable, optional): Transformations à appliquer aux images
+            transform (callable, optional): Transformation géométrique par image, qui
+                retourne un tensor uint8 (3, 224, 224) ; l'augmentation et la
+                normalisation sont faites par batch (voir preprocessing.BatchCollate)
             split (str): 'train', 'valid' ou 'test'
+            cache_dir (str, optional): Dossier du cache de la table images/labels
+                (par défaut '.cache' à côté du fichier d'annotations, False pour désactiver)
+            image_cache_dir (str, optional): Dossier du cache d'images pré-décodées
+                (construit au premier usage, désactivé par défaut)
+            decode_size (int, optional): Plus petit côté minimal au décodage des JPEG
+                (320 pour 'train', 256 sinon)
         """
         self.image_dir = Path(image_dir)
-        self.transform = transform or transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]
-            )
-        ])
+        if decode_size is None:
+            decode_size = TRAIN_DECODE_SIZE if split == 'train' else INFERENCE_DECODE_SIZE
+        self.decode_size = decode_size
+        self.transform = transform or eval_geometry
         
-        # Charger les annotations
-        with open(annotation_file, 'r') as f:
-            self.annotations = json.load(f)
-            
-        # Créer la liste des images et leurs labels
-        self.images = []
-        self.labels = []
+        # Charger la table images/labels (depuis le cache si les annotations n'ont pas changé)
+        self.images, self.labels = load_image_table(self.image_dir, annotation_file, cache_dir)
         
-        # Parcourir les annotations et extraire les informations nécessaires
-        for img_info in self.annotations['images']:
-            img_path = self.image_dir / img_info['file_name']
-            if img_path.exists():
-                self.images.append(img_path)
-                # Convertir les catégories en indices 0-based
-                categories = [ann['category_id'] for ann in self.annotations['annotations'] 
-                            if ann['image_id'] == img_info['id']]
-                # Convertir les labels pour qu'ils commencent à 0
-                label = (categories[0] - 1) if categories else 0
-                self.labels.append(label)
+        # Cache optionnel des images déjà décodées et réduites
+        self.image_cache = None
+        if image_cache_dir is not None:
+            self.image_cache = open_image_cache(self.images, image_cache_dir)
         
         # Afficher la distribution des labels
         label_counts = Counter(self.labels)
@@ -59,8 +180,12 @@ class GrapeDataset(Dataset):
         
     def __getitem__(self, idx):
         """Retourne une paire (image, label)."""
-        img_path = self.images[idx]
-        image = Image.open(img_path).convert('RGB')
+        if self.image_cache is not None:
+            # Lecture directe dans le fichier mappé, sans décodage JPEG ni copie
+            image = self.image_cache[idx]
+        else:
+            img_path = self.images[idx]
+            image = decode_image(img_path, self.decode_size)
         label = self.labels[idx]
         
         if self.transform:
@@ -68,71 +193,93 @@ class GrapeDataset(Dataset):
             
         return image, label
 
-def create_dataloaders(image_dir, annotation_dir, batch_size=32, train_split=0.8):
+# Géométrie par image pour l'entraînement (recadrage aléatoire) ; retournement,
+# rotation, couleurs et normalisation sont appliqués par batch dans train_collate
+train_transform = train_geometry
+
+# Géométrie déterministe pour la validation : Resize(256) + CenterCrop(224)
+val_transform = eval_geometry
+
+def create_datasets(image_dir, annotation_dir, image_cache_dir=None, augment=True):
     """
-    Crée les dataloaders pour l'entraînement et la validation.
+    Crée les datasets d'entraînement et de validation.
     
     Args:
         image_dir (str): Dossier contenant les images
         annotation_dir (str): Dossier contenant les fichiers d'annotations
-        batch_size (int): Taille des batchs
-        train_split (float): Proportion des données pour l'entraînement
+        image_cache_dir (str, optional): Dossier du cache d'images pré-décodées
+        augment (bool): Appliquer l'augmentation aléatoire au split d'entraînement
+            (sinon les transformations déterministes de validation sont utilisées)
         
     Returns:
-        tuple: (train_loader, val_loader)
+        tuple: (train_dataset, val_dataset)
     """
-    # Transformations pour l'augmentation des données d'entraînement
-    train_transform = transforms.Compose([
-        transforms.RandomResizedCrop(224),
-        transforms.RandomHorizontalFlip(),
-        transforms.RandomRotation(10),
-        transforms.ColorJitter(brightness=0.2, contrast=0.2),
-        transforms.ToTensor(),
-        transforms.Normalize(
-            mean=[0.485, 0.456, 0.406],
-            std=[0.229, 0.224, 0.225]
-        )
-    ])
-    
-    # Transformations pour la validation
-    val_transform = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(
-            mean=[0.485, 0.456, 0.406],
-            std=[0.229, 0.224, 0.225]
-        )
-    ])
-    
-    # Créer les datasets
     train_dataset = GrapeDataset(
         image_dir=image_dir,
         annotation_file=os.path.join(annotation_dir, 'mimc_train_images.json'),
-        transform=train_transform,
-        split='train'
+        transform=train_transform if augment else val_transform,
+        split='train',
+        image_cache_dir=os.path.join(image_cache_dir, 'train') if image_cache_dir else None
     )
     
     val_dataset = GrapeDataset(
         image_dir=image_dir,
         annotation_file=os.path.join(annotation_dir, 'mimc_valid_images.json'),
         transform=val_transform,
-        split='valid'
+        split='valid',
+        image_cache_dir=os.path.join(image_cache_dir, 'valid') if image_cache_dir else None
     )
     
-    # Créer les dataloaders
+    return train_dataset, val_dataset
+
+def create_dataloaders(image_dir, annotation_dir, batch_size=32, train_split=0.8, image_cache_dir=None,
+                       num_workers=4, distributed=False, prefetch_factor=None, persistent_workers=True,
+                       pin_memory=False):
+    """
+    Crée les dataloaders pour l'entraînement et la validation.
+    
+    Args:
+        image_dir (str): Dossier contenant les images
+        annotation_dir (str): Dossier contenant les fichiers d'annotations
+        batch_size (int): Taille des batchs (par processus en mode distribué)
+        train_split (float): Proportion des données pour l'entraînement
+        image_cache_dir (str, optional): Dossier du cache d'images pré-décodées
+        num_workers (int): Nombre de workers de chargement
+        distributed (bool): Répartir les images de validation entre les rangs
+            (l'entraînement l'est toujours par ResumableSampler) ;
+            appeler train_loader.sampler.set_epoch(epoch) à chaque époque
+        prefetch_factor (int, optional): Batchs préparés à l'avance par worker
+        persistent_workers (bool): Garder les workers d'une époque à l'autre
+        pin_memory (bool): Mémoire verrouillée (utile seulement vers un GPU)
+        
+    Returns:
+        tuple: (train_loader, val_loader)
+    """
+    # Créer les datasets
+    train_dataset, val_dataset = create_datasets(image_dir, annotation_dir, image_cache_dir)
+    
+    # Chaque rang ne voit que sa part des images ; l'ordre d'entraînement est reproductible
+    # (graine + époque) pour reprendre un entraînement interrompu
+    train_sampler = ResumableSampler(train_dataset, shuffle=True)
+    val_sampler = DistributedSampler(val_dataset, shuffle=False) if distributed else None
+    
+    # Créer les dataloaders (workers persistants : pas de relance à chaque époque)
+    options = loader_options(num_workers, prefetch_factor, persistent_workers, pin_memory)
     train_loader = DataLoader(
         train_dataset,
         batch_size=batch_size,
-        shuffle=True,
-        num_workers=4
+        sampler=train_sampler,
+        collate_fn=train_collate,
+        **options
     )
     
     val_loader = DataLoader(
         val_dataset,
         batch_size=batch_size,
         shuffle=False,
-        num_workers=4
+        sampler=val_sampler,
+        collate_fn=eval_collate,
+        **options
     )
     
     return train_loader, val_loader 
\ No newline at end of file
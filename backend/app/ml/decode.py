@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from PIL import Image
+
+# Plus petit côté visé au décodage : Resize(256) pour l'inférence, marge pour les
+# recadrages aléatoires de l'entraînement (même borne que le cache d'images)
+INFERENCE_DECODE_SIZE = 256
+TRAIN_DECODE_SIZE = 320
+
+def decode_image(source, min_size=None):
+    """
+    Décode une image en RGB, directement à taille réduite quand c'est possible.
+
+    Pour les JPEG, le mode draft de PIL demande au décodeur une réduction DCT
+    (1/2, 1/4 ou 1/8) : les pixels qui seraient jetés par le redimensionnement
+    ne sont jamais décodés. Le plus petit côté obtenu reste supérieur ou égal à
+    min_size. Les autres formats (PNG...) sont décodés entièrement.
+
+    Args:
+        source: Chemin, fichier uploadé (objet fichier) ou image PIL
+        min_size (int, optional): Plus petit côté minimal souhaité (None: pleine résolution)
+
+    Returns:
+        PIL.Image: Image RGB
+    """
+    if isinstance(source, Image.Image):
+        return source.convert('RGB')
+    if isinstance(source, Path):
+        source = str(source)
+
+    image = Image.open(source)
+    if min_size and image.format == 'JPEG':
+        width, height = image.size
+        scale = min_size / min(width, height)
+        if scale < 1:
+            image.draft('RGB', (int(width * scale + 0.5), int(height * scale + 0.5)))
+    return image.convert('RGB')
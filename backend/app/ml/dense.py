@@ -0,0 +1,377 @@
+import argparse
+import json
+import math
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+
+from .decode import decode_image
+from .model import load_model
+from .predict import CLASS_NAMES
+from .preprocessing import CROP_SIZE, _resize_uint8, normalize_batch, to_uint8_tensor
+
+# Pas de la carte du ResNet : une cellule couvre 32x32 pixels de l'image d'entrée
+CELL_SIZE = 32
+
+# Couleur de chaque classe sur la carte (Non mature, En maturation, Mature)
+CLASS_COLORS = ((80, 200, 60), (240, 170, 30), (130, 30, 140))
+
+def _round_to_cells(pixels):
+    return CELL_SIZE * math.ceil(pixels / CELL_SIZE)
+
+def load_dense_image(source, scale=1.0):
+    """
+    Charge une grande image en tensor uint8 (3, H, W), sans recadrage.
+
+    Args:
+        source: Chemin, fichier uploadé ou image PIL
+        scale (float): Facteur de redimensionnement ; choisir la valeur pour laquelle une
+            grappe occupe environ 224 pixels, comme dans les images d'entraînement
+
+    Returns:
+        Tensor: Image uint8 (3, H, W)
+    """
+    image = to_uint8_tensor(decode_image(source))
+    if scale != 1:
+        height, width = image.shape[1:]
+        return _resize_uint8(image, (round(height * scale), round(width * scale)))
+    return image
+
+class DenseScorer:
+    """
+    Inférence entièrement convolutive d'une grande image.
+
+    Le backbone du ResNet passe une seule fois sur l'image (ou sur chaque tuile) ;
+    la couche fc, réécrite en convolution 1x1 (GrapeClassifier.dense_head), donne
+    les logits de chaque cellule de 32 pixels. La moyenne de ces logits sur une
+    fenêtre de 7x7 cellules approche le classement d'un recadrage de 224 pixels :
+    on obtient ainsi une carte de probabilités au pas de 32 pixels, là où des
+    recadrages indépendants recalculeraient les convolutions de chaque zone
+    commune à plusieurs fenêtres.
+
+    Seule l'étape pooling + fc est exacte. Le champ réceptif du ResNet dépasse
+    largement 224 pixels : les caractéristiques d'une fenêtre voient ici l'image
+    autour d'elle, alors qu'un recadrage ne voit que le padding à zéro de ses
+    bords. Les probabilités diffèrent donc de celles de score_crops, surtout près
+    des bords des fenêtres ; benchmark_dense mesure l'accord et l'écart maximal.
+
+    Les très grandes images sont découpées en tuiles alignées sur les cellules.
+    Chaque tuile est élargie d'une marge (overlap) de contexte dont les cellules
+    sont ensuite jetées : seules les cellules proches du bord d'une tuile, dont le
+    champ réceptif dépasse la marge, diffèrent légèrement du calcul en une passe
+    (l'approximation ci-dessus s'y ajoute).
+    Le pooling des fenêtres est fait après l'assemblage : les fenêtres à cheval
+    sur deux tuiles sont donc bien calculées.
+    """
+
+    def __init__(self, model, window=CROP_SIZE):
+        """
+        Args:
+            model (GrapeClassifier): Modèle ResNet en mode eval
+            window (int): Côté (en pixels) de la zone classée à chaque position
+        """
+        self.model = model.eval()
+        self.head = model.dense_head()
+        self.window = max(1, window // CELL_SIZE)
+
+    @torch.no_grad()
+    def cell_logits(self, image):
+        """
+        Logits de chaque cellule d'une image.
+
+        Args:
+            image (Tensor): Image uint8 (3, H, W)
+
+        Returns:
+            Tensor: Logits (num_classes, ceil(H/32), ceil(W/32))
+        """
+        batch = normalize_batch(image.unsqueeze(0))
+        return self.head(self.model.forward_feature_map(batch))[0]
+
+    @torch.no_grad()
+    def tiled_cell_logits(self, image, tile_size=1024, overlap=64):
+        """
+        Logits des cellules calculés tuile par tuile (mémoire bornée par la taille des tuiles).
+
+        Args:
+            image (Tensor): Image uint8 (3, H, W)
+            tile_size (int): Côté des tuiles, arrondi à un multiple de 32
+            overlap (int): Marge de contexte ajoutée autour de chaque tuile, arrondie
+                à un multiple de 32
+
+        Returns:
+            Tensor: Logits (num_classes, ceil(H/32), ceil(W/32))
+        """
+        height, width = image.shape[1:]
+        tile_size, overlap = _round_to_cells(tile_size), _round_to_cells(overlap)
+        if height <= tile_size and width <= tile_size:
+            return self.cell_logits(image)
+
+        logits = None
+        for top in range(0, height, tile_size):
+            for left in range(0, width, tile_size):
+                outer_top, outer_left = max(0, top - overlap), max(0, left - overlap)
+                tile = image[:, outer_top:min(height, top + tile_size + overlap),
+                             outer_left:min(width, left + tile_size + overlap)]
+                cells = self.cell_logits(tile)
+                if logits is None:
+                    logits = cells.new_empty(cells.shape[0], math.ceil(height / CELL_SIZE),
+                                             math.ceil(width / CELL_SIZE))
+                # Débuts de tuiles alignés sur les cellules : simple copie des cellules centrales
+                rows = math.ceil(min(tile_size, height - top) / CELL_SIZE)
+                cols = math.ceil(min(tile_size, width - left) / CELL_SIZE)
+                row, col = (top - outer_top) // CELL_SIZE, (left - outer_left) // CELL_SIZE
+                logits[:, top // CELL_SIZE:top // CELL_SIZE + rows, left // CELL_SIZE:left // CELL_SIZE + cols] = \
+                    cells[:, row:row + rows, col:col + cols]
+        return logits
+
+    def pool(self, logits):
+        """Probabilités de chaque fenêtre (num_classes, h, w) à partir des logits des cellules."""
+        kernel = (min(self.window, logits.shape[-2]), min(self.window, logits.shape[-1]))
+        return F.softmax(F.avg_pool2d(logits.unsqueeze(0), kernel, stride=1)[0], dim=0)
+
+    def score(self, image, tile_size=None, overlap=64):
+        """
+        Carte de probabilités de maturité d'une image.
+
+        Args:
+            image (Tensor): Image uint8 (3, H, W)
+            tile_size (int, optional): Côté des tuiles (None : une seule passe)
+            overlap (int): Marge de contexte autour de chaque tuile
+
+        Returns:
+            Tensor: Probabilités (num_classes, h, w) ; la position (i, j) correspond à
+                la fenêtre de pixels [32i, 32i + 224) x [32j, 32j + 224)
+        """
+        if tile_size:
+            logits = self.tiled_cell_logits(image, tile_size, overlap)
+        else:
+            logits = self.cell_logits(image)
+        return self.pool(logits)
+
+def score_image(model, source, scale=1.0, tile_size=None, overlap=64):
+    """
+    Charge une image et calcule sa carte de maturité.
+
+    Args:
+        model (GrapeClassifier): Modèle ResNet en mode eval
+        source: Chemin, fichier uploadé ou image PIL
+        scale (float): Redimensionnement appliqué avant l'inférence
+        tile_size (int, optional): Côté des tuiles (None : une seule passe)
+        overlap (int): Marge de contexte autour de chaque tuile
+
+    Returns:
+        dict: Carte de probabilités, pas et taille des fenêtres en pixels de l'image d'origine
+    """
+    image = load_dense_image(source, scale)
+    probabilities = DenseScorer(model).score(image, tile_size, overlap)
+    return {
+        'probabilities': probabilities,
+        'stride': CELL_SIZE / scale,
+        'window': CROP_SIZE / scale,
+        'scale': scale,
+        'image': image,
+    }
+
+def summarize(result):
+    """
+    Résumé d'une carte : part des fenêtres de chaque classe et fenêtre la plus sûre.
+
+    Returns:
+        dict: Une entrée par classe ; les boîtes sont en pixels de l'image d'origine
+    """
+    probabilities = result['probabilities']
+    confidences, classes = probabilities.max(dim=0)
+    width = probabilities.shape[-1]
+    summary = {}
+    for class_id, name in CLASS_NAMES.items():
+        mask = classes == class_id
+        entry = {'fraction': mask.float().mean().item(), 'best_box': None, 'best_confidence': None}
+        if mask.any():
+            position = torch.where(mask, confidences, torch.zeros(())).flatten().argmax().item()
+            row, col = divmod(position, width)
+            top, left = row * result['stride'], col * result['stride']
+            entry['best_box'] = [round(left), round(top), round(left + result['window']),
+                                 round(top + result['window'])]
+            entry['best_confidence'] = confidences[row, col].item()
+        summary[name] = entry
+    return summary
+
+def save_overlay(result, path, opacity=0.5):
+    """
+    Superpose la classe prédite de chaque fenêtre à l'image (au centre de la fenêtre).
+
+    Args:
+        result (dict): Sortie de score_image
+        path (str): Image à écrire
+        opacity (float): Opacité maximale (pondérée par la confiance)
+    """
+    from PIL import Image
+
+    image = result['image'].float()
+    confidences, classes = result['probabilities'].max(dim=0)
+    colors = torch.tensor(CLASS_COLORS, dtype=torch.float32)[classes].permute(2, 0, 1)
+    alpha = (opacity * confidences).unsqueeze(0)
+    # Une cellule de 32 pixels colorée au centre de chaque fenêtre
+    colors = colors.repeat_interleave(CELL_SIZE, 1).repeat_interleave(CELL_SIZE, 2)
+    alpha = alpha.repeat_interleave(CELL_SIZE, 1).repeat_interleave(CELL_SIZE, 2)
+    offset = (CROP_SIZE - CELL_SIZE) // 2
+    height = min(colors.shape[1], image.shape[1] - offset)
+    width = min(colors.shape[2], image.shape[2] - offset)
+    region = image[:, offset:offset + height, offset:offset + width]
+    a = alpha[:, :height, :width]
+    image[:, offset:offset + height, offset:offset + width] = region * (1 - a) + colors[:, :height, :width] * a
+    Image.fromarray(image.round().clamp(0, 255).to(torch.uint8).permute(1, 2, 0).numpy()).save(path)
+
+@torch.no_grad()
+def score_crops(model, image, crop_stride=CELL_SIZE, batch_size=32):
+    """
+    Référence naïve : chaque fenêtre de 224 pixels est recadrée et classée séparément.
+
+    Args:
+        model (GrapeClassifier): Modèle en mode eval
+        image (Tensor): Image uint8 (3, H, W)
+        crop_stride (int): Pas entre deux recadrages
+        batch_size (int): Recadrages par passe avant
+
+    Returns:
+        Tensor: Probabilités (num_classes, h, w)
+    """
+    height, width = image.shape[1:]
+    # Mêmes positions que la carte dense (la dernière fenêtre peut déborder de l'image)
+    rows = range(0, max(1, math.ceil(height / CELL_SIZE) - CROP_SIZE // CELL_SIZE + 1) * CELL_SIZE, crop_stride)
+    cols = range(0, max(1, math.ceil(width / CELL_SIZE) - CROP_SIZE // CELL_SIZE + 1) * CELL_SIZE, crop_stride)
+    positions = [(top, left) for top in rows for left in cols]
+    probabilities = []
+    for start in range(0, len(positions), batch_size):
+        crops = []
+        for top, left in positions[start:start + batch_size]:
+            crop = image[:, top:top + CROP_SIZE, left:left + CROP_SIZE]
+            # Fenêtre qui déborde de l'image : complétée par du noir
+            pad = (0, CROP_SIZE - crop.shape[2], 0, CROP_SIZE - crop.shape[1])
+            crops.append(F.pad(crop, pad) if any(pad) else crop)
+        outputs = model(normalize_batch(torch.stack(crops)))
+        probabilities.append(F.softmax(outputs.float(), dim=1))
+    return torch.cat(probabilities).T.reshape(-1, len(rows), len(cols))
+
+def _best_time(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = fn()
+        timings.append(time.perf_counter() - start)
+    return output, min(timings)
+
+def benchmark_dense(model, image, crop_stride=CELL_SIZE, tile_size=512, overlap=64, batch_size=32, repeats=2):
+    """
+    Compare l'inférence dense (une passe et par tuiles) aux recadrages indépendants.
+
+    Args:
+        model (GrapeClassifier): Modèle ResNet en mode eval
+        image (Tensor): Image uint8 (3, H, W)
+        crop_stride (int): Pas des recadrages naïfs (multiple de 32)
+        tile_size (int): Côté des tuiles du mode par tuiles
+        overlap (int): Marge de contexte des tuiles
+        batch_size (int): Recadrages par passe avant
+        repeats (int): Nombre de mesures (meilleur temps retenu)
+
+    Returns:
+        dict: Temps, nombre de fenêtres et écarts à la référence naïve
+    """
+    if crop_stride % CELL_SIZE:
+        raise ValueError(f"Le pas des recadrages doit être un multiple de {CELL_SIZE}")
+    scorer = DenseScorer(model)
+    step = crop_stride // CELL_SIZE
+    naive, naive_s = _best_time(lambda: score_crops(model, image, crop_stride, batch_size), repeats)
+    report = {
+        'image_size': list(image.shape[1:]),
+        'crop_stride': crop_stride,
+        'threads': torch.get_num_threads(),
+        'naive': {'seconds': naive_s, 'windows': naive[0].numel()},
+    }
+    for name, tiles in (('dense', None), ('dense_tiled', tile_size)):
+        dense, seconds = _best_time(lambda: scorer.score(image, tiles, overlap), repeats)
+        sampled = dense[:, ::step, ::step]
+        report[name] = {
+            'seconds': seconds,
+            'windows': dense[0].numel(),
+            'speedup': naive_s / seconds,
+            'agreement': (sampled.argmax(dim=0) == naive.argmax(dim=0)).float().mean().item(),
+            'max_abs_diff': (sampled - naive).abs().max().item(),
+        }
+    report['dense_tiled']['tile_size'] = tile_size
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Carte de maturité dense d'une grande image (drone, caméra de rang)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    score = subparsers.add_parser('score', help="Carte de probabilités d'une image")
+    score.add_argument('image', help="Image à analyser")
+    score.add_argument('--model', default="grape_classifier.pth", help="Checkpoint ResNet")
+    score.add_argument('--scale', type=float, default=1.0, help="Redimensionnement avant l'inférence")
+    score.add_argument('--tile-size', type=int, default=None, help="Côté des tuiles (défaut: une seule passe)")
+    score.add_argument('--overlap', type=int, default=64, help="Marge de contexte autour des tuiles")
+    score.add_argument('--overlay', default=None, help="Image où dessiner la carte")
+    score.add_argument('--output', default=None, help="Fichier .pt où sauvegarder les probabilités")
+
+    benchmark = subparsers.add_parser('benchmark', help="Inférence dense vs recadrages indépendants")
+    benchmark.add_argument('--model', default="grape_classifier.pth", help="Checkpoint ResNet")
+    benchmark.add_argument('--image', default=None, help="Image de test (défaut: image synthétique)")
+    benchmark.add_argument('--size', type=int, nargs=2, default=(1024, 768), metavar=('W', 'H'),
+                           help="Taille de l'image synthétique")
+    benchmark.add_argument('--crop-stride', type=int, default=CELL_SIZE, help="Pas des recadrages naïfs")
+    benchmark.add_argument('--tile-size', type=int, default=512, help="Côté des tuiles")
+    benchmark.add_argument('--overlap', type=int, default=64, help="Marge de contexte autour des tuiles")
+    benchmark.add_argument('--batch-size', type=int, default=32, help="Recadrages par passe avant")
+    benchmark.add_argument('--output', default=None, help="Fichier JSON où écrire les résultats")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    model = load_model(args.model)
+
+    if args.command == 'score':
+        start = time.perf_counter()
+        result = score_image(model, args.image, args.scale, args.tile_size, args.overlap)
+        elapsed = time.perf_counter() - start
+        height, width = result['probabilities'].shape[1:]
+        print(f"Carte {width}x{height} (pas {result['stride']:.0f} px, fenêtre {result['window']:.0f} px) "
+              f"en {elapsed:.2f} s")
+        for name, entry in summarize(result).items():
+            best = f", meilleure fenêtre {entry['best_box']} ({entry['best_confidence']:.1%})" if entry['best_box'] else ""
+            print(f"{name:<15} {entry['fraction']:>6.1%} des fenêtres{best}")
+        if args.overlay:
+            save_overlay(result, args.overlay)
+            print(f"Carte dessinée: {args.overlay}")
+        if args.output:
+            torch.save({k: v for k, v in result.items() if k != 'image'}, args.output)
+
+    elif args.command == 'benchmark':
+        if args.image:
+            image = load_dense_image(args.image)
+        else:
+            from .benchmark import make_synthetic_image
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = Path(tmp_dir) / "synthetic.jpg"
+                make_synthetic_image(path, *args.size)
+                image = load_dense_image(path)
+        report = benchmark_dense(model, image, args.crop_stride, args.tile_size, args.overlap, args.batch_size)
+        print(f"\nImage {report['image_size'][1]}x{report['image_size'][0]}, "
+              f"recadrages au pas de {report['crop_stride']} px, {report['threads']} threads")
+        print(f"{'Méthode':<14} {'Fenêtres':>9} {'Temps':>9} {'Gain':>6} {'Accord':>8} {'Écart max':>10}")
+        naive = report['naive']
+        print(f"{'recadrages':<14} {naive['windows']:>9} {naive['seconds']:>8.2f}s {'':>6} {'':>8} {'':>10}")
+        for name in ('dense', 'dense_tiled'):
+            entry = report[name]
+            print(f"{name:<14} {entry['windows']:>9} {entry['seconds']:>8.2f}s {entry['speedup']:>5.1f}x "
+                  f"{entry['agreement']:>7.1%} {entry['max_abs_diff']:>10.3f}")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
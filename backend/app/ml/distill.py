@@ -0,0 +1,204 @@
+import json
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
+from torch.utils.data.distributed import DistributedSampler
+
+from .distributed import ResumableSampler
+from .feature_cache import _features_key
+from .loader_tuning import loader_options
+from .preprocessing import eval_collate, train_collate
+
+class IndexedDataset(Dataset):
+    """Retourne (image, position) : la position sert à retrouver label et logits du professeur."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        image, _ = self.dataset[idx]
+        return image, idx
+
+def compute_teacher_logits(teacher, dataset, batch_size=64, num_workers=4):
+    """
+    Passe le professeur une seule fois sur tout le dataset.
+
+    Args:
+        teacher (nn.Module): Modèle professeur
+        dataset (GrapeDataset): Dataset avec des transformations déterministes
+        batch_size (int): Taille des batchs
+        num_workers (int): Nombre de workers du DataLoader
+
+    Returns:
+        Tensor: Logits (N, num_classes), dans l'ordre du dataset
+    """
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                        collate_fn=eval_collate)
+    teacher.eval()
+    logits = []
+    with torch.no_grad():
+        for i, (inputs, _) in enumerate(loader):
+            logits.append(teacher(inputs).float())
+            if (i + 1) % 20 == 0:
+                print(f"Logits du professeur: {(i + 1) * batch_size}/{len(dataset)} images")
+    return torch.cat(logits)
+
+def load_or_compute_teacher_logits(teacher, dataset, cache_dir, source, batch_size=64, num_workers=4):
+    """
+    Charge les logits du professeur depuis le disque, ou les calcule et les sauvegarde.
+
+    Args:
+        teacher (nn.Module): Modèle professeur
+        dataset (GrapeDataset): Dataset avec des transformations déterministes
+        cache_dir (str): Dossier du cache
+        source (str): Identifiant du checkpoint du professeur
+        batch_size (int): Taille des batchs
+        num_workers (int): Nombre de workers du DataLoader
+
+    Returns:
+        Tensor: Logits (N, num_classes)
+    """
+    cache_file = Path(cache_dir) / f"teacher-{_features_key(teacher, dataset, source)}.pt"
+    if cache_file.exists():
+        print(f"Logits du professeur chargés depuis {cache_file}")
+        return torch.load(cache_file, weights_only=True)['logits']
+
+    logits = compute_teacher_logits(teacher, dataset, batch_size, num_workers)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix('.tmp')
+    torch.save({'logits': logits}, tmp_file)
+    tmp_file.replace(cache_file)
+    return logits
+
+class DistillationLoss(nn.Module):
+    """
+    Perte de distillation : KL entre distributions adoucies (température) du
+    professeur et de l'élève, mélangée à l'entropie croisée sur les vrais labels.
+
+    Les cibles reçues sont les positions des images (voir IndexedDataset).
+    """
+
+    def __init__(self, teacher_logits, labels, temperature=4.0, alpha=0.7):
+        """
+        Args:
+            teacher_logits (Tensor): Logits du professeur (N, num_classes)
+            labels (list): Vrais labels (N,)
+            temperature (float): Température d'adoucissement
+            alpha (float): Poids de la perte douce (1 - alpha pour les vrais labels)
+        """
+        super().__init__()
+        self.teacher_logits = teacher_logits
+        self.labels = torch.as_tensor(labels)
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def hard_labels(self, indices):
+        return self.labels[indices]
+
+    def forward(self, student_logits, indices):
+        student_logits = student_logits.float()
+        t = self.temperature
+        soft = F.kl_div(
+            F.log_softmax(student_logits / t, dim=1),
+            F.log_softmax(self.teacher_logits[indices] / t, dim=1),
+            reduction='batchmean', log_target=True
+        ) * (t * t)
+        hard = F.cross_entropy(student_logits, self.labels[indices])
+        return self.alpha * soft + (1 - self.alpha) * hard
+
+def create_distillation_loaders(train_dataset, val_dataset, batch_size=32, num_workers=4, distributed=False,
+                                prefetch_factor=None, persistent_workers=True, pin_memory=False):
+    """
+    Dataloaders de distillation : l'entraînement renvoie les positions des images.
+
+    Les réglages des workers sont ceux de dataset.create_dataloaders.
+
+    Returns:
+        tuple: (train_loader, val_loader)
+    """
+    indexed = IndexedDataset(train_dataset)
+    train_sampler = ResumableSampler(indexed, shuffle=True)
+    val_sampler = DistributedSampler(val_dataset, shuffle=False) if distributed else None
+    options = loader_options(num_workers, prefetch_factor, persistent_workers, pin_memory)
+    train_loader = DataLoader(indexed, batch_size=batch_size, sampler=train_sampler,
+                              collate_fn=train_collate, **options)
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False,
+                            sampler=val_sampler, collate_fn=eval_collate, **options)
+    return train_loader, val_loader
+
+def count_macs(model, image_size=224):
+    """Nombre de multiplications-additions (en milliards) pour une image."""
+    from torch.utils.flop_counter import FlopCounterMode
+
+    counter = FlopCounterMode(display=False)
+    with torch.no_grad(), counter:
+        model(torch.zeros(1, 3, image_size, image_size))
+    return counter.get_total_flops() / 2e9
+
+def measure_latency(model, batch_size, repeats=10, warmup=2, image_size=224):
+    """Latence médiane d'une passe avant (en ms) sur un batch synthétique."""
+    inputs = torch.randn(batch_size, 3, image_size, image_size).contiguous(memory_format=torch.channels_last)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + repeats):
+            start = time.perf_counter()
+            model(inputs)
+            if i >= warmup:
+                timings.append(time.perf_counter() - start)
+    timings.sort()
+    return 1000 * timings[len(timings) // 2]
+
+def evaluate_accuracy(model, loader):
+    correct = 0
+    total = 0
+    with torch.no_grad():
+        for inputs, labels in loader:
+            correct += (model(inputs).argmax(dim=1) == labels).sum().item()
+            total += len(labels)
+    return correct / total if total else 0.0
+
+def compare_models(models, loader, batch_size=32):
+    """
+    Compare précision, coût et latence de plusieurs modèles.
+
+    Args:
+        models (dict): Nom -> modèle (en mode eval)
+        loader (DataLoader): Données de validation
+        batch_size (int): Taille de batch pour la mesure de débit
+
+    Returns:
+        dict: Une entrée par modèle
+    """
+    report = {}
+    for name, model in models.items():
+        model.eval()
+        latency_1 = measure_latency(model, 1)
+        latency_batch = measure_latency(model, batch_size)
+        report[name] = {
+            'arch': getattr(model, 'arch', None),
+            'params_m': sum(p.numel() for p in model.parameters()) / 1e6,
+            'gmacs': count_macs(model),
+            'accuracy': evaluate_accuracy(model, loader),
+            'latency_ms_batch1': latency_1,
+            f'ms_per_image_batch{batch_size}': latency_batch / batch_size,
+            'threads': torch.get_num_threads(),
+        }
+    return report
+
+def print_report(report):
+    print(f"\n{'Modèle':<28} {'Params (M)':>10} {'GMACs':>7} {'Précision':>10} {'Lat. b=1':>10} {'ms/img batch':>13}")
+    for name, entry in report.items():
+        per_image = next(v for k, v in entry.items() if k.startswith('ms_per_image'))
+        print(f"{name:<28} {entry['params_m']:>10.1f} {entry['gmacs']:>7.2f} "
+              f"{entry['accuracy'] * 100:>9.2f}% {entry['latency_ms_batch1']:>8.1f}ms {per_image:>11.1f}ms")
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
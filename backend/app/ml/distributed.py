@@ -0,0 +1,141 @@
+import os
+from contextlib import contextmanager
+
+import torch
+import torch.distributed as dist
+from torch.utils.data.distributed import DistributedSampler
+
+def available_cpus():
+    """Nombre de cœurs utilisables par ce processus (affinité CPU comprise)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def init_distributed(backend='gloo'):
+    """
+    Initialise le groupe de processus à partir des variables posées par torchrun.
+
+    Sans lanceur (WORLD_SIZE absent ou égal à 1), rien n'est initialisé et
+    l'entraînement reste mono-processus.
+
+    Args:
+        backend (str): Backend de communication ('gloo' pour le CPU)
+
+    Returns:
+        bool: True si l'entraînement est distribué
+    """
+    if int(os.environ.get('WORLD_SIZE', '1')) <= 1:
+        return False
+    if not dist.is_initialized():
+        # MASTER_ADDR, MASTER_PORT, RANK et WORLD_SIZE viennent de l'environnement (torchrun)
+        dist.init_process_group(backend=backend, init_method='env://')
+    return True
+
+def cleanup_distributed():
+    """Ferme le groupe de processus s'il a été initialisé."""
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
+
+def get_rank():
+    return dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+
+def get_world_size():
+    return dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+
+def get_local_rank():
+    return int(os.environ.get('LOCAL_RANK', '0'))
+
+def get_local_world_size():
+    """Nombre de processus lancés sur cette machine."""
+    return int(os.environ.get('LOCAL_WORLD_SIZE', '1'))
+
+def is_main_process():
+    """Seul le rang 0 écrit les checkpoints et les journaux."""
+    return get_rank() == 0
+
+def configure_threads(num_workers=0, threads_per_rank=None):
+    """
+    Répartit les cœurs de la machine entre les processus locaux.
+
+    Chaque rang reçoit cores / processus_locaux threads de calcul, moins un cœur
+    pour deux workers de DataLoader (le décodage tourne sur les mêmes cœurs).
+
+    Args:
+        num_workers (int): Workers de DataLoader par rang
+        threads_per_rank (int, optional): Valeur imposée
+
+    Returns:
+        int: Nombre de threads de calcul de ce rang
+    """
+    if threads_per_rank is None:
+        share = available_cpus() // get_local_world_size()
+        threads_per_rank = max(1, share - num_workers // 2)
+    torch.set_num_threads(threads_per_rank)
+    return threads_per_rank
+
+def barrier():
+    if get_world_size() > 1:
+        dist.barrier()
+
+@contextmanager
+def local_main_first():
+    """
+    Exécute le bloc d'abord sur le rang local 0 de chaque machine, puis sur les autres.
+
+    Les caches (table d'images, images pré-décodées, poids ImageNet) sont ainsi
+    construits une seule fois par machine, puis simplement relus par les autres rangs.
+    """
+    if get_local_rank() != 0:
+        barrier()
+    yield
+    if get_local_rank() == 0:
+        barrier()
+
+def all_reduce_sum(tensor):
+    """Somme un tensor sur tous les rangs (sans effet hors distribué)."""
+    if get_world_size() > 1:
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+def broadcast_object(obj):
+    """
+    Envoie un objet Python du rang 0 à tous les rangs (sans effet hors distribué).
+
+    Args:
+        obj: Objet sérialisable (pickle), ignoré sur les autres rangs
+
+    Returns:
+        L'objet du rang 0
+    """
+    if get_world_size() > 1:
+        container = [obj]
+        dist.broadcast_object_list(container, src=0)
+        return container[0]
+    return obj
+
+class ResumableSampler(DistributedSampler):
+    """
+    Mélange reproductible (graine + époque) qui peut reprendre au milieu d'une époque.
+
+    L'ordre d'une époque ne dépend que de la graine et du numéro d'époque : après
+    une reprise, set_start(n) saute les n premières images de l'époque sans les
+    charger. Sans entraînement distribué, le sampler couvre tout le dataset.
+    """
+
+    def __init__(self, dataset, shuffle=True, seed=0):
+        super().__init__(dataset, num_replicas=get_world_size(), rank=get_rank(), shuffle=shuffle, seed=seed)
+        self.start_index = 0
+
+    def set_start(self, start_index):
+        """Images de l'époque courante déjà vues par ce rang (remis à 0 après une itération)."""
+        self.start_index = start_index
+
+    def __iter__(self):
+        indices = list(super().__iter__())[self.start_index:]
+        self.start_index = 0
+        return iter(indices)
+
+    def __len__(self):
+        # Checkpoint écrit sur le dernier batch (incomplet) de l'époque : plus rien à voir
+        return max(0, self.num_samples - self.start_index)
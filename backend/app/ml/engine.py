@@ -0,0 +1,349 @@
+import time
+from contextlib import nullcontext
+
+import torch
+
+from .checkpoint import rng_state, set_rng_state
+from .distributed import all_reduce_sum, get_world_size, is_main_process
+
+class TrainingEngine:
+    """
+    Boucle d'entraînement optimisée pour le CPU.
+
+    Options (toutes désactivées par défaut, ce qui donne la boucle FP32 classique) :
+    autocast bfloat16, format mémoire channels_last, torch.compile et accumulation
+    de gradients. La perte et la précision sont accumulées dans des tenseurs, sans
+    synchronisation à chaque pas ; elles ne sont lues qu'en fin d'époque.
+
+    Chaque pas est découpé en attente des données (DataLoader) et calcul
+    (avant + arrière + optimiseur) pour savoir si l'entraînement est limité
+    par l'entrée ou par le calcul.
+
+    Si un groupe de processus est initialisé (voir distributed.init_distributed),
+    le modèle est enveloppé dans DistributedDataParallel et les statistiques sont
+    agrégées sur tous les rangs ; seul le rang 0 affiche les journaux.
+
+    Avec un checkpoint.CheckpointWriter, l'état complet (poids, optimiseur, position
+    dans l'époque, générateurs aléatoires) est écrit en arrière-plan tous les
+    checkpoint_interval pas et à chaque fin d'époque ; load_state_dict reprend
+    ensuite l'entraînement au batch où il s'était arrêté.
+    """
+
+    def __init__(self, model, criterion, optimizer, amp=False, channels_last=False,
+                 compile=False, accumulation_steps=1, log_interval=0, eval_criterion=None,
+                 checkpointer=None, checkpoint_interval=0):
+        """
+        Args:
+            model (nn.Module): Modèle à entraîner
+            criterion: Fonction de perte ; si elle expose hard_labels(targets), la
+                précision est calculée sur ces labels (distillation)
+            optimizer: Optimiseur
+            amp (bool): Autocast bfloat16 sur CPU
+            channels_last (bool): Poids et entrées au format NHWC
+            compile (bool): Compiler le modèle avec torch.compile
+            accumulation_steps (int): Nombre de batchs accumulés par pas d'optimiseur
+            log_interval (int): Afficher la progression tous les N batchs (0: jamais)
+            eval_criterion (optional): Perte de validation (criterion par défaut)
+            checkpointer (CheckpointWriter, optional): Écriture des checkpoints (rang 0)
+            checkpoint_interval (int): Checkpoint tous les N pas d'optimiseur
+                (0: seulement en fin d'époque)
+        """
+        if accumulation_steps < 1:
+            raise ValueError("accumulation_steps doit être supérieur ou égal à 1")
+        self.model = model
+        self.criterion = criterion
+        self.eval_criterion = eval_criterion or criterion
+        self.optimizer = optimizer
+        self.amp = amp
+        self.channels_last = channels_last
+        self.accumulation_steps = accumulation_steps
+        self.log_interval = log_interval
+        self.checkpointer = checkpointer
+        self.checkpoint_interval = checkpoint_interval
+        self.distributed = get_world_size() > 1
+        # Position dans l'entraînement (restaurée par load_state_dict)
+        self.global_step = 0
+        self.start_epoch = 0
+        self.start_batch = 0
+        self.resume_batch_size = None
+        self.resume_rng = None
+        self.history = []
+        # DDP fige la disposition des gradients à la construction : les batchs arrivant en
+        # channels_last (preprocessing.normalize_batch), les poids doivent l'être aussi
+        if self.distributed:
+            self.channels_last = channels_last = True
+
+        if channels_last:
+            model.to(memory_format=torch.channels_last)
+        self.ddp_module = None
+        module = model
+        if self.distributed:
+            from torch.nn.parallel import DistributedDataParallel
+            module = self.ddp_module = DistributedDataParallel(model)
+        # Les modules DDP/compilé partagent les paramètres : model reste celui qu'on sauvegarde
+        self.forward_module = torch.compile(module) if compile else module
+        # Évaluation sans DDP : les rangs peuvent avoir des nombres de batchs différents
+        # et aucun gradient n'est à synchroniser
+        self.eval_module = self.forward_module
+        if self.distributed:
+            self.eval_module = torch.compile(model) if compile else model
+
+    def _autocast(self):
+        if self.amp:
+            return torch.autocast(device_type='cpu', dtype=torch.bfloat16)
+        return nullcontext()
+
+    def _prepare(self, inputs):
+        if self.channels_last:
+            return inputs.contiguous(memory_format=torch.channels_last)
+        return inputs
+
+    def _no_sync(self, sync):
+        # Pas de all-reduce des gradients sur les batchs intermédiaires d'une accumulation
+        if self.ddp_module is not None and not sync:
+            return self.ddp_module.no_sync()
+        return nullcontext()
+
+    def _log(self, message):
+        if is_main_process():
+            print(message)
+
+    def state_dict(self, epoch, batch, batch_size=None):
+        """
+        État complet de l'entraînement.
+
+        Les clés 'arch', 'num_classes' et 'state_dict' reprennent le format de
+        GrapeClassifier.save_model : le checkpoint sert aussi pour l'inférence.
+
+        Args:
+            epoch (int): Époque en cours
+            batch (int): Batchs de l'époque déjà traités par ce rang
+            batch_size (int, optional): Taille des batchs (vérifiée à la reprise)
+        """
+        state = {
+            'state_dict': self.model.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'epoch': epoch,
+            'batch': batch,
+            'batch_size': batch_size,
+            'step': self.global_step,
+            'history': self.history,
+            'rng': rng_state(),
+        }
+        if hasattr(self.model, 'arch'):
+            state['arch'] = self.model.arch
+            state['num_classes'] = self.model.classifier.out_features
+        return state
+
+    def load_state_dict(self, state):
+        """
+        Restaure un état écrit par state_dict : fit reprend à la même époque et au même batch.
+
+        Args:
+            state (dict): Voir checkpoint.load_training_checkpoint
+        """
+        self.model.load_state_dict(state['state_dict'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        self.start_epoch = state['epoch']
+        self.start_batch = state['batch']
+        self.resume_batch_size = state['batch_size']
+        self.global_step = state['step']
+        self.history = list(state['history'])
+        # Au milieu d'une époque, appliqué une fois le DataLoader lancé : le checkpoint a été
+        # écrit après le tirage de sa graine dans le générateur global
+        if self.start_batch:
+            self.resume_rng = state['rng']
+        else:
+            set_rng_state(state['rng'])
+
+    def _save_checkpoint(self, epoch, batch, batch_size):
+        if self.checkpointer is not None:
+            self.checkpointer.save(self.state_dict(epoch, batch, batch_size), self.global_step)
+
+    def _skip_batches(self, train_loader, num_batches):
+        # Reprise au milieu d'une époque : le sampler saute les images déjà vues sans les
+        # charger ; un dataset itérable (archives) doit relire les batchs à ignorer.
+        # Renvoie le nombre de batchs à lire puis jeter
+        if self.resume_batch_size not in (None, train_loader.batch_size):
+            raise ValueError(f"Reprise avec batch_size={train_loader.batch_size} alors que le checkpoint "
+                             f"a été écrit avec batch_size={self.resume_batch_size}")
+        sampler = getattr(train_loader, 'sampler', None)
+        if hasattr(sampler, 'set_start'):
+            sampler.set_start(num_batches * train_loader.batch_size)
+            return 0
+        self._log(f"  Reprise: lecture des {num_batches} batchs déjà vus de l'époque")
+        return num_batches
+
+    def train_epoch(self, train_loader, epoch=0, start_batch=0):
+        """
+        Entraîne le modèle sur une époque.
+
+        Args:
+            train_loader (DataLoader): Données d'entraînement
+            epoch (int): Numéro de l'époque (mélange du sampler)
+            start_batch (int): Batchs déjà traités avant une reprise (non comptés
+                dans les statistiques renvoyées)
+
+        Returns:
+            dict: Perte et précision moyennes, débit et répartition du temps par pas
+        """
+        # DistributedSampler ou dataset en archives : nouvel ordre à chaque époque
+        for source in (getattr(train_loader, 'sampler', None), getattr(train_loader, 'dataset', None)):
+            if hasattr(source, 'set_epoch'):
+                source.set_epoch(epoch)
+
+        self.model.train()
+        self.optimizer.zero_grad(set_to_none=True)
+        total_loss = torch.zeros(())
+        total_correct = torch.zeros((), dtype=torch.long)
+        num_images = 0
+        num_batches = 0
+        data_seconds = 0.0
+        compute_seconds = 0.0
+        discard = self._skip_batches(train_loader, start_batch) if start_batch else 0
+        try:
+            # Longueur lue après set_start : le sampler ne compte plus les batchs sautés
+            num_steps = start_batch - discard + len(train_loader)
+        except TypeError:
+            # Dataset itérable sans longueur (archives)
+            num_steps = None
+        batches = iter(train_loader)
+        for _ in range(discard):
+            next(batches)
+        if self.resume_rng is not None:
+            set_rng_state(self.resume_rng)
+            self.resume_rng = None
+
+        start = time.perf_counter()
+        ready = start
+        # join : les rangs peuvent recevoir des nombres de batchs différents (archives)
+        join = self.ddp_module.join() if self.ddp_module is not None else nullcontext()
+        with join:
+            for batch_index, (inputs, labels) in enumerate(batches, start=start_batch):
+                fetched = time.perf_counter()
+                data_seconds += fetched - ready
+
+                last_batch = num_steps is not None and batch_index + 1 == num_steps
+                step = (batch_index + 1) % self.accumulation_steps == 0 or last_batch
+
+                inputs = self._prepare(inputs)
+                with self._no_sync(step):
+                    with self._autocast():
+                        outputs = self.forward_module(inputs)
+                        loss = self.criterion(outputs, labels)
+                    (loss / self.accumulation_steps).backward()
+
+                if step:
+                    self.optimizer.step()
+                    self.optimizer.zero_grad(set_to_none=True)
+                    self.global_step += 1
+                    if self.checkpoint_interval and self.global_step % self.checkpoint_interval == 0:
+                        self._save_checkpoint(epoch, batch_index + 1, train_loader.batch_size)
+
+                # Accumulation sans .item() : aucune synchronisation pendant l'époque
+                batch_size = labels.shape[0]
+                total_loss += loss.detach().float() * batch_size
+                if hasattr(self.criterion, 'hard_labels'):
+                    labels = self.criterion.hard_labels(labels)
+                total_correct += (outputs.detach().argmax(dim=1) == labels).sum()
+                num_images += batch_size
+                num_batches += 1
+
+                ready = time.perf_counter()
+                compute_seconds += ready - fetched
+
+                if self.log_interval and num_batches % self.log_interval == 0:
+                    elapsed = ready - start
+                    self._log(f"  batch {num_batches}{f'/{num_steps}' if num_steps else ''}: "
+                              f"{num_images / elapsed:.1f} images/s")
+
+        # Gradients restants si la longueur du loader n'est pas connue ; en distribué ils
+        # n'ont pas été synchronisés entre les rangs (no_sync) et sont donc abandonnés
+        if num_steps is None and (start_batch + num_batches) % self.accumulation_steps:
+            if not self.distributed:
+                self.optimizer.step()
+                self.global_step += 1
+            self.optimizer.zero_grad(set_to_none=True)
+
+        elapsed = time.perf_counter() - start
+        # Totaux de tous les rangs (débit global, perte et précision sur tout le dataset)
+        totals = all_reduce_sum(torch.stack([total_loss.double(), total_correct.double(),
+                                             torch.tensor(float(num_images), dtype=torch.float64)]))
+        total_loss, total_correct, num_images = totals[0].item(), totals[1].item(), int(totals[2].item())
+        return {
+            'loss': total_loss / max(num_images, 1),
+            'accuracy': total_correct / max(num_images, 1),
+            'images': num_images,
+            'images_per_s': num_images / elapsed if elapsed > 0 else 0.0,
+            'data_ms_per_step': 1000 * data_seconds / max(num_batches, 1),
+            'compute_ms_per_step': 1000 * compute_seconds / max(num_batches, 1),
+            'data_fraction': data_seconds / elapsed if elapsed > 0 else 0.0,
+            'epoch_s': elapsed,
+        }
+
+    @torch.no_grad()
+    def evaluate(self, val_loader):
+        """
+        Évalue le modèle sur un jeu de validation.
+
+        Returns:
+            dict: Perte et précision moyennes
+        """
+        self.model.eval()
+        total_loss = torch.zeros(())
+        total_correct = torch.zeros((), dtype=torch.long)
+        num_images = 0
+        for inputs, labels in val_loader:
+            inputs = self._prepare(inputs)
+            with self._autocast():
+                outputs = self.eval_module(inputs)
+                loss = self.eval_criterion(outputs, labels)
+            total_loss += loss.float() * labels.shape[0]
+            total_correct += (outputs.argmax(dim=1) == labels).sum()
+            num_images += labels.shape[0]
+        totals = all_reduce_sum(torch.stack([total_loss.double(), total_correct.double(),
+                                             torch.tensor(float(num_images), dtype=torch.float64)]))
+        return {
+            'loss': totals[0].item() / max(totals[2].item(), 1),
+            'accuracy': totals[1].item() / max(totals[2].item(), 1),
+        }
+
+    def fit(self, train_loader, num_epochs, val_loader=None, on_epoch_end=None):
+        """
+        Entraîne le modèle et affiche un résumé à chaque époque.
+
+        Args:
+            train_loader (DataLoader): Données d'entraînement
+            num_epochs (int): Nombre d'époques
+            val_loader (DataLoader, optional): Données de validation évaluées à chaque époque
+            on_epoch_end (callable, optional): Appelé avec (modèle, époque, statistiques)
+                à la fin de chaque époque (ex: evaluate.BackgroundEvaluator.submit)
+
+        Returns:
+            list: Statistiques de chaque époque
+        """
+        if self.start_epoch or self.start_batch:
+            self._log(f"Reprise à l'époque {self.start_epoch + 1}, batch {self.start_batch} (pas {self.global_step})")
+        for epoch in range(self.start_epoch, num_epochs):
+            start_batch = self.start_batch if epoch == self.start_epoch else 0
+            stats = self.train_epoch(train_loader, epoch, start_batch)
+            message = (f"Epoch {epoch+1}/{num_epochs}, Loss: {stats['loss']:.4f}, "
+                       f"Accuracy: {stats['accuracy']:.4f}, {stats['images_per_s']:.1f} images/s "
+                       f"(données {stats['data_ms_per_step']:.1f} ms + calcul "
+                       f"{stats['compute_ms_per_step']:.1f} ms par pas)")
+            if val_loader is not None:
+                val_stats = self.evaluate(val_loader)
+                stats['val_loss'] = val_stats['loss']
+                stats['val_accuracy'] = val_stats['accuracy']
+                message += f", Val Loss: {val_stats['loss']:.4f}, Val Accuracy: {val_stats['accuracy']:.4f}"
+            self._log(message)
+            if stats['data_fraction'] > 0.5:
+                self._log(f"  Attente des données: {stats['data_fraction']:.0%} du temps, "
+                      "l'entraînement est limité par le chargement")
+            self.history.append(stats)
+            if on_epoch_end is not None:
+                on_epoch_end(self.model, epoch, stats)
+            self._save_checkpoint(epoch + 1, 0, getattr(train_loader, 'batch_size', None))
+        if self.checkpointer is not None:
+            self.checkpointer.wait()
+        return self.history
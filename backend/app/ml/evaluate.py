@@ -0,0 +1,276 @@
+import argparse
+import json
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+import torch
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from .dataset import create_datasets
+from .model import GrapeClassifier, load_model
+from .predict import CLASS_NAMES
+from .preprocessing import eval_collate
+
+class EvaluationAccumulator:
+    """
+    Statistiques d'évaluation accumulées batch par batch.
+
+    Seuls la matrice de confusion (num_classes x num_classes), la somme des pertes
+    et le nombre d'images sont conservés : la mémoire ne dépend pas de la taille
+    du split.
+    """
+
+    def __init__(self, num_classes=3):
+        self.num_classes = num_classes
+        self.confusion = torch.zeros(num_classes, num_classes, dtype=torch.long)
+        self.total_loss = 0.0
+        self.count = 0
+
+    def update(self, logits, labels):
+        """
+        Args:
+            logits (Tensor): Sorties du modèle (N, num_classes)
+            labels (Tensor): Vrais labels (N,)
+        """
+        logits = logits.float()
+        self.total_loss += F.cross_entropy(logits, labels, reduction='sum').item()
+        predictions = logits.argmax(dim=1)
+        # Ligne = vraie classe, colonne = classe prédite
+        self.confusion += torch.bincount(labels * self.num_classes + predictions,
+                                         minlength=self.num_classes ** 2).view(self.num_classes, -1)
+        self.count += labels.shape[0]
+
+    def result(self):
+        """
+        Returns:
+            dict: Perte moyenne, précision globale, rappel (précision par classe),
+                précision des prédictions par classe et matrice de confusion
+        """
+        confusion = self.confusion.double()
+        correct = confusion.diag()
+        per_class = correct / confusion.sum(dim=1).clamp(min=1)
+        precision = correct / confusion.sum(dim=0).clamp(min=1)
+        names = [CLASS_NAMES.get(i, f"Label {i}") for i in range(self.num_classes)]
+        return {
+            'images': self.count,
+            'loss': self.total_loss / max(self.count, 1),
+            'accuracy': correct.sum().item() / max(self.count, 1),
+            'per_class_accuracy': dict(zip(names, per_class.tolist())),
+            'per_class_precision': dict(zip(names, precision.tolist())),
+            'confusion_matrix': self.confusion.tolist(),
+        }
+
+@torch.no_grad()
+def evaluate_model(model, loader, amp=False, num_classes=None):
+    """
+    Évalue un modèle sur un loader, sans garder les prédictions en mémoire.
+
+    Args:
+        model (nn.Module): Modèle (mis en mode eval)
+        loader (DataLoader): Batchs (images normalisées, labels)
+        amp (bool): Autocast bfloat16 sur CPU
+        num_classes (int, optional): Nombre de classes (déduit du modèle sinon)
+
+    Returns:
+        dict: Voir EvaluationAccumulator.result, plus la durée et le débit
+    """
+    model.eval()
+    if num_classes is None:
+        num_classes = model.classifier.out_features
+    accumulator = EvaluationAccumulator(num_classes)
+    autocast = torch.autocast(device_type='cpu', dtype=torch.bfloat16) if amp else nullcontext()
+    start = time.perf_counter()
+    for inputs, labels in loader:
+        with autocast:
+            outputs = model(inputs)
+        accumulator.update(outputs, labels)
+    elapsed = time.perf_counter() - start
+    result = accumulator.result()
+    result['seconds'] = elapsed
+    result['images_per_s'] = result['images'] / elapsed if elapsed > 0 else 0.0
+    return result
+
+def create_eval_loader(image_dir=None, annotation_dir=None, shards=None, batch_size=64, num_workers=2):
+    """
+    Loader du split de validation (dossier d'images ou archives de app.ml.shards).
+
+    Returns:
+        DataLoader: Batchs (images normalisées, labels) dans l'ordre du split
+    """
+    if shards:
+        from .shards import ShardedImageDataset
+        dataset = ShardedImageDataset(shards, 'valid')
+    else:
+        _, dataset = create_datasets(str(image_dir), str(annotation_dir), augment=False)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                      collate_fn=eval_collate)
+
+def _evaluator_main(arch, num_classes, loader_args, num_threads, amp, snapshots, results):
+    torch.set_num_threads(num_threads)
+    model = GrapeClassifier(num_classes, pretrained=False, arch=arch)
+    loader = create_eval_loader(**loader_args)
+    while True:
+        snapshot = snapshots.get()
+        if snapshot is None:
+            break
+        epoch, state_dict = snapshot
+        try:
+            model.load_state_dict(state_dict)
+            del state_dict
+            result = evaluate_model(model, loader, amp, num_classes)
+            results.put((epoch, result, None))
+        except Exception as e:
+            results.put((epoch, None, f"{type(e).__name__}: {e}"))
+
+class BackgroundEvaluator:
+    """
+    Évalue des instantanés des poids dans un processus séparé pendant que l'entraînement continue.
+
+    submit() copie les poids (en mémoire partagée, quelques dizaines de ms) et rend
+    la main aussitôt ; le processus d'évaluation charge la copie dans son propre
+    modèle et parcourt la validation avec ses propres threads et workers. Les
+    résultats sont affichés dès qu'ils arrivent (thread d'écoute).
+
+    Si l'évaluation prend plus de temps qu'une époque, au plus max_pending instantanés
+    attendent : les suivants sont ignorés plutôt que de bloquer l'entraînement.
+    """
+
+    def __init__(self, model, loader_args, num_threads=1, amp=False, max_pending=2, verbose=True):
+        """
+        Args:
+            model (GrapeClassifier): Modèle entraîné (architecture et nombre de classes)
+            loader_args (dict): Arguments de create_eval_loader
+            num_threads (int): Threads de calcul du processus d'évaluation
+            amp (bool): Autocast bfloat16 pendant l'évaluation
+            max_pending (int): Instantanés en attente au maximum
+            verbose (bool): Afficher chaque résultat à son arrivée
+        """
+        self.max_pending = max_pending
+        self.verbose = verbose
+        self.results = {}
+        self.skipped = []
+        self._submitted = 0
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+
+        context = mp.get_context('spawn')
+        self._snapshots = context.Queue()
+        self._results = context.Queue()
+        # Pas de processus démon : il doit pouvoir lancer les workers de son DataLoader
+        self._process = context.Process(
+            target=_evaluator_main,
+            args=(model.arch, model.classifier.out_features, loader_args, num_threads, amp,
+                  self._snapshots, self._results)
+        )
+        self._process.start()
+        self._listener = threading.Thread(target=self._listen, name="eval-results", daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                return
+            epoch, result, error = message
+            with self._lock:
+                self.results[epoch] = result if error is None else {'error': error}
+                self._done.notify_all()
+            if self.verbose:
+                print(format_result(epoch, result) if error is None
+                      else f"[éval] Epoch {epoch + 1}: échec ({error})")
+
+    def pending(self):
+        with self._lock:
+            return self._submitted - len(self.results)
+
+    def submit(self, model, epoch):
+        """
+        Envoie un instantané des poids à évaluer.
+
+        Args:
+            model (nn.Module): Modèle en cours d'entraînement
+            epoch (int): Époque de l'instantané
+
+        Returns:
+            bool: False si l'instantané a été ignoré (trop d'évaluations en attente)
+        """
+        if self.pending() >= self.max_pending:
+            self.skipped.append(epoch)
+            if self.verbose:
+                print(f"[éval] Epoch {epoch + 1} ignorée: {self.max_pending} évaluations déjà en attente")
+            return False
+        # Copie en mémoire partagée (les poids channels_last reprennent le format par défaut)
+        state_dict = {k: v.detach().clone(memory_format=torch.contiguous_format).share_memory_()
+                      for k, v in model.state_dict().items()}
+        with self._lock:
+            self._submitted += 1
+        self._snapshots.put((epoch, state_dict))
+        return True
+
+    def close(self, wait=True):
+        """
+        Arrête le processus d'évaluation.
+
+        Args:
+            wait (bool): Attendre la fin des évaluations en cours
+
+        Returns:
+            dict: Résultats par époque
+        """
+        if wait:
+            with self._done:
+                while len(self.results) < self._submitted and self._process.is_alive():
+                    self._done.wait(timeout=1.0)
+        self._snapshots.put(None)
+        self._process.join(timeout=30)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._results.put(None)
+        self._listener.join(timeout=5)
+        return dict(sorted(self.results.items()))
+
+def format_result(epoch, result):
+    per_class = ", ".join(f"{name}: {acc:.3f}" for name, acc in result['per_class_accuracy'].items())
+    prefix = f"[éval] Epoch {epoch + 1}: " if epoch is not None else ""
+    return (f"{prefix}Val Loss: {result['loss']:.4f}, Val Accuracy: {result['accuracy']:.4f} "
+            f"({per_class}) en {result['seconds']:.1f} s")
+
+def print_confusion_matrix(confusion):
+    names = [CLASS_NAMES.get(i, f"Label {i}") for i in range(len(confusion))]
+    width = max(len(name) for name in names) + 2
+    header = "vraie \\ prédite"
+    print(f"\n{header:<{width}}" + "".join(f"{name:>{width}}" for name in names))
+    for name, row in zip(names, confusion):
+        print(f"{name:<{width}}" + "".join(f"{n:>{width}}" for n in row))
+
+def parse_args(argv=None):
+    base_dir = Path(__file__).parent.parent.parent.parent
+    parser = argparse.ArgumentParser(description="Évaluation rapide d'un checkpoint sur la validation")
+    parser.add_argument('--model', default="grape_classifier.pth", help="Checkpoint à évaluer")
+    parser.add_argument('--image-dir', default=str(base_dir / "usable_images"), help="Dossier des images")
+    parser.add_argument('--annotation-dir', default=str(base_dir / "annotations"), help="Dossier des annotations")
+    parser.add_argument('--shards', default=None, help="Dossier d'archives (app.ml.shards) à la place des images")
+    parser.add_argument('--batch-size', type=int, default=64, help="Taille des batchs")
+    parser.add_argument('--num-workers', type=int, default=4, help="Workers de chargement")
+    parser.add_argument('--amp', action='store_true', help="Autocast bfloat16 sur CPU")
+    parser.add_argument('--output', default=None, help="Fichier JSON où écrire les résultats")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    model = load_model(args.model)
+    loader = create_eval_loader(args.image_dir, args.annotation_dir, args.shards, args.batch_size, args.num_workers)
+    result = evaluate_model(model, loader, args.amp)
+    print(f"\n{args.model}: {result['images']} images, {result['images_per_s']:.1f} images/s")
+    print(format_result(None, result))
+    print_confusion_matrix(result['confusion_matrix'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from .backends import EagerBackend, load_backend
+from .dataset import create_datasets
+from .model import load_model, read_checkpoint
+from .preprocessing import eval_collate
+
+def _quantizable_resnet50(state_dict):
+    """Reconstruit le ResNet50 dans sa version quantifiable et y charge les poids entraînés."""
+    from torchvision.models.quantization import resnet50
+
+    num_classes = state_dict['model.fc.weight'].shape[0]
+    model = resnet50(weights=None, quantize=False)
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+    # Les poids de GrapeClassifier sont préfixés par 'model.'
+    model.load_state_dict({k[len('model.'):]: v for k, v in state_dict.items()})
+    return model.eval()
+
+def quantize_static(model_path, calibration_loader, num_batches=10):
+    """
+    Quantification statique INT8 calibrée sur des données réelles.
+
+    Args:
+        model_path (str): Checkpoint float32
+        calibration_loader (DataLoader): Images de calibration (split de validation)
+        num_batches (int): Nombre de batchs utilisés pour la calibration
+
+    Returns:
+        nn.Module: Modèle quantifié
+    """
+    engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+    torch.backends.quantized.engine = engine
+
+    state_dict, metadata = read_checkpoint(model_path, mmap=False)
+    if metadata['arch'] != 'resnet50':
+        raise ValueError(f"La quantification statique ne prend en charge que le ResNet50 "
+                         f"(checkpoint: {metadata['arch']}), utiliser --quantization dynamic")
+    model = _quantizable_resnet50(state_dict)
+    model.fuse_model()
+    model.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+    torch.ao.quantization.prepare(model, inplace=True)
+
+    # Calibration des observateurs
+    with torch.no_grad():
+        for i, (inputs, _) in enumerate(calibration_loader):
+            if i >= num_batches:
+                break
+            model(inputs)
+
+    torch.ao.quantization.convert(model, inplace=True)
+    return model
+
+def quantize_dynamic(model_path):
+    """
+    Quantification dynamique INT8 (couches linéaires uniquement, sans calibration).
+
+    Args:
+        model_path (str): Checkpoint float32
+
+    Returns:
+        nn.Module: Modèle quantifié
+    """
+    # Seul le ResNet interne est quantifié et exporté (même forward que GrapeClassifier)
+    model = load_model(model_path, mmap=False).model
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def export_quantized(model, output_path):
+    """Sauvegarde le modèle quantifié en TorchScript, rechargeable sans torchvision."""
+    scripted = torch.jit.script(model)
+    torch.jit.save(scripted, str(output_path))
+
+def export_onnx(model_path, output_path, opset_version=18):
+    """
+    Exporte le modèle float32 en graphe ONNX avec une taille de batch dynamique.
+
+    Args:
+        model_path (str): Checkpoint float32
+        output_path (str): Fichier .onnx à écrire
+        opset_version (int): Version de l'opset ONNX
+    """
+    model = load_model(model_path, mmap=False)
+    dummy = torch.zeros(1, 3, 224, 224)
+    torch.onnx.export(
+        model, (dummy,), str(output_path),
+        input_names=['input'],
+        output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=opset_version
+    )
+
+def compare_backends(backends, loader, warmup=2):
+    """
+    Compare la précision et la latence de plusieurs backends sur le même jeu de données.
+
+    Le premier backend sert de référence (float32) pour l'écart de précision et l'accord
+    des prédictions.
+
+    Args:
+        backends (dict): Nom -> backend
+        loader (DataLoader): Données de validation
+        warmup (int): Nombre de batchs exécutés avant de mesurer la latence
+
+    Returns:
+        dict: Statistiques par backend
+    """
+    names = list(backends)
+    stats = {name: {'correct': 0, 'agree': 0, 'seconds': 0.0, 'images': 0, 'max_prob_diff': 0.0}
+             for name in names}
+    total = 0
+
+    for batch_index, (inputs, labels) in enumerate(loader):
+        labels = torch.as_tensor(labels)
+        reference = None
+        for name in names:
+            start = time.perf_counter()
+            outputs = backends[name](inputs)
+            elapsed = time.perf_counter() - start
+
+            probabilities = torch.softmax(outputs.float(), dim=1)
+            predicted = probabilities.argmax(dim=1)
+            if reference is None:
+                reference = (probabilities, predicted)
+
+            entry = stats[name]
+            entry['correct'] += (predicted == labels).sum().item()
+            entry['agree'] += (predicted == reference[1]).sum().item()
+            entry['max_prob_diff'] = max(entry['max_prob_diff'],
+                                         (probabilities - reference[0]).abs().max().item())
+            if batch_index >= warmup:
+                entry['seconds'] += elapsed
+                entry['images'] += len(inputs)
+        total += len(inputs)
+
+    reference_accuracy = stats[names[0]]['correct'] / max(total, 1)
+    report = {}
+    for name in names:
+        entry = stats[name]
+        accuracy = entry['correct'] / max(total, 1)
+        report[name] = {
+            'accuracy': accuracy,
+            'accuracy_delta': accuracy - reference_accuracy,
+            'agreement': entry['agree'] / max(total, 1),
+            'max_prob_diff': entry['max_prob_diff'],
+            'ms_per_image': 1000 * entry['seconds'] / entry['images'] if entry['images'] else None,
+        }
+    return report
+
+def parse_args(argv=None):
+    base_dir = Path(__file__).parent.parent.parent.parent
+    parser = argparse.ArgumentParser(description="Export du modèle en INT8 et en ONNX pour l'inférence CPU")
+    parser.add_argument('--model', default="grape_classifier.pth", help="Checkpoint float32 à exporter")
+    parser.add_argument('--output-dir', default=".", help="Dossier des modèles exportés")
+    parser.add_argument('--quantization', choices=['static', 'dynamic', 'none'], default='static',
+                        help="Type de quantification INT8")
+    parser.add_argument('--no-onnx', action='store_true', help="Ne pas exporter le graphe ONNX")
+    parser.add_argument('--calibration-batches', type=int, default=10, help="Batchs de calibration")
+    parser.add_argument('--batch-size', type=int, default=32, help="Taille des batchs")
+    parser.add_argument('--image-dir', default=str(base_dir / "usable_images"), help="Dossier des images")
+    parser.add_argument('--annotation-dir', default=str(base_dir / "annotations"), help="Dossier des annotations")
+    parser.add_argument('--no-compare', action='store_true', help="Ne pas comparer les backends sur la validation")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    val_loader = None
+    if args.quantization == 'static' or not args.no_compare:
+        _, val_dataset = create_datasets(args.image_dir, args.annotation_dir)
+        val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False, num_workers=4,
+                                collate_fn=eval_collate)
+
+    backends = {'eager': EagerBackend.load(args.model)}
+
+    if args.quantization != 'none':
+        print(f"Quantification {args.quantization} INT8...")
+        if args.quantization == 'static':
+            quantized = quantize_static(args.model, val_loader, args.calibration_batches)
+        else:
+            quantized = quantize_dynamic(args.model)
+        quantized_path = output_dir / (Path(args.model).stem + "_int8.pt")
+        export_quantized(quantized, quantized_path)
+        print(f"Modèle INT8 sauvegardé: {quantized_path}")
+        backends['quantized'] = load_backend('quantized', quantized_path)
+
+    if not args.no_onnx:
+        onnx_path = output_dir / (Path(args.model).stem + ".onnx")
+        export_onnx(args.model, onnx_path)
+        print(f"Graphe ONNX sauvegardé: {onnx_path}")
+        try:
+            backends['onnx'] = load_backend('onnx', onnx_path)
+        except ImportError as e:
+            print(f"Comparaison ONNX ignorée: {e}")
+
+    if not args.no_compare:
+        print("\nComparaison sur le split de validation...")
+        report = compare_backends(backends, val_loader)
+        print(f"\n{'Backend':<10} {'Précision':>10} {'Écart':>8} {'Accord':>8} {'ms/image':>9}")
+        for name, entry in report.items():
+            latency = f"{entry['ms_per_image']:.2f}" if entry['ms_per_image'] is not None else "-"
+            print(f"{name:<10} {entry['accuracy']*100:>9.2f}% {entry['accuracy_delta']*100:>+7.2f}% "
+                  f"{entry['agreement']*100:>7.2f}% {latency:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import hashlib
+from pathlib import Path
+
+import torch
+from torch.utils.data import DataLoader
+
+from .preprocessing import eval_collate
+
+def _features_key(model, dataset, source):
+    """Identifie un jeu de caractéristiques : backbone d'origine + liste des images."""
+    key = hashlib.sha256()
+    key.update(str(source).encode())
+    for img_path, label in zip(dataset.images, dataset.labels):
+        key.update(f"{img_path}:{label}\n".encode())
+    return key.hexdigest()[:16]
+
+def extract_features(model, dataset, batch_size=64, num_workers=4):
+    """
+    Passe le backbone une seule fois sur tout le dataset.
+
+    Args:
+        model (GrapeClassifier): Modèle dont le backbone est utilisé
+        dataset (GrapeDataset): Dataset avec des transformations déterministes
+        batch_size (int): Taille des batchs
+        num_workers (int): Nombre de workers du DataLoader
+
+    Returns:
+        tuple: (caractéristiques (N, 2048), labels (N,))
+    """
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                        collate_fn=eval_collate)
+    model.eval()
+    features = []
+    labels = []
+    with torch.no_grad():
+        for i, (inputs, targets) in enumerate(loader):
+            features.append(model.forward_features(inputs))
+            labels.append(torch.as_tensor(targets))
+            if (i + 1) % 20 == 0:
+                print(f"Extraction des caractéristiques: {(i + 1) * batch_size}/{len(dataset)} images")
+    return torch.cat(features), torch.cat(labels)
+
+def load_or_extract_features(model, dataset, cache_dir, source, batch_size=64, num_workers=4):
+    """
+    Charge les caractéristiques depuis le disque, ou les calcule et les sauvegarde.
+
+    Args:
+        model (GrapeClassifier): Modèle dont le backbone est utilisé
+        dataset (GrapeDataset): Dataset avec des transformations déterministes
+        cache_dir (str): Dossier où stocker les caractéristiques
+        source (str): Origine des poids du backbone (checkpoint ou 'imagenet')
+        batch_size (int): Taille des batchs
+        num_workers (int): Nombre de workers du DataLoader
+
+    Returns:
+        tuple: (caractéristiques (N, 2048), labels (N,))
+    """
+    cache_file = Path(cache_dir) / f"features-{_features_key(model, dataset, source)}.pt"
+    if cache_file.exists():
+        print(f"Caractéristiques chargées depuis {cache_file}")
+        cached = torch.load(cache_file, weights_only=True)
+        return cached['features'], cached['labels']
+
+    features, labels = extract_features(model, dataset, batch_size, num_workers)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix('.tmp')
+    torch.save({'features': features, 'labels': labels}, tmp_file)
+    tmp_file.replace(cache_file)
+    return features, labels
+
+def train_head(model, train_features, train_labels, val_features=None, val_labels=None,
+               num_epochs=100, learning_rate=0.001, batch_size=256):
+    """
+    Entraîne uniquement la tête de classification du modèle sur des caractéristiques pré-calculées.
+
+    Args:
+        model (GrapeClassifier): Modèle dont la tête est entraînée (modifiée sur place)
+        train_features (Tensor): Caractéristiques d'entraînement (N, dimension du backbone)
+        train_labels (Tensor): Labels d'entraînement (N,)
+        val_features (Tensor, optional): Caractéristiques de validation
+        val_labels (Tensor, optional): Labels de validation
+        num_epochs (int): Nombre d'époques
+        learning_rate (float): Taux d'apprentissage
+        batch_size (int): Taille des batchs
+    """
+    head = model.classifier
+    head.train()
+    criterion = torch.nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(head.parameters(), lr=learning_rate)
+    num_samples = len(train_features)
+
+    for epoch in range(num_epochs):
+        running_loss = torch.zeros(())
+        permutation = torch.randperm(num_samples)
+        for start in range(0, num_samples, batch_size):
+            indices = permutation[start:start + batch_size]
+            optimizer.zero_grad()
+            loss = criterion(head(train_features[indices]), train_labels[indices])
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.detach() * len(indices)
+
+        if (epoch + 1) % 10 == 0 or epoch + 1 == num_epochs:
+            message = f'Epoch {epoch+1}/{num_epochs}, Loss: {running_loss.item() / num_samples}'
+            if val_features is not None and len(val_features):
+                with torch.no_grad():
+                    predicted = head(val_features).argmax(dim=1)
+                accuracy = (predicted == val_labels).float().mean().item()
+                message += f', Val accuracy: {accuracy * 100:.2f}%'
+            print(message)
+
+    head.eval()
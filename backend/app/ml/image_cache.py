@@ -0,0 +1,137 @@
+import json
+import os
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .decode import decode_image
+
+DATA_FILE = "images.u8"
+INDEX_FILE = "index.npy"
+PATHS_FILE = "paths.json"
+
+def _decode_resized(args):
+    """Décode une image et réduit son plus petit côté à max_size (sans agrandir)."""
+    img_path, max_size = args
+    # Décodage JPEG réduit, puis ajustement exact de la taille
+    image = decode_image(img_path, max_size)
+    width, height = image.size
+    scale = max_size / min(width, height)
+    if scale < 1:
+        new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = image.resize(new_size, Image.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+def build_image_cache(image_paths, cache_dir, max_size=320, num_workers=None):
+    """
+    Décode chaque image une seule fois et les stocke en uint8 dans un fichier mappable en mémoire.
+
+    Le fichier de données contient les pixels (H, W, 3) bout à bout ; l'index associe à
+    chaque image son offset et sa taille. L'index est écrit en dernier pour qu'un cache
+    interrompu ne soit jamais utilisé.
+
+    Args:
+        image_paths (list): Chemins des images, dans l'ordre du dataset
+        cache_dir (str): Dossier où écrire le cache
+        max_size (int): Taille maximale du plus petit côté des images stockées
+        num_workers (int, optional): Nombre de processus de décodage (tous les cœurs par défaut)
+
+    Returns:
+        ImageCache: Le cache construit
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    paths = [str(p) for p in image_paths]
+    # Reconstruction : l'ancien index disparaît avant que les données ne changent
+    (cache_dir / INDEX_FILE).unlink(missing_ok=True)
+
+    index = np.zeros((len(paths), 3), dtype=np.int64)
+    offset = 0
+    tmp_data = cache_dir / (DATA_FILE + ".tmp")
+    with open(tmp_data, 'wb') as f, Pool(num_workers) as pool:
+        jobs = ((p, max_size) for p in paths)
+        for i, array in enumerate(pool.imap(_decode_resized, jobs, chunksize=16)):
+            height, width, _ = array.shape
+            index[i] = (offset, height, width)
+            f.write(array.tobytes())
+            offset += array.nbytes
+            if (i + 1) % 1000 == 0:
+                print(f"Cache d'images: {i + 1}/{len(paths)} images décodées")
+
+    os.replace(tmp_data, cache_dir / DATA_FILE)
+    tmp_paths = cache_dir / (PATHS_FILE + ".tmp")
+    with open(tmp_paths, 'w') as f:
+        json.dump({'paths': paths, 'max_size': max_size}, f)
+    os.replace(tmp_paths, cache_dir / PATHS_FILE)
+    tmp_index = cache_dir / (INDEX_FILE + ".tmp")
+    with open(tmp_index, 'wb') as f:
+        np.save(f, index)
+    os.replace(tmp_index, cache_dir / INDEX_FILE)
+
+    return ImageCache(cache_dir)
+
+class ImageCache:
+    """
+    Lecture des images pré-décodées depuis un fichier mappé en mémoire.
+
+    Le fichier n'est ouvert qu'au premier accès, dans chaque processus : les workers du
+    DataLoader partagent ainsi les mêmes pages via le cache de l'OS au lieu de recevoir
+    chacun une copie des données.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Args:
+            cache_dir (str): Dossier contenant un cache construit par build_image_cache
+        """
+        self.cache_dir = Path(cache_dir)
+        self.index = np.load(self.cache_dir / INDEX_FILE)
+        self._data = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getstate__(self):
+        # Ne jamais transmettre le mapping aux workers, ils le rouvrent eux-mêmes
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def __getitem__(self, idx):
+        """Retourne l'image (H, W, 3) en uint8, comme vue sur le fichier mappé (sans copie)."""
+        if self._data is None:
+            # Copie à l'écriture : vues modifiables (torch.from_numpy) sans jamais toucher au fichier
+            self._data = np.memmap(self.cache_dir / DATA_FILE, dtype=np.uint8, mode='c')
+        offset, height, width = self.index[idx]
+        return self._data[offset:offset + height * width * 3].reshape(height, width, 3)
+
+    def matches(self, image_paths, max_size=None):
+        """Vérifie que le cache correspond bien à cette liste d'images."""
+        with open(self.cache_dir / PATHS_FILE, 'r') as f:
+            meta = json.load(f)
+        if max_size is not None and meta['max_size'] != max_size:
+            return False
+        return meta['paths'] == [str(p) for p in image_paths]
+
+def open_image_cache(image_paths, cache_dir, max_size=320, num_workers=None):
+    """
+    Ouvre le cache s'il correspond aux images, sinon le (re)construit.
+
+    Args:
+        image_paths (list): Chemins des images, dans l'ordre du dataset
+        cache_dir (str): Dossier du cache
+        max_size (int): Taille maximale du plus petit côté des images stockées
+        num_workers (int, optional): Nombre de processus de décodage
+
+    Returns:
+        ImageCache: Le cache prêt à l'emploi
+    """
+    cache_dir = Path(cache_dir)
+    if (cache_dir / INDEX_FILE).exists():
+        cache = ImageCache(cache_dir)
+        if cache.matches(image_paths, max_size):
+            return cache
+    print(f"Construction du cache d'images dans {cache_dir}...")
+    return build_image_cache(image_paths, cache_dir, max_size, num_workers)
@@ -0,0 +1,332 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from .distributed import available_cpus, get_local_world_size
+
+# Choix mémorisés par machine (clé : machine, charge de travail, taille de batch), un
+# fichier par hôte : les nœuds d'un entraînement distribué n'écrivent jamais le même fichier
+TUNING_DIR = Path(__file__).parent.parent.parent.parent / "loader_tuning"
+
+# Charges de travail mesurées : entraînement sur les images (GrapeDataset), sur les
+# archives (ShardedImageDataset) et classification en masse (ImageListDataset)
+WORKLOADS = ('train', 'shards', 'bulk')
+
+def loader_options(num_workers, prefetch_factor=None, persistent_workers=True, pin_memory=False):
+    """
+    Arguments de DataLoader cohérents avec le nombre de workers.
+
+    prefetch_factor et persistent_workers n'existent qu'avec des workers : ils sont
+    omis quand num_workers vaut 0 (DataLoader les refuse).
+
+    Args:
+        num_workers (int): Workers de chargement
+        prefetch_factor (int, optional): Batchs préparés à l'avance par worker (2 par défaut)
+        persistent_workers (bool): Garder les workers d'une époque à l'autre
+        pin_memory (bool): Mémoire verrouillée (utile seulement vers un GPU)
+
+    Returns:
+        dict: Arguments à passer à DataLoader
+    """
+    options = {'num_workers': num_workers, 'pin_memory': pin_memory}
+    if num_workers > 0:
+        options['persistent_workers'] = persistent_workers
+        if prefetch_factor:
+            options['prefetch_factor'] = prefetch_factor
+    return options
+
+def machine_key():
+    """Identifiant de la machine : nom d'hôte, cœurs disponibles et processus locaux."""
+    return f"{platform.node()}/{available_cpus()}cpu/{get_local_world_size()}proc"
+
+def tuning_file():
+    """Fichier des réglages de cette machine."""
+    return TUNING_DIR / f"{platform.node() or 'localhost'}.json"
+
+def worker_counts(max_workers=None):
+    """
+    Nombres de workers essayés : 0, puis des puissances de 2 jusqu'aux cœurs disponibles.
+
+    En distribué, les cœurs sont partagés entre les processus locaux.
+    """
+    max_workers = max_workers or max(1, available_cpus() // get_local_world_size())
+    counts = [0] + [n for n in (1, 2, 4, 8, 16, 32, 64, 128) if n < max_workers] + [max_workers]
+    return sorted(set(counts))
+
+def _iter_batches(loader):
+    # Plusieurs passes si le dataset est plus court que la mesure
+    while True:
+        empty = True
+        for batch in loader:
+            empty = False
+            yield batch
+        if empty:
+            return
+
+def measure_loader(make_loader, options, min_seconds=2.0, max_batches=50):
+    """
+    Mesure le débit d'une configuration de DataLoader.
+
+    Le premier batch (démarrage des workers) est mesuré à part ; le débit est ensuite
+    mesuré pendant au moins min_seconds (et au moins 3 batchs). La mémoire des workers
+    (USS : pages privées) est lue pendant qu'ils tournent ; les workers sont les
+    processus enfants apparus depuis la création du DataLoader.
+
+    Args:
+        make_loader (callable): Construit un DataLoader à partir des arguments de loader_options
+        options (dict): Configuration mesurée
+        min_seconds (float): Durée minimale de la mesure
+        max_batches (int): Nombre maximal de batchs mesurés
+
+    Returns:
+        dict: options, images_per_s, startup_s et worker_uss_mb (None sans /proc)
+    """
+    from .workers import child_pids, process_memory
+
+    children = child_pids()
+    start = time.perf_counter()
+    loader = make_loader(options)
+    batches = _iter_batches(loader)
+    first = next(batches, None)
+    if first is None:
+        raise ValueError("Aucune donnée à charger pour mesurer le DataLoader")
+    startup = time.perf_counter() - start
+
+    images = 0
+    num_batches = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    for batch in batches:
+        # (images, labels) à l'entraînement, (chemins, batch, erreurs, durées) en masse
+        images += len(batch[0])
+        num_batches += 1
+        elapsed = time.perf_counter() - start
+        if num_batches >= max_batches or (elapsed >= min_seconds and num_batches >= 3):
+            break
+
+    uss = [process_memory(pid)['uss_mb'] for pid in child_pids() - children]
+    del batches, first, loader
+    return {
+        'options': options,
+        'images_per_s': images / elapsed if elapsed > 0 else 0.0,
+        'startup_s': startup,
+        'worker_uss_mb': sum(uss) if None not in uss else None,
+    }
+
+def autotune_loader(make_loader, persistent_workers=True, max_workers=None, max_worker_memory_mb=None,
+                    tolerance=0.05, verbose=True, **measure_args):
+    """
+    Cherche la configuration de DataLoader la plus rapide sur cette machine.
+
+    Le nombre de workers augmente (prefetch_factor=2) jusqu'à ce que deux valeurs
+    successives n'apportent plus de gain ; prefetch_factor=4 est ensuite essayé sur
+    la meilleure. Parmi les configurations à moins de tolerance du meilleur débit,
+    celle qui a le moins de workers est retenue (moins de mémoire et de cœurs pris
+    au calcul).
+
+    Args:
+        make_loader (callable): Construit un DataLoader à partir des arguments de loader_options
+        persistent_workers (bool): Workers persistants (False pour un dataset qui doit
+            voir set_epoch dans ses workers, ex: archives)
+        max_workers (int, optional): Nombre maximal de workers (défaut: cœurs par processus local)
+        max_worker_memory_mb (float, optional): Mémoire totale maximale des workers
+        tolerance (float): Écart relatif de débit considéré comme négligeable
+        verbose (bool): Afficher chaque mesure
+        **measure_args: Arguments de measure_loader
+
+    Returns:
+        tuple: (meilleure configuration, liste des mesures)
+    """
+    pin_memory = torch.cuda.is_available()
+
+    def measure(num_workers, prefetch_factor):
+        options = loader_options(num_workers, prefetch_factor if num_workers else None,
+                                 persistent_workers, pin_memory)
+        result = measure_loader(make_loader, options, **measure_args)
+        if verbose:
+            memory = result['worker_uss_mb']
+            print(f"  workers={num_workers:<3} prefetch={prefetch_factor if num_workers else '-':<2} "
+                  f"{result['images_per_s']:8.1f} images/s, démarrage {result['startup_s']:.2f} s"
+                  + (f", workers {memory:.0f} Mo" if memory is not None else ""))
+        return result
+
+    results = []
+    best = 0.0
+    stalled = 0
+    for num_workers in worker_counts(max_workers):
+        result = measure(num_workers, 2)
+        results.append(result)
+        if result['images_per_s'] > best * (1 + tolerance):
+            best = result['images_per_s']
+            stalled = 0
+        else:
+            stalled += 1
+            if stalled == 2:
+                break
+
+    def allowed(result):
+        memory = result['worker_uss_mb']
+        return max_worker_memory_mb is None or memory is None or memory <= max_worker_memory_mb
+
+    candidates = [r for r in results if allowed(r)] or results[:1]
+    fastest = max(candidates, key=lambda r: r['images_per_s'])
+    if fastest['options']['num_workers']:
+        result = measure(fastest['options']['num_workers'], 4)
+        results.append(result)
+        if allowed(result):
+            candidates.append(result)
+
+    best = max(r['images_per_s'] for r in candidates)
+    chosen = min((r for r in candidates if r['images_per_s'] >= best * (1 - tolerance)),
+                 key=lambda r: (r['options']['num_workers'], r['options'].get('prefetch_factor', 0)))
+    return chosen['options'], results
+
+def _read_tuning(cache_file):
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def tuned_loader_options(workload, make_loader, batch_size, cache_file=None, retune=False, **tune_args):
+    """
+    Configuration de DataLoader mesurée une fois par machine puis relue.
+
+    Args:
+        workload (str): Charge de travail (voir WORKLOADS)
+        make_loader (callable): Construit un DataLoader à partir des arguments de loader_options
+        batch_size (int): Taille des batchs (fait partie de la clé du cache)
+        cache_file (str, optional): Fichier des choix mémorisés (défaut: tuning_file())
+        retune (bool): Refaire la mesure même si un choix est mémorisé
+        **tune_args: Arguments de autotune_loader
+
+    Returns:
+        dict: Arguments de DataLoader (voir loader_options)
+    """
+    cache_file = Path(cache_file or tuning_file())
+    key = f"{machine_key()}/{workload}/batch{batch_size}"
+    if not retune:
+        entry = _read_tuning(cache_file).get(key)
+        if entry is not None:
+            print(f"DataLoader ({workload}): réglage mémorisé {entry['options']}")
+            return entry['options']
+
+    print(f"DataLoader ({workload}): mesure des configurations sur cette machine...")
+    options, results = autotune_loader(make_loader, **tune_args)
+    print(f"DataLoader ({workload}): {options} retenu")
+
+    # Relecture juste avant l'écriture : d'autres charges de travail ont pu être ajoutées
+    tuning = _read_tuning(cache_file)
+    tuning[key] = {
+        'options': options,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': results,
+    }
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(tuning, f, indent=2)
+    os.replace(tmp_file, cache_file)
+    return options
+
+def tune_training_loader(image_dir=None, annotation_dir=None, batch_size=32, image_cache_dir=None, shards=None,
+                         **kwargs):
+    """
+    Réglage du DataLoader d'entraînement, mesuré sur le vrai dataset (images ou archives).
+
+    Returns:
+        dict: Arguments de DataLoader (voir loader_options)
+    """
+    from torch.utils.data import DataLoader
+
+    from .preprocessing import train_collate
+
+    if shards:
+        from .shards import ShardedImageDataset
+        dataset = ShardedImageDataset(shards, 'train')
+        # Les workers persistants ne verraient pas set_epoch (copie du dataset par worker)
+        kwargs.setdefault('persistent_workers', False)
+        workload = 'shards'
+    else:
+        from .dataset import create_datasets
+        dataset, _ = create_datasets(str(image_dir), str(annotation_dir), image_cache_dir)
+        workload = 'train'
+    shuffle = not shards
+    return tuned_loader_options(
+        workload,
+        lambda options: DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, collate_fn=train_collate,
+                                   **options),
+        batch_size, **kwargs
+    )
+
+def tune_bulk_loader(image_dir=None, manifest_file=None, batch_size=32, **kwargs):
+    """
+    Réglage du DataLoader de classification en masse, mesuré sur les premières images à classer.
+
+    Returns:
+        dict: Arguments de DataLoader (voir loader_options)
+    """
+    from torch.utils.data import DataLoader
+
+    from .bulk_predict import ImageListDataset, collate_images, iter_source, write_path_list
+
+    # Une seule passe sur les images : pas de workers persistants
+    kwargs.setdefault('persistent_workers', False)
+    with tempfile.TemporaryDirectory(prefix="loader_tuning-") as tmp_dir:
+        list_file = os.path.join(tmp_dir, "paths.txt")
+        write_path_list(itertools.islice(iter_source(image_dir, manifest_file), 64 * batch_size), list_file)
+        dataset = ImageListDataset(list_file)
+        return tuned_loader_options(
+            'bulk',
+            lambda options: DataLoader(dataset, batch_size=batch_size, collate_fn=collate_images, **options),
+            batch_size, **kwargs
+        )
+
+def parse_args(argv=None):
+    base_dir = Path(__file__).parent.parent.parent.parent
+    parser = argparse.ArgumentParser(description="Réglage automatique des DataLoader sur cette machine")
+    parser.add_argument('workload', choices=WORKLOADS, help="Charge de travail mesurée")
+    parser.add_argument('--image-dir', default=str(base_dir / "usable_images"), help="Dossier des images")
+    parser.add_argument('--annotation-dir', default=str(base_dir / "annotations"), help="Dossier des annotations")
+    parser.add_argument('--shards', default=str(base_dir / "shards"), help="Dossier d'archives (workload shards)")
+    parser.add_argument('--image-cache', nargs='?', const='default', default=None,
+                        help="Mesurer avec le cache d'images décodées, comme train --image-cache "
+                             "(dossier image_cache par défaut)")
+    parser.add_argument('--manifest', default=None, help="Manifeste d'images (workload bulk, à la place de --image-dir)")
+    parser.add_argument('--batch-size', type=int, default=32, help="Taille des batchs")
+    parser.add_argument('--max-workers', type=int, default=None, help="Nombre maximal de workers essayés")
+    parser.add_argument('--max-worker-memory-mb', type=float, default=None,
+                        help="Mémoire totale maximale des workers (USS)")
+    parser.add_argument('--seconds', type=float, default=2.0, help="Durée de mesure par configuration")
+    parser.add_argument('--cache-file', default=None, help=f"Fichier des réglages (défaut: {TUNING_DIR.name}/<hôte>.json)")
+    parser.add_argument('--retune', action='store_true', help="Refaire la mesure même si un réglage est mémorisé")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    tune_args = {
+        'cache_file': args.cache_file,
+        'retune': args.retune,
+        'max_workers': args.max_workers,
+        'max_worker_memory_mb': args.max_worker_memory_mb,
+        'min_seconds': args.seconds,
+    }
+    if args.workload == 'bulk':
+        tune_bulk_loader(None if args.manifest else args.image_dir, args.manifest, args.batch_size, **tune_args)
+    else:
+        image_cache_dir = None
+        if args.image_cache:
+            base_dir = Path(__file__).parent.parent.parent.parent
+            image_cache_dir = str(base_dir / "image_cache" if args.image_cache == 'default' else args.image_cache)
+        tune_training_loader(args.image_dir, args.annotation_dir, args.batch_size, image_cache_dir,
+                             shards=args.shards if args.workload == 'shards' else None, **tune_args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Bornes des histogrammes : progression géométrique de 1 µs à 1000 s (~5 % de précision)
+_BUCKET_RATIO = 1.1
+_BUCKET_BOUNDS = [1e-6 * _BUCKET_RATIO ** i
+                  for i in range(int(math.log(1e9) / math.log(_BUCKET_RATIO)) + 2)]
+
+# Contexte vide partagé : coût quasi nul quand l'instrumentation est désactivée
+_DISABLED = nullcontext()
+
+class LatencyHistogram:
+    """Histogramme de latences à buckets logarithmiques, de taille fixe."""
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(_BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estime le quantile q (entre 0 et 1) en secondes."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                if index >= len(_BUCKET_BOUNDS):
+                    return self.max
+                return min(_BUCKET_BOUNDS[index], self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': 1000 * self.total / self.count if self.count else 0.0,
+            'p50_ms': 1000 * self.quantile(0.50),
+            'p95_ms': 1000 * self.quantile(0.95),
+            'p99_ms': 1000 * self.quantile(0.99),
+            'max_ms': 1000 * self.max,
+        }
+
+class _StageTimer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self._record_function = None
+
+    def __enter__(self):
+        if self.metrics.profiling:
+            import torch
+            self._record_function = torch.profiler.record_function(self.name)
+            self._record_function.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        if self._record_function is not None:
+            self._record_function.__exit__(*exc)
+            self._record_function = None
+
+class StageMetrics:
+    """
+    Chronomètres par étape (decode, preprocess, normalize, forward, postprocess).
+
+    Usage:
+        with metrics.stage('forward'):
+            outputs = model(batch)
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.profiling = False
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """Contexte qui chronomètre l'étape name (sans effet si désactivé)."""
+        if not self.enabled:
+            return _DISABLED
+        return _StageTimer(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def snapshot(self):
+        """Résumé (nombre, moyenne, p50/p95/p99, max) de chaque étape."""
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in self._histograms.items()}
+
+    def to_prometheus(self, prefix="grappe"):
+        """Export au format texte Prometheus (histogrammes cumulés en secondes)."""
+        lines = [
+            f"# HELP {prefix}_stage_seconds Durée de chaque étape de prédiction",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(_BUCKET_BOUNDS, histogram.counts):
+                    cumulative += bucket_count
+                    # N'écrire que les buckets non vides pour garder une sortie compacte
+                    if bucket_count:
+                        lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound:.6g}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {histogram.total:.9f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path):
+        """Écrit le résumé des étapes dans un fichier JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+# Instance partagée par tout le chemin de prédiction (GRAPPE_METRICS=1 pour l'activer)
+metrics = StageMetrics(enabled=os.environ.get("GRAPPE_METRICS") == "1")
+
+def enable_metrics(enabled=True):
+    """Active ou désactive l'instrumentation globale."""
+    metrics.enabled = enabled
+
+@contextmanager
+def profile_run(trace_path, record_shapes=True):
+    """
+    Exécute un bloc sous torch.profiler et écrit une trace Chrome (chrome://tracing).
+
+    Les étapes chronométrées apparaissent comme sections nommées dans la trace.
+
+    Args:
+        trace_path (str): Fichier .json de la trace
+        record_shapes (bool): Enregistrer les dimensions des tenseurs
+    """
+    from torch.profiler import ProfilerActivity, profile
+
+    previous = metrics.enabled, metrics.profiling
+    metrics.enabled = metrics.profiling = True
+    try:
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=record_shapes) as prof:
+            yield prof
+    finally:
+        metrics.enabled, metrics.profiling = previous
+    prof.export_chrome_trace(str(trace_path))
+    print(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
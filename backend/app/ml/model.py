@@ -1,28 +1,124 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-import torchvision.models as models
-from torchvision import transforms
-from PIL import Image
+from .decode import INFERENCE_DECODE_SIZE, decode_image
+
+# Backbones disponibles : constructeur torchvision et poids ImageNet associés
+ARCHITECTURES = {
+    'resnet50': ('resnet50', 'ResNet50_Weights'),
+    'resnet18': ('resnet18', 'ResNet18_Weights'),
+    'mobilenet_v3_large': ('mobilenet_v3_large', 'MobileNet_V3_Large_Weights'),
+    'mobilenet_v3_small': ('mobilenet_v3_small', 'MobileNet_V3_Small_Weights'),
+}
+DEFAULT_ARCH = 'resnet50'
 
 class GrapeClassifier(nn.Module):
-    def __init__(self, num_classes=3):
+    def __init__(self, num_classes=3, pretrained=True, arch=DEFAULT_ARCH):
+        """
+        Args:
+            num_classes (int): Nombre de classes
+            pretrained (bool): Initialiser le backbone avec les poids ImageNet
+                (inutile si un checkpoint est chargé ensuite)
+            arch (str): Backbone utilisé (voir ARCHITECTURES)
+        """
         super(GrapeClassifier, self).__init__()
-        self.model = models.resnet50(pretrained=True)
-        num_ftrs = self.model.fc.in_features
-        self.model.fc = nn.Linear(num_ftrs, num_classes)
-        
-        # Configuration des transformations d'images
-        self.transform = transforms.Compose([
-            transforms.Resize(256),
-            transforms.CenterCrop(224),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                              std=[0.229, 0.224, 0.225])
-        ])
+        if arch not in ARCHITECTURES:
+            raise ValueError(f"Architecture inconnue: {arch} (choix: {', '.join(ARCHITECTURES)})")
+        self.arch = arch
+        # Import tardif : torchvision n'est chargé que si un modèle est construit
+        import torchvision.models as models
+        builder, weights_name = ARCHITECTURES[arch]
+        weights = getattr(models, weights_name).IMAGENET1K_V1 if pretrained else None
+        self.model = getattr(models, builder)(weights=weights)
+        # Remplacer la dernière couche linéaire par une tête à num_classes sorties
+        num_ftrs = self.classifier.in_features
+        if arch.startswith('resnet'):
+            self.model.fc = nn.Linear(num_ftrs, num_classes)
+        else:
+            self.model.classifier[-1] = nn.Linear(num_ftrs, num_classes)
+    
+    @property
+    def classifier(self):
+        """Dernière couche linéaire (tête de classification)."""
+        if self.arch.startswith('resnet'):
+            return self.model.fc
+        return self.model.classifier[-1]
+    
+    @property
+    def transform(self):
+        """Prétraitement d'inférence d'une image (même pipeline que le reste du projet)."""
+        from .preprocessing import transform
+        return transform
     
     def forward(self, x):
         return self.model(x)
+    
+    def forward_features(self, x):
+        """
+        Calcule les caractéristiques du backbone, juste avant la couche fc.
+        Args:
+            x (Tensor): Batch d'images prétraitées (N, 3, 224, 224)
+        Returns:
+            Tensor: Caractéristiques après pooling (N, 2048 pour le ResNet50)
+        """
+        m = self.model
+        if not self.arch.startswith('resnet'):
+            # MobileNetV3 : features, pooling puis le classifieur sans sa dernière couche
+            x = torch.flatten(m.avgpool(m.features(x)), 1)
+            return m.classifier[:-1](x)
+        return torch.flatten(m.avgpool(self.forward_feature_map(x)), 1)
+    
+    def forward_feature_map(self, x):
+        """
+        Carte de caractéristiques du ResNet, avant le pooling global.
+        Args:
+            x (Tensor): Batch d'images prétraitées (N, 3, H, W), de taille quelconque
+        Returns:
+            Tensor: Carte (N, 2048, ceil(H/32), ceil(W/32)) pour le ResNet50
+        """
+        if not self.arch.startswith('resnet'):
+            raise ValueError(f"Carte de caractéristiques disponible pour les ResNet uniquement, pas {self.arch}")
+        m = self.model
+        x = m.maxpool(m.relu(m.bn1(m.conv1(x))))
+        return m.layer4(m.layer3(m.layer2(m.layer1(x))))
+    
+    def dense_head(self):
+        """
+        Couche fc réécrite en convolution 1x1 (mêmes poids).
+        
+        Appliquée à la carte de forward_feature_map, elle donne les logits de chaque
+        cellule. Le pooling global et fc étant tous deux linéaires, la moyenne de ces
+        logits sur une fenêtre de 7x7 cellules est exactement fc appliquée au pooling
+        de ces mêmes caractéristiques. Ce n'est qu'une approximation du classement
+        d'un recadrage : calculées sur l'image entière, les caractéristiques d'une
+        fenêtre voient aussi le contexte autour d'elle, là où le recadrage ne voit
+        que le padding à zéro de ses bords (écart à dense.score_crops mesuré par
+        dense.benchmark_dense).
+        """
+        if not self.arch.startswith('resnet'):
+            # Le classifieur des MobileNet est un MLP : il ne commute pas avec le pooling
+            raise ValueError(f"Tête convolutive disponible pour les ResNet uniquement, pas {self.arch}")
+        fc = self.model.fc
+        conv = nn.Conv2d(fc.in_features, fc.out_features, kernel_size=1)
+        with torch.no_grad():
+            conv.weight.copy_(fc.weight.view(fc.out_features, fc.in_features, 1, 1))
+            conv.bias.copy_(fc.bias)
+        return conv.to(memory_format=torch.channels_last)
+    
+    def forward_dense(self, x, window=7):
+        """
+        Inférence dense : une passe du backbone sur toute l'image, puis la tête
+        appliquée à chaque fenêtre de window x window cellules (pas de 32 pixels).
+        Args:
+            x (Tensor): Batch d'images prétraitées (N, 3, H, W), de taille quelconque
+            window (int): Taille de fenêtre en cellules (7 : recadrage de 224 pixels)
+        Returns:
+            Tensor: Logits (N, num_classes, h, w), une position par fenêtre
+        """
+        logits = self.dense_head()(self.forward_feature_map(x))
+        # Image plus petite que la fenêtre : pooling global, comme forward
+        kernel = (min(window, logits.shape[-2]), min(window, logits.shape[-1]))
+        return F.avg_pool2d(logits, kernel, stride=1)
         
     def predict(self, image_path):
         """
@@ -33,7 +129,7 @@ class GrapeClassifier(nn.Module):
             int: Classe prédite (0, 1 ou 2)
         """
         self.eval()
-        image = Image.open(image_path).convert('RGB')
+        image = decode_image(image_path, INFERENCE_DECODE_SIZE)
         image = self.transform(image).unsqueeze(0)
         
         with torch.no_grad():
@@ -53,6 +149,9 @@ class GrapeClassifier(nn.Module):
         """
         self.train()
         for epoch in range(num_epochs):
+            # Sampler à mélange reproductible (graine + époque) : nouvel ordre à chaque époque
+            if hasattr(train_loader.sampler, 'set_epoch'):
+                train_loader.sampler.set_epoch(epoch)
             running_loss = 0.0
             for inputs, labels in train_loader:
                 optimizer.zero_grad()
@@ -70,7 +169,12 @@ class GrapeClassifier(nn.Module):
         Args:
             path (str): Chemin où sauvegarder le modèle
         """
-        torch.save(self.state_dict(), path)
+        # Les métadonnées permettent de reconstruire la bonne architecture au chargement
+        torch.save({
+            'arch': self.arch,
+            'num_classes': self.classifier.out_features,
+            'state_dict': self.state_dict(),
+        }, path)
     
     def load_model(self, path):
         """
@@ -78,17 +182,77 @@ class GrapeClassifier(nn.Module):
         Args:
             path (str): Chemin vers le modèle à charger
         """
-        self.load_state_dict(torch.load(path))
+        self.load_state_dict(load_checkpoint(path))
+
+def read_checkpoint(path, mmap=True):
+    """
+    Lit un checkpoint sans exécuter de code arbitraire (weights_only).
+    
+    Avec mmap, les tenseurs restent adossés au fichier et ne sont lus qu'à l'usage.
+    Les anciens checkpoints (state_dict seul) sont des ResNet50.
+    
+    Args:
+        path (str): Chemin vers le checkpoint
+        mmap (bool): Mapper le fichier en mémoire plutôt que de le lire entièrement
+    
+    Returns:
+        tuple: (state_dict, métadonnées {'arch', 'num_classes'})
+    """
+    checkpoint = None
+    if mmap:
+        try:
+            checkpoint = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+        except (TypeError, RuntimeError):
+            # torch < 2.1 ou checkpoint à l'ancien format : lecture classique
+            pass
+    if checkpoint is None:
+        checkpoint = torch.load(path, map_location='cpu', weights_only=True)
+    
+    if 'state_dict' in checkpoint:
+        state_dict = checkpoint['state_dict']
+        metadata = {k: v for k, v in checkpoint.items() if k != 'state_dict'}
+    else:
+        state_dict = checkpoint
+        metadata = {'arch': DEFAULT_ARCH, 'num_classes': state_dict['model.fc.weight'].shape[0]}
+    return state_dict, metadata
+
+def load_checkpoint(path, mmap=True):
+    """
+    Lit le state_dict d'un checkpoint (voir read_checkpoint).
+    
+    Args:
+        path (str): Chemin vers le checkpoint
+        mmap (bool): Mapper le fichier en mémoire plutôt que de le lire entièrement
+    """
+    return read_checkpoint(path, mmap)[0]
 
 def create_model():
     """Crée et initialise le modèle."""
     model = GrapeClassifier(3)
     return model
 
-def load_model(path):
-    """Charge un modèle sauvegardé."""
-    model = create_model()
-    model.load_state_dict(torch.load(path))
+def load_model(path, mmap=True):
+    """
+    Charge un modèle sauvegardé pour l'inférence.
+    
+    L'architecture (lue dans les métadonnées du checkpoint) est construite sur le
+    device 'meta' (ni poids ImageNet, ni initialisation aléatoire) puis les tenseurs
+    du checkpoint sont assignés directement.
+    
+    Args:
+        path (str): Chemin vers le checkpoint
+        mmap (bool): Mapper le checkpoint en mémoire
+    """
+    state_dict, metadata = read_checkpoint(path, mmap=mmap)
+    num_classes, arch = metadata['num_classes'], metadata['arch']
+    try:
+        with torch.device('meta'):
+            model = GrapeClassifier(num_classes, pretrained=False, arch=arch)
+        model.load_state_dict(state_dict, assign=True)
+    except TypeError:
+        # torch < 2.1 : pas de paramètre assign
+        model = GrapeClassifier(num_classes, pretrained=False, arch=arch)
+        model.load_state_dict(state_dict)
     model.eval()
     return model
 
@@ -1,59 +1,129 @@
 import torch
-from pathlib import Path
-from PIL import Image
-from torchvision import transforms
-from .model import GrapeClassifier
+from .decode import INFERENCE_DECODE_SIZE, decode_image
+from .metrics import metrics
+from .model import load_model
+from .prediction_cache import as_image_source, read_image_bytes
+from .preprocessing import eval_geometry, normalize_batch
 
 def load_trained_model(model_path="grape_classifier.pth"):
-    """Charge le modèle entraîné."""
-    model = GrapeClassifier(num_classes=3)
-    model.load_state_dict(torch.load(model_path))
-    model.eval()
-    return model
+    """Charge le modèle entraîné (hors ligne, sans poids pré-entraînés)."""
+    return load_model(model_path)
 
-def predict_image(model, image_input):
+# Noms des classes prédites
+CLASS_NAMES = {
+    0: "Non mature",
+    1: "En maturation",
+    2: "Mature"
+}
+
+def get_inference_transform():
+    """Géométrie d'inférence par image (Resize(256) + CenterCrop(224)) -> tensor uint8.
+
+    La normalisation est faite ensuite sur le batch entier (preprocessing.normalize_batch).
+    """
+    return eval_geometry
+
+def load_image(image_input):
+    """Charge une image en RGB, décodée directement près de la taille d'inférence.
+    Args:
+        image_input: Chemin vers l'image, fichier uploadé (objet fichier) ou image PIL
+    """
+    return decode_image(image_input, INFERENCE_DECODE_SIZE)
+
+def format_predictions(probabilities):
+    """Convertit un batch de probabilités en dictionnaires de résultats.
+    Args:
+        probabilities: Tensor (N, num_classes) issu du softmax
+    Returns:
+        list: Un dictionnaire de résultat par image
+    """
+    confidences, predicted = torch.max(probabilities, 1)
+    results = []
+    for probs, class_id, confidence in zip(probabilities.tolist(), predicted.tolist(), confidences.tolist()):
+        results.append({
+            'predicted_class': CLASS_NAMES[class_id],
+            'confidence': confidence,
+            'all_probabilities': {
+                CLASS_NAMES[i]: prob
+                for i, prob in enumerate(probs)
+            }
+        })
+    return results
+
+def _run_batch(model, inference_transform, pending, results, cache):
+    """Prétraite et classe un batch d'images, puis range les résultats à leur position."""
+    tensors = []
+    for _, source, _ in pending:
+        with metrics.stage('decode'):
+            image = load_image(source)
+        with metrics.stage('preprocess'):
+            tensors.append(inference_transform(image))
+    with metrics.stage('normalize'):
+        image_tensor = normalize_batch(torch.stack(tensors))
+
+    # Faire la prédiction sur tout le batch en une seule passe
+    with torch.no_grad():
+        with metrics.stage('forward'):
+            outputs = model(image_tensor)
+        with metrics.stage('postprocess'):
+            probabilities = torch.nn.functional.softmax(outputs, dim=1)
+            batch_results = format_predictions(probabilities)
+
+    for (index, _, key), result in zip(pending, batch_results):
+        results[index] = result
+        if cache is not None:
+            cache.put(key, result)
+
+def predict_images(model, inputs, batch_size=16, cache=None):
+    """Fait des prédictions sur plusieurs images en les regroupant par batchs.
+    Args:
+        model: Le modèle entraîné
+        inputs: Itérable de chemins, fichiers uploadés ou images PIL
+        batch_size (int): Nombre d'images par passe avant du modèle
+        cache (PredictionCache, optional): Cache des prédictions déjà calculées ;
+            seules les images absentes du cache passent dans le modèle
+    Returns:
+        list: Un dictionnaire de résultat par image, dans l'ordre des entrées
+    """
+    # Modèles avec leur propre boucle de batchs (ex: cascade.CascadeModel)
+    if hasattr(model, 'predict_images'):
+        return model.predict_images(inputs, batch_size=batch_size, cache=cache)
+
+    if batch_size < 1:
+        raise ValueError("batch_size doit être supérieur ou égal à 1")
+
+    inference_transform = get_inference_transform()
+    results = []
+    pending = []
+    for index, image_input in enumerate(inputs):
+        results.append(None)
+        source, key = image_input, None
+        if cache is not None:
+            data = read_image_bytes(image_input)
+            key = cache.key(data)
+            cached = cache.get(key)
+            if cached is not None:
+                results[index] = cached
+                continue
+            source = as_image_source(image_input, data)
+
+        pending.append((index, source, key))
+        if len(pending) == batch_size:
+            _run_batch(model, inference_transform, pending, results, cache)
+            pending = []
+
+    if pending:
+        _run_batch(model, inference_transform, pending, results, cache)
+    return results
+
+def predict_image(model, image_input, cache=None):
     """Fait une prédiction sur une image.
     Args:
         model: Le modèle entraîné
         image_input: Soit un chemin vers l'image, soit un fichier uploadé
+        cache (PredictionCache, optional): Cache des prédictions
     """
-    # Charger l'image selon le type d'input
-    if isinstance(image_input, str):
-        image = Image.open(image_input).convert('RGB')
-    else:
-        image = Image.open(image_input).convert('RGB')
-    
-    # Prétraiter l'image
-    transform = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                          std=[0.229, 0.224, 0.225])
-    ])
-    image_tensor = transform(image).unsqueeze(0)
-    
-    # Faire la prédiction
-    with torch.no_grad():
-        outputs = model(image_tensor)
-        _, predicted = torch.max(outputs, 1)
-        probabilities = torch.nn.functional.softmax(outputs, dim=1)
-    
-    # Convertir les labels en noms de classes
-    class_names = {
-        0: "Non mature",
-        1: "En maturation",
-        2: "Mature"
-    }
-    
-    return {
-        'predicted_class': class_names[predicted.item()],
-        'confidence': probabilities[0][predicted.item()].item(),
-        'all_probabilities': {
-            class_names[i]: prob.item() 
-            for i, prob in enumerate(probabilities[0])
-        }
-    }
+    return predict_images(model, [image_input], batch_size=1, cache=cache)[0]
 
 def main():
     # Chemin vers le modèle et l'image à tester
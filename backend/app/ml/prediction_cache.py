@@ -0,0 +1,226 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image
+
+def checkpoint_identity(path):
+    """
+    Identifie un checkpoint par l'empreinte SHA-256 de son contenu.
+
+    Args:
+        path (str): Chemin vers le fichier du modèle
+
+    Returns:
+        str: Empreinte hexadécimale
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_image_bytes(image_input):
+    """
+    Lit le contenu brut d'une image, quel que soit le type d'entrée.
+
+    Les fichiers uploadés sont rembobinés pour pouvoir être relus ensuite.
+
+    Args:
+        image_input: Chemin, fichier uploadé (objet fichier) ou image PIL
+
+    Returns:
+        bytes: Contenu servant à calculer la clé de cache
+    """
+    if isinstance(image_input, Image.Image):
+        header = f"{image_input.mode}:{image_input.size}".encode()
+        return header + image_input.tobytes()
+    if isinstance(image_input, (str, Path)):
+        with open(image_input, 'rb') as f:
+            return f.read()
+    if hasattr(image_input, 'getvalue'):
+        return image_input.getvalue()
+    position = image_input.tell()
+    data = image_input.read()
+    image_input.seek(position)
+    return data
+
+def as_image_source(image_input, data):
+    """Renvoie une source décodable sans relire le disque quand les octets sont déjà en mémoire."""
+    if isinstance(image_input, Image.Image):
+        return image_input
+    return io.BytesIO(data)
+
+class PredictionCache:
+    """
+    Cache des prédictions indexé par le contenu de l'image et l'identité du modèle.
+
+    Deux niveaux : un LRU en mémoire limité en nombre d'entrées, et une base SQLite
+    optionnelle qui survit aux redémarrages.
+    """
+
+    def __init__(self, model_id, max_entries=1024, disk_path=None, max_disk_entries=100000):
+        """
+        Args:
+            model_id (str): Identité du modèle (voir checkpoint_identity)
+            max_entries (int): Nombre maximal d'entrées en mémoire
+            disk_path (str, optional): Fichier SQLite du cache persistant
+            max_disk_entries (int): Nombre maximal d'entrées sur disque
+        """
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(str(disk_path), check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, result TEXT NOT NULL)"
+            )
+            self._disk.commit()
+            self._disk_writes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, data):
+        """Clé de cache : empreinte du modèle + contenu de l'image."""
+        digest = hashlib.sha256(self.model_id.encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    @property
+    def has_disk(self):
+        return self._disk is not None
+
+    def get_memory(self, key):
+        """
+        Renvoie le résultat s'il est en mémoire, sans accès disque (sûr dans une boucle asyncio).
+
+        Un échec n'est pas compté : get() consulte ensuite le disque.
+        """
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            return result
+
+    def get(self, key):
+        """Renvoie le résultat en cache (mémoire puis disque), ou None."""
+        result = self.get_memory(key)
+        if result is not None:
+            return result
+        if self._disk is not None:
+            # Verrou séparé : une requête SQLite ne bloque pas les accès à la mémoire
+            with self._disk_lock:
+                row = self._disk.execute(
+                    "SELECT result FROM predictions WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                result = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, result)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return result
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Ajoute un résultat dans les deux niveaux du cache."""
+        self.put_many([(key, result)])
+
+    def put_many(self, items, disk=True):
+        """
+        Ajoute des résultats en mémoire et, si disk, sur disque en une seule transaction.
+
+        Args:
+            items (list): Couples (clé, résultat)
+            disk (bool): Écrire aussi sur disque (sinon voir write_disk)
+        """
+        with self._lock:
+            for key, result in items:
+                self._remember(key, result)
+        if disk:
+            self.write_disk(items)
+
+    def write_disk(self, items):
+        """Écrit des résultats dans la base SQLite (un seul commit), sans effet sans disque."""
+        if self._disk is None or not items:
+            return
+        with self._disk_lock:
+            self._disk.executemany(
+                "INSERT OR REPLACE INTO predictions (key, result) VALUES (?, ?)",
+                [(key, json.dumps(result)) for key, result in items]
+            )
+            self._disk.commit()
+            previous = self._disk_writes
+            self._disk_writes += len(items)
+            if self._disk_writes // 1000 != previous // 1000:
+                self._prune_disk()
+
+    def _remember(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self):
+        # Supprimer les entrées les plus anciennes au-delà de la limite
+        self._disk.execute(
+            "DELETE FROM predictions WHERE rowid IN ("
+            "SELECT rowid FROM predictions ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+        self._disk.commit()
+
+    def stats(self):
+        """Compteurs de succès/échecs pour dimensionner le cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'max_entries': self.max_entries,
+            }
+        if self._disk is not None:
+            with self._disk_lock:
+                stats['disk_entries'] = self._disk.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        return stats
+
+    def close(self):
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.close()
+                self._disk = None
+
+def create_prediction_cache(model_path, max_entries=1024, disk_path=None, model_id=None):
+    """
+    Crée un cache lié au checkpoint donné.
+
+    Args:
+        model_path (str): Checkpoint dont l'empreinte identifie le modèle
+        max_entries (int): Nombre maximal d'entrées en mémoire
+        disk_path (str, optional): Fichier SQLite du cache persistant
+        model_id (str, optional): Identité déjà calculée (ex: backends.backend_identity),
+            à la place de l'empreinte de model_path
+
+    Returns:
+        PredictionCache: Le cache
+    """
+    if disk_path:
+        os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+    return PredictionCache(model_id or checkpoint_identity(model_path), max_entries, disk_path)
@@ -1,47 +1,254 @@
+import math
 import torch
-from torchvision import transforms
+import torch.nn.functional as F
 from PIL import Image
 import numpy as np
+from .decode import INFERENCE_DECODE_SIZE, decode_image
 
-# Définition des transformations pour les images
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),  # Redimensionner à 224x224
-    transforms.ToTensor(),  # Convertir en tensor
-    transforms.Normalize(
-        mean=[0.485, 0.456, 0.406],  # Moyennes ImageNet
-        std=[0.229, 0.224, 0.225]    # Écarts-types ImageNet
-    )
-])
+# Statistiques ImageNet
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+# Géométrie commune à l'entraînement et à l'inférence : Resize(256) puis CenterCrop(224)
+RESIZE_SIZE = 256
+CROP_SIZE = 224
+
+# Normalisation fusionnée : (x / 255 - mean) / std == x * scale + bias
+_NORM_SCALE = torch.tensor([1.0 / (255.0 * s) for s in STD]).view(1, 3, 1, 1)
+_NORM_BIAS = torch.tensor([-m / s for m, s in zip(MEAN, STD)]).view(1, 3, 1, 1)
+
+def to_uint8_tensor(image):
+    """
+    Convertit une image en tensor uint8 (3, H, W).
+
+    Args:
+        image: Image PIL, tableau (H, W, 3) uint8 (ex: vue du cache d'images) ou tensor (3, H, W)
+
+    Returns:
+        Tensor: Image en uint8, sans copie pour les tableaux et les tensors
+    """
+    if isinstance(image, torch.Tensor):
+        return image
+    if isinstance(image, Image.Image):
+        image = np.array(image.convert('RGB'))
+    return torch.from_numpy(image).permute(2, 0, 1)
+
+def _resize_uint8(image, size):
+    """Redimensionne (bilinéaire, antialiasé) un tensor uint8 (3, h, w) en (3, size, size) ou (3, *size)."""
+    batch = image.unsqueeze(0)
+    size = (size, size) if isinstance(size, int) else tuple(size)
+    try:
+        resized = F.interpolate(batch, size=size, mode='bilinear',
+                                align_corners=False, antialias=True)
+    except RuntimeError:
+        # Anciennes versions de torch : pas de chemin uint8, passage par float
+        resized = F.interpolate(batch.float(), size=size, mode='bilinear',
+                                align_corners=False, antialias=True)
+        resized = resized.round_().clamp_(0, 255).to(torch.uint8)
+    return resized[0]
+
+def center_crop_resize(image, resize_size=RESIZE_SIZE, crop_size=CROP_SIZE):
+    """
+    Équivalent de Resize(resize_size) + CenterCrop(crop_size) en une seule passe.
+
+    Le recadrage est fait d'abord (vue, sans copie) sur l'image source, puis seule
+    la zone utile est redimensionnée.
+
+    Args:
+        image: Image PIL, tableau (H, W, 3) ou tensor uint8 (3, H, W)
+        resize_size (int): Plus petit côté après redimensionnement
+        crop_size (int): Côté du recadrage central
+
+    Returns:
+        Tensor: Image uint8 (3, crop_size, crop_size)
+    """
+    image = to_uint8_tensor(image)
+    _, height, width = image.shape
+    side = max(1, min(height, width, round(crop_size * min(height, width) / resize_size)))
+    top = (height - side) // 2
+    left = (width - side) // 2
+    return _resize_uint8(image[:, top:top + side, left:left + side], crop_size)
+
+def random_resized_crop(image, size=CROP_SIZE, scale=(0.08, 1.0), ratio=(3 / 4, 4 / 3)):
+    """
+    Équivalent de RandomResizedCrop(size) sur un tensor uint8.
+
+    Args:
+        image: Image PIL, tableau (H, W, 3) ou tensor uint8 (3, H, W)
+        size (int): Côté de l'image produite
+        scale (tuple): Fraction de la surface conservée
+        ratio (tuple): Rapport largeur/hauteur du recadrage
+
+    Returns:
+        Tensor: Image uint8 (3, size, size)
+    """
+    image = to_uint8_tensor(image)
+    _, height, width = image.shape
+    area = height * width
+    log_ratio = (math.log(ratio[0]), math.log(ratio[1]))
+
+    for _ in range(10):
+        target_area = area * torch.empty(1).uniform_(scale[0], scale[1]).item()
+        aspect = math.exp(torch.empty(1).uniform_(log_ratio[0], log_ratio[1]).item())
+        w = int(round(math.sqrt(target_area * aspect)))
+        h = int(round(math.sqrt(target_area / aspect)))
+        if 0 < w <= width and 0 < h <= height:
+            top = torch.randint(0, height - h + 1, (1,)).item()
+            left = torch.randint(0, width - w + 1, (1,)).item()
+            break
+    else:
+        # Repli : recadrage central au ratio le plus proche
+        in_ratio = width / height
+        if in_ratio < ratio[0]:
+            w, h = width, int(round(width / ratio[0]))
+        elif in_ratio > ratio[1]:
+            w, h = int(round(height * ratio[1])), height
+        else:
+            w, h = width, height
+        top, left = (height - h) // 2, (width - w) // 2
+
+    return _resize_uint8(image[:, top:top + h, left:left + w], size)
+
+def augment_batch(batch, rotation=10.0, brightness=0.2, contrast=0.2):
+    """
+    Augmentations aléatoires appliquées à tout le batch en une fois.
+
+    Équivalent vectorisé de RandomHorizontalFlip, RandomRotation(rotation) et
+    ColorJitter(brightness, contrast), avec des paramètres tirés pour chaque image.
+
+    Args:
+        batch (Tensor): Batch uint8 ou float (N, 3, H, W), valeurs dans [0, 255]
+
+    Returns:
+        Tensor: Batch float32 (N, 3, H, W), valeurs dans [0, 255]
+    """
+    batch = batch.float()
+    n = batch.shape[0]
+
+    # Symétrie horizontale pour la moitié des images
+    flip = torch.rand(n) < 0.5
+    batch = torch.where(flip.view(n, 1, 1, 1), batch.flip(-1), batch)
+
+    # Rotation : une matrice affine par image, un seul grid_sample pour tout le batch
+    if rotation:
+        angles = torch.empty(n).uniform_(-rotation, rotation) * (math.pi / 180)
+        cos, sin = torch.cos(angles), torch.sin(angles)
+        zeros = torch.zeros(n)
+        theta = torch.stack([
+            torch.stack([cos, -sin, zeros], dim=1),
+            torch.stack([sin, cos, zeros], dim=1),
+        ], dim=1)
+        grid = F.affine_grid(theta, list(batch.shape), align_corners=False)
+        batch = F.grid_sample(batch, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+    # Luminosité puis contraste, facteurs tirés par image
+    if brightness:
+        factors = torch.empty(n, 1, 1, 1).uniform_(1 - brightness, 1 + brightness)
+        batch = (batch * factors).clamp_(0, 255)
+    if contrast:
+        factors = torch.empty(n, 1, 1, 1).uniform_(1 - contrast, 1 + contrast)
+        gray = (0.299 * batch[:, 0] + 0.587 * batch[:, 1] + 0.114 * batch[:, 2])
+        mean = gray.mean(dim=(1, 2)).view(n, 1, 1, 1)
+        batch = ((batch - mean) * factors + mean).clamp_(0, 255)
+
+    return batch
+
+def normalize_batch(batch):
+    """
+    Normalisation ImageNet fusionnée (une seule opération) et format channels_last.
+
+    Args:
+        batch (Tensor): Batch uint8 ou float (N, 3, H, W), valeurs dans [0, 255]
+
+    Returns:
+        Tensor: Batch float32 normalisé, en mémoire channels_last
+    """
+    batch = batch.contiguous(memory_format=torch.channels_last)
+    return torch.addcmul(_NORM_BIAS, batch.float(), _NORM_SCALE)
+
+def preprocess_batch(images, train=False):
+    """
+    Prétraite une liste d'images en un batch prêt pour le modèle.
+
+    Args:
+        images (list): Images PIL, tableaux (H, W, 3) ou tensors uint8 (3, H, W)
+        train (bool): Appliquer les recadrages et augmentations aléatoires
+
+    Returns:
+        Tensor: Batch float32 normalisé (N, 3, 224, 224), channels_last
+    """
+    geometry = random_resized_crop if train else center_crop_resize
+    batch = torch.stack([geometry(image) for image in images])
+    if train:
+        batch = augment_batch(batch)
+    return normalize_batch(batch)
+
+class EvalGeometry:
+    """Transformation par image de validation/inférence : tensor uint8 (3, 224, 224)."""
+
+    def __call__(self, image):
+        return center_crop_resize(image)
+
+class TrainGeometry:
+    """Transformation par image d'entraînement : recadrage aléatoire, tensor uint8 (3, 224, 224)."""
+
+    def __call__(self, image):
+        return random_resized_crop(image)
+
+class BatchCollate:
+    """
+    collate_fn du DataLoader : empile les images uint8 puis augmente (entraînement)
+    et normalise tout le batch dans le worker.
+    """
+
+    def __init__(self, train=False):
+        self.train = train
+
+    def __call__(self, items):
+        images = torch.stack([image for image, _ in items])
+        labels = torch.tensor([label for _, label in items])
+        if self.train:
+            images = augment_batch(images)
+        return normalize_batch(images), labels
+
+eval_geometry = EvalGeometry()
+train_geometry = TrainGeometry()
+eval_collate = BatchCollate(train=False)
+train_collate = BatchCollate(train=True)
+
+def transform(image):
+    """
+    Prétraitement d'inférence d'une seule image.
+
+    Returns:
+        Tensor: Image float32 normalisée (3, 224, 224)
+    """
+    return preprocess_batch([image])[0]
 
 def preprocess_image(image_path):
     """
     Prétraite une image pour l'inférence.
-    
+
     Args:
         image_path: Chemin vers l'image
-        
+
     Returns:
         Tensor PyTorch normalisé (1, 3, 224, 224)
     """
-    # Charger l'image
-    image = Image.open(image_path).convert('RGB')
-    
-    # Appliquer les transformations
-    image_tensor = transform(image)
-    
-    # Ajouter une dimension batch
-    image_tensor = image_tensor.unsqueeze(0)
-    
-    return image_tensor
+    # Charger l'image (décodage JPEG réduit, au plus près de la taille utile)
+    image = decode_image(image_path, INFERENCE_DECODE_SIZE)
+
+    # Appliquer le même prétraitement que partout ailleurs (batch de taille 1)
+    return preprocess_batch([image])
 
 def get_prediction_text(class_id, probabilities):
     """
     Convertit la prédiction en texte explicatif.
-    
+
     Args:
         class_id: ID de la classe prédite
         probabilities: Liste des probabilités pour chaque classe
-        
+
     Returns:
         Dict avec la classe prédite et les probabilités
     """
@@ -50,12 +257,12 @@ def get_prediction_text(class_id, probabilities):
         1: "Grappe en maturation",
         2: "Grappe mature"
     }
-    
+
     # Formater les probabilités en pourcentages
-    probs_percent = {classes[i]: f"{prob * 100:.1f}%" 
+    probs_percent = {classes[i]: f"{prob * 100:.1f}%"
                     for i, prob in enumerate(probabilities)}
-    
+
     return {
         "prediction": classes[class_id],
         "probabilities": probs_percent
-    } 
\ No newline at end of file
+    }
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import io
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List
+
+import torch
+
+from .metrics import enable_metrics, metrics
+from .backends import BACKENDS, DEFAULT_PATHS, backend_identity, load_backend
+from .prediction_cache import create_prediction_cache
+from .predict import format_predictions, get_inference_transform, load_image
+from .preprocessing import normalize_batch
+
+class DynamicBatcher:
+    """
+    Regroupe les requêtes concurrentes en micro-batchs pour le modèle.
+
+    Un batch part dès qu'il atteint max_batch_size images, ou max_wait_ms après
+    l'arrivée de sa première image. Le modèle tourne dans un exécuteur dédié
+    (un seul thread) pour ne jamais bloquer la boucle asyncio ; le niveau disque
+    du cache (SQLite) a lui aussi son propre thread, et ses écritures sont
+    regroupées en une transaction par batch du modèle.
+    """
+
+    def __init__(self, model, max_batch_size=16, max_wait_ms=10, decode_workers=4, cache=None):
+        """
+        Args:
+            model: Modèle ou backend (batch prétraité -> logits)
+            max_batch_size (int): Taille maximale d'un batch
+            max_wait_ms (float): Attente maximale pour compléter un batch
+            decode_workers (int): Threads de décodage/prétraitement des images
+            cache (PredictionCache, optional): Cache consulté avant tout décodage
+        """
+        self.model = model
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.transform = get_inference_transform()
+        self.model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self.decode_executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+        self.cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache")
+        self.queue = None
+        self._task = None
+
+        # Statistiques
+        self.batch_sizes = Counter()
+        self.requests = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.inference_seconds = 0.0
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.model_executor.shutdown(wait=False)
+        self.decode_executor.shutdown(wait=False)
+        # Laisser partir les dernières écritures du cache
+        self.cache_executor.shutdown(wait=True)
+
+    def _preprocess(self, data):
+        with metrics.stage('decode'):
+            image = load_image(io.BytesIO(data))
+        with metrics.stage('preprocess'):
+            return self.transform(image)
+
+    def _infer(self, tensors):
+        with metrics.stage('normalize'):
+            batch = normalize_batch(torch.stack(tensors))
+        with torch.no_grad():
+            with metrics.stage('forward'):
+                outputs = self.model(batch)
+            return torch.nn.functional.softmax(outputs.float(), dim=1)
+
+    async def submit(self, data):
+        """
+        Décode une image et attend sa prédiction.
+
+        Args:
+            data (bytes): Contenu du fichier image
+
+        Returns:
+            dict: Même résultat que predict_image
+        """
+        loop = asyncio.get_running_loop()
+        self.requests += 1
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(data)
+            # Mémoire dans la boucle, disque (SQLite) dans le thread du cache
+            cached = self.cache.get_memory(key)
+            if cached is None:
+                if self.cache.has_disk:
+                    cached = await loop.run_in_executor(self.cache_executor, self.cache.get, key)
+                else:
+                    cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        image_tensor = await loop.run_in_executor(self.decode_executor, self._preprocess, data)
+        future = loop.create_future()
+        await self.queue.put((image_tensor, future, key))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await future
+
+    async def _collect(self):
+        """Attend une première image puis complète le batch jusqu'à la limite de taille ou de temps."""
+        loop = asyncio.get_running_loop()
+        items = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(items) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            tensors = [tensor for tensor, _, _ in items]
+            futures = [future for _, future, _ in items]
+            start = time.perf_counter()
+            try:
+                probabilities = await loop.run_in_executor(
+                    self.model_executor, self._infer, tensors
+                )
+                with metrics.stage('postprocess'):
+                    results = format_predictions(probabilities)
+            except Exception as e:
+                self.errors += len(items)
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.inference_seconds += time.perf_counter() - start
+            self.batch_sizes[len(items)] += 1
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
+            if self.cache is not None:
+                cached = [(key, result) for (_, _, key), result in zip(items, results)]
+                self.cache.put_many(cached, disk=False)
+                # Un seul commit par batch, sans attendre le disque pour le batch suivant
+                if self.cache.has_disk:
+                    loop.run_in_executor(self.cache_executor, self.cache.write_disk, cached)
+
+    def stats(self):
+        """Profondeur de file et statistiques de taille de batch."""
+        num_batches = sum(self.batch_sizes.values())
+        num_images = sum(size * count for size, count in self.batch_sizes.items())
+        stats = {
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'requests': self.requests,
+            'errors': self.errors,
+            'batches': num_batches,
+            'images': num_images,
+            'mean_batch_size': num_images / num_batches if num_batches else 0.0,
+            'batch_size_histogram': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            'mean_inference_ms_per_batch': 1000 * self.inference_seconds / num_batches if num_batches else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        if hasattr(self.model, 'stats'):
+            # Part d'images escaladées et coût moyen de la cascade
+            stats['model'] = self.model.stats()
+        return stats
+
+def create_app(model, max_batch_size=16, max_wait_ms=10, decode_workers=4, cache=None):
+    """
+    Crée l'application HTTP d'inférence.
+
+    Args:
+        model: Modèle ou backend (batch prétraité -> logits)
+        max_batch_size (int): Taille maximale d'un micro-batch
+        max_wait_ms (float): Attente maximale pour compléter un micro-batch
+        decode_workers (int): Threads de décodage des images
+        cache (PredictionCache, optional): Cache des prédictions
+
+    Returns:
+        FastAPI: L'application
+    """
+    from fastapi import FastAPI, File, HTTPException, UploadFile
+    from fastapi.responses import PlainTextResponse
+    from PIL import UnidentifiedImageError
+
+    batcher = DynamicBatcher(model, max_batch_size, max_wait_ms, decode_workers, cache)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await batcher.start()
+        yield
+        await batcher.stop()
+
+    app = FastAPI(title="Classificateur de grappes de raisin", lifespan=lifespan)
+    app.state.batcher = batcher
+
+    async def classify(upload):
+        try:
+            return await batcher.submit(await upload.read())
+        except UnidentifiedImageError:
+            raise HTTPException(status_code=400, detail=f"Image illisible: {upload.filename}")
+
+    @app.post("/predict")
+    async def predict(file: UploadFile = File(...)):
+        return await classify(file)
+
+    @app.post("/predict/batch")
+    async def predict_batch(files: List[UploadFile] = File(...)):
+        return await asyncio.gather(*(classify(f) for f in files))
+
+    @app.get("/stats")
+    async def stats():
+        # Le comptage des entrées du cache disque passe par le thread du cache
+        return await asyncio.get_running_loop().run_in_executor(batcher.cache_executor, batcher.stats)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def stage_metrics():
+        # Latences par étape au format Prometheus (serveur lancé avec --metrics)
+        return metrics.to_prometheus()
+
+    @app.get("/metrics.json")
+    async def stage_metrics_json():
+        return metrics.snapshot()
+
+    @app.get("/health")
+    async def health():
+        return {'status': 'ok'}
+
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur HTTP d'inférence avec regroupement dynamique des requêtes")
+    parser.add_argument('--model', default=None, help="Chemin vers le modèle (artefact par défaut du backend sinon)")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='eager', help="Backend d'inférence")
+    parser.add_argument('--host', default="127.0.0.1", help="Adresse d'écoute")
+    parser.add_argument('--port', type=int, default=8000, help="Port d'écoute")
+    parser.add_argument('--max-batch-size', type=int, default=16, help="Taille maximale d'un micro-batch")
+    parser.add_argument('--max-wait-ms', type=float, default=10, help="Attente maximale pour compléter un batch")
+    parser.add_argument('--decode-workers', type=int, default=4, help="Threads de décodage des images")
+    parser.add_argument('--metrics', action='store_true', help="Chronométrer chaque étape (exposé sur /metrics)")
+    parser.add_argument('--cache-size', type=int, default=1024, help="Entrées du cache de prédictions en mémoire (0 pour désactiver)")
+    parser.add_argument('--cache-db', default=None, help="Fichier SQLite du cache de prédictions persistant")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    import uvicorn
+
+    args = parse_args(argv)
+    if args.metrics:
+        enable_metrics()
+    print("Chargement du modèle...")
+    model = load_backend(args.backend, args.model)
+    cache = None
+    if args.cache_size > 0:
+        model_path = args.model or DEFAULT_PATHS[args.backend]
+        # Cascade : identité tirée des deux modèles et du seuil, pas du seul fichier JSON
+        cache = create_prediction_cache(model_path, args.cache_size, args.cache_db,
+                                        model_id=backend_identity(args.backend, model_path))
+    app = create_app(model, args.max_batch_size, args.max_wait_ms, args.decode_workers, cache)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
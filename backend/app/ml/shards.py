@@ -0,0 +1,240 @@
+import argparse
+import io
+import json
+import os
+import random
+import tarfile
+from pathlib import Path
+
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from .dataset import load_image_table
+from .decode import INFERENCE_DECODE_SIZE, TRAIN_DECODE_SIZE, decode_image
+from .distributed import get_rank, get_world_size
+from .loader_tuning import loader_options
+from .preprocessing import eval_collate, eval_geometry, train_collate, train_geometry
+
+SPLITS = {'train': 'mimc_train_images.json', 'valid': 'mimc_valid_images.json'}
+
+# Lecture séquentielle par gros blocs
+_READ_BUFFER = 8 << 20
+
+def _index_path(shard_dir, split):
+    return Path(shard_dir) / f"{split}-index.json"
+
+def _add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+    return info
+
+def pack_shards(image_dir, annotation_file, output_dir, split, shard_size_mb=256, seed=0):
+    """
+    Regroupe les images d'un split en grosses archives tar séquentielles.
+
+    Chaque image est copiée telle quelle (sans ré-encodage) sous le nom
+    <numéro>.<extension>, précédée de son label dans <numéro>.cls. Les images sont
+    mélangées une fois avant l'écriture pour que chaque archive contienne toutes les
+    classes. L'index JSON (écrit en dernier) donne pour chaque archive son nombre
+    d'images, et pour chaque image son archive, son offset et sa taille.
+
+    Args:
+        image_dir (str): Dossier contenant les images
+        annotation_file (str): Fichier JSON des annotations
+        output_dir (str): Dossier des archives
+        split (str): Nom du split ('train', 'valid'...)
+        shard_size_mb (int): Taille visée pour chaque archive
+        seed (int): Graine du mélange
+
+    Returns:
+        dict: L'index écrit
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    images, labels = load_image_table(image_dir, annotation_file, cache_dir=False)
+    order = list(range(len(images)))
+    random.Random(seed).shuffle(order)
+
+    shard_bytes = shard_size_mb << 20
+    shards = []
+    samples = []
+    tar = None
+    for position, i in enumerate(order):
+        if tar is None or tar.fileobj.tell() >= shard_bytes:
+            if tar is not None:
+                tar.close()
+                os.replace(tmp_path, output_dir / shards[-1]['name'])
+            shards.append({'name': f"{split}-{len(shards):05d}.tar", 'count': 0})
+            tmp_path = output_dir / (shards[-1]['name'] + ".tmp")
+            tar = tarfile.open(tmp_path, 'w', format=tarfile.USTAR_FORMAT)
+
+        key = f"{position:08d}"
+        extension = Path(images[i]).suffix.lower() or '.jpg'
+        with open(images[i], 'rb') as f:
+            data = f.read()
+        _add_member(tar, f"{key}.cls", str(labels[i]).encode())
+        info = _add_member(tar, f"{key}{extension}", data)
+        shards[-1]['count'] += 1
+        samples.append({
+            'key': key,
+            'file_name': os.path.relpath(images[i], image_dir),
+            'label': labels[i],
+            'shard': len(shards) - 1,
+            'offset': info.offset_data,
+            'size': info.size,
+        })
+        if (position + 1) % 10000 == 0:
+            print(f"{split}: {position + 1}/{len(images)} images archivées")
+
+    if tar is not None:
+        tar.close()
+        os.replace(tmp_path, output_dir / shards[-1]['name'])
+
+    index = {'split': split, 'num_samples': len(samples), 'shards': shards, 'samples': samples}
+    tmp_index = _index_path(output_dir, split).with_suffix('.tmp')
+    with open(tmp_index, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_index, _index_path(output_dir, split))
+    return index
+
+def load_shard_index(shard_dir, split):
+    """Lit l'index des archives d'un split."""
+    with open(_index_path(shard_dir, split), 'r') as f:
+        return json.load(f)
+
+def iter_shard(path):
+    """
+    Lit une archive du début à la fin.
+
+    Yields:
+        tuple: (clé, données brutes de l'image, label)
+    """
+    label = None
+    with open(path, 'rb', buffering=_READ_BUFFER) as f:
+        # Mode flux : aucun retour en arrière dans le fichier
+        with tarfile.open(fileobj=f, mode='r|') as tar:
+            for member in tar:
+                key, extension = os.path.splitext(member.name)
+                data = tar.extractfile(member).read()
+                if extension == '.cls':
+                    label = int(data)
+                else:
+                    yield key, data, label
+
+class ShardedImageDataset(IterableDataset):
+    """
+    Dataset itérable qui lit les archives séquentiellement.
+
+    Les archives sont réparties entre les rangs distribués puis entre les workers
+    du DataLoader (chacun lit des archives entières) ; l'ordre des archives change
+    à chaque époque et un tampon de mélange brasse les images lues.
+    """
+
+    def __init__(self, shard_dir, split='train', transform=None, shuffle_buffer=1000, shuffle=None,
+                 decode_size=None, seed=0):
+        """
+        Args:
+            shard_dir (str): Dossier produit par pack_shards
+            split (str): 'train' ou 'valid'
+            transform (callable, optional): Géométrie par image (-> tensor uint8)
+            shuffle_buffer (int): Taille du tampon de mélange
+            shuffle (bool, optional): Mélanger (par défaut pour 'train' uniquement)
+            decode_size (int, optional): Plus petit côté minimal au décodage des JPEG
+            seed (int): Graine commune à tous les rangs
+        """
+        self.shard_dir = Path(shard_dir)
+        self.split = split
+        index = load_shard_index(shard_dir, split)
+        self.shards = [shard['name'] for shard in index['shards']]
+        self.num_samples = index['num_samples']
+        is_train = split == 'train'
+        self.shuffle = is_train if shuffle is None else shuffle
+        self.transform = transform or (train_geometry if is_train else eval_geometry)
+        self.shuffle_buffer = shuffle_buffer if self.shuffle else 0
+        self.decode_size = decode_size or (TRAIN_DECODE_SIZE if is_train else INFERENCE_DECODE_SIZE)
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        """Change l'ordre des archives (à appeler avant chaque époque)."""
+        self.epoch = epoch
+
+    def _assigned_shards(self):
+        worker_info = get_worker_info()
+        worker_id = worker_info.id if worker_info else 0
+        num_workers = worker_info.num_workers if worker_info else 1
+        rank, world_size = get_rank(), get_world_size()
+
+        shards = list(self.shards)
+        if self.shuffle:
+            # Même permutation sur tous les rangs (même graine), différente à chaque époque
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        slot, num_slots = rank * num_workers + worker_id, world_size * num_workers
+        if len(shards) < num_slots and worker_id == 0:
+            print(f"Attention: {len(shards)} archives pour {num_slots} lecteurs, certains resteront inactifs")
+        return shards[slot::num_slots], worker_id
+
+    def _samples(self, shards):
+        for name in shards:
+            for key, data, label in iter_shard(self.shard_dir / name):
+                image = decode_image(io.BytesIO(data), self.decode_size)
+                yield self.transform(image), label
+
+    def __iter__(self):
+        shards, worker_id = self._assigned_shards()
+        samples = self._samples(shards)
+        if not self.shuffle_buffer:
+            yield from samples
+            return
+
+        rng = random.Random((self.seed + self.epoch) * 100003 + get_rank() * 1009 + worker_id)
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            position = rng.randrange(len(buffer))
+            yield buffer[position]
+            buffer[position] = sample
+        rng.shuffle(buffer)
+        yield from buffer
+
+def create_shard_dataloaders(shard_dir, batch_size=32, num_workers=4, shuffle_buffer=1000, prefetch_factor=None,
+                             pin_memory=False):
+    """
+    Crée les dataloaders d'entraînement et de validation à partir des archives.
+
+    Les workers ne sont jamais persistants : chacun garde sa copie du dataset et ne
+    verrait pas le set_epoch des époques suivantes (ordre des archives inchangé).
+
+    Returns:
+        tuple: (train_loader, val_loader)
+    """
+    train_dataset = ShardedImageDataset(shard_dir, 'train', shuffle_buffer=shuffle_buffer)
+    val_dataset = ShardedImageDataset(shard_dir, 'valid')
+    options = loader_options(num_workers, prefetch_factor, persistent_workers=False, pin_memory=pin_memory)
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, collate_fn=train_collate, **options)
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, collate_fn=eval_collate, **options)
+    return train_loader, val_loader
+
+def parse_args(argv=None):
+    base_dir = Path(__file__).parent.parent.parent.parent
+    parser = argparse.ArgumentParser(description="Archivage des images en shards tar séquentiels")
+    parser.add_argument('--image-dir', default=str(base_dir / "usable_images"), help="Dossier des images")
+    parser.add_argument('--annotation-dir', default=str(base_dir / "annotations"), help="Dossier des annotations")
+    parser.add_argument('--output-dir', default=str(base_dir / "shards"), help="Dossier des archives")
+    parser.add_argument('--shard-size-mb', type=int, default=256, help="Taille visée de chaque archive")
+    parser.add_argument('--splits', nargs='+', default=list(SPLITS), choices=list(SPLITS),
+                        help="Splits à archiver")
+    parser.add_argument('--seed', type=int, default=0, help="Graine du mélange avant archivage")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    for split in args.splits:
+        index = pack_shards(args.image_dir, os.path.join(args.annotation_dir, SPLITS[split]),
+                            args.output_dir, split, args.shard_size_mb, args.seed)
+        print(f"{split}: {index['num_samples']} images dans {len(index['shards'])} archives")
+
+if __name__ == "__main__":
+    main()
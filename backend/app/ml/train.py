@@ -1,45 +1,334 @@
+import argparse
+import os
 import torch
 import torch.nn as nn
 from pathlib import Path
-from .model import GrapeClassifier
-from .dataset import create_dataloaders
+from .model import ARCHITECTURES, GrapeClassifier, load_model
+from .dataset import create_dataloaders, create_datasets
+from .distributed import (
+    broadcast_object,
+    cleanup_distributed,
+    configure_threads,
+    get_local_rank,
+    get_world_size,
+    init_distributed,
+    is_main_process,
+    local_main_first,
+)
+from .distill import (
+    DistillationLoss,
+    compare_models,
+    create_distillation_loaders,
+    load_or_compute_teacher_logits,
+    print_report,
+    save_report,
+)
+from .checkpoint import CheckpointWriter, discard_newer_checkpoints, latest_checkpoint, load_training_checkpoint
+from .engine import TrainingEngine
+from .evaluate import BackgroundEvaluator, print_confusion_matrix
+from .feature_cache import load_or_extract_features, train_head
+from .loader_tuning import loader_options, tune_training_loader
+from .shards import create_shard_dataloaders
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Entraînement du classificateur de grappes")
+    parser.add_argument('--mode', choices=['full', 'head', 'distill'], default='full',
+                        help="'full': fine-tuning complet, 'head': uniquement la couche fc "
+                             "sur des caractéristiques pré-calculées, 'distill': petit modèle "
+                             "élève entraîné à imiter le modèle professeur")
+    parser.add_argument('--arch', choices=list(ARCHITECTURES), default=None,
+                        help="Backbone entraîné (resnet50 par défaut, mobilenet_v3_large en mode distill)")
+    parser.add_argument('--epochs', type=int, default=None,
+                        help="Nombre d'époques (10 en mode full, 100 en mode head)")
+    parser.add_argument('--batch-size', type=int, default=32, help="Taille des batchs")
+    parser.add_argument('--lr', type=float, default=0.001, help="Taux d'apprentissage")
+    parser.add_argument('--init-checkpoint', default=None,
+                        help="Modèle de départ (ex: grape_classifier.pth), poids ImageNet par défaut")
+    parser.add_argument('--image-dir', default=None, help="Dossier des images (usable_images par défaut)")
+    parser.add_argument('--annotation-dir', default=None, help="Dossier des annotations (annotations par défaut)")
+    parser.add_argument('--output', default=None,
+                        help="Chemin du modèle sauvegardé (grape_classifier.pth, "
+                             "grape_classifier_<arch>.pth en mode distill)")
+    parser.add_argument('--num-workers', type=int, default=None,
+                        help="Workers de chargement par processus (défaut: réglage mesuré une fois par machine, "
+                             "voir app.ml.loader_tuning)")
+    parser.add_argument('--retune-loader', action='store_true',
+                        help="Refaire la mesure du réglage des DataLoader sur cette machine")
+    parser.add_argument('--image-cache', nargs='?', const='default', default=None,
+                        help="Décoder les images une seule fois dans un cache mappé en mémoire "
+                             "(dossier image_cache par défaut)")
+    parser.add_argument('--shards', default=None,
+                        help="Dossier d'archives produit par app.ml.shards (lecture séquentielle, mode full)")
+    parser.add_argument('--shuffle-buffer', type=int, default=1000,
+                        help="Taille du tampon de mélange avec --shards")
+    parser.add_argument('--threads-per-rank', type=int, default=None,
+                        help="Threads de calcul par processus en mode distribué (cœurs / processus locaux par défaut)")
+
+    distill = parser.add_argument_group("distillation (mode distill)")
+    distill.add_argument('--teacher', default="grape_classifier.pth", help="Checkpoint du modèle professeur")
+    distill.add_argument('--temperature', type=float, default=4.0, help="Température d'adoucissement")
+    distill.add_argument('--alpha', type=float, default=0.7,
+                         help="Poids de la perte du professeur (1 - alpha pour les vrais labels)")
+    distill.add_argument('--report', default=None,
+                         help="Fichier JSON du comparatif précision/latence élève vs professeur")
+
+    engine = parser.add_argument_group("moteur d'entraînement (modes full et distill)")
+    engine.add_argument('--engine', action='store_true',
+                        help="Utiliser le moteur d'entraînement (implicite avec les options ci-dessous)")
+    engine.add_argument('--amp', action='store_true', help="Autocast bfloat16 sur CPU")
+    engine.add_argument('--channels-last', action='store_true', help="Format mémoire channels_last (NHWC)")
+    engine.add_argument('--compile', action='store_true', help="Compiler le modèle avec torch.compile")
+    engine.add_argument('--accumulation-steps', type=int, default=1,
+                        help="Batchs accumulés par pas d'optimiseur (batch effectif = batch-size x N)")
+    engine.add_argument('--log-interval', type=int, default=0,
+                        help="Afficher le débit tous les N batchs (0: seulement en fin d'époque)")
+    engine.add_argument('--validate', action='store_true', help="Évaluer sur la validation à chaque époque")
+    engine.add_argument('--background-eval', action='store_true',
+                        help="Évaluer chaque époque dans un processus séparé, sans interrompre l'entraînement")
+    engine.add_argument('--eval-threads', type=int, default=1, help="Threads de calcul de l'évaluation en arrière-plan")
+    engine.add_argument('--eval-workers', type=int, default=1, help="Workers de chargement de l'évaluation en arrière-plan")
+
+    checkpoints = parser.add_argument_group("checkpoints d'entraînement (modes full et distill)")
+    checkpoints.add_argument('--checkpoint-dir', default=None,
+                             help="Dossier des checkpoints (checkpoints par défaut avec les options ci-dessous)")
+    checkpoints.add_argument('--checkpoint-every', type=int, default=0,
+                             help="Checkpoint tous les N pas d'optimiseur (0: à chaque fin d'époque)")
+    checkpoints.add_argument('--keep-checkpoints', type=int, default=3,
+                             help="Nombre de checkpoints conservés (0: tous)")
+    checkpoints.add_argument('--resume', nargs='?', const='latest', default=None,
+                             help="Reprendre depuis un checkpoint (le plus récent du dossier sans chemin ; "
+                                  "démarre de zéro s'il n'y en a pas encore)")
+    return parser.parse_args(argv)
+
+def train_model(args=None):
+    if args is None:
+        args = parse_args([])
 
-def train_model():
     # Configuration
     base_dir = Path(__file__).parent.parent.parent.parent
-    image_dir = base_dir / "usable_images"
-    annotation_dir = base_dir / "annotations"
-    batch_size = 32
-    num_epochs = 10
-    learning_rate = 0.001
-    
-    print(f"Base directory: {base_dir}")
-    print(f"Image directory exists: {image_dir.exists()}")
-    print(f"Annotation directory exists: {annotation_dir.exists()}")
-    
-    # Création des dataloaders
-    train_loader, val_loader = create_dataloaders(
-        image_dir=str(image_dir),
-        annotation_dir=str(annotation_dir),
-        batch_size=batch_size
-    )
-    
-    print(f"Nombre d'images d'entraînement: {len(train_loader.dataset)}")
-    print(f"Nombre d'images de validation: {len(val_loader.dataset)}")
-    
-    # Initialisation du modèle
-    model = GrapeClassifier(num_classes=3)
-    
-    # Configuration de l'entraînement
-    criterion = nn.CrossEntropyLoss()
-    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
-    
-    # Entraînement
-    model.train_model(train_loader, criterion, optimizer, num_epochs)
-    
-    # Sauvegarde du modèle
-    model.save_model("grape_classifier.pth")
-    print("Modèle entraîné et sauvegardé avec succès!")
+    image_dir = Path(args.image_dir) if args.image_dir else base_dir / "usable_images"
+    annotation_dir = Path(args.annotation_dir) if args.annotation_dir else base_dir / "annotations"
+    batch_size = args.batch_size
+    num_epochs = args.epochs or (100 if args.mode == 'head' else 10)
+    learning_rate = args.lr
+    arch = args.arch or ('mobilenet_v3_large' if args.mode == 'distill' else 'resnet50')
+    output = args.output or ("grape_classifier.pth" if args.mode != 'distill' else f"grape_classifier_{arch}.pth")
+    # Cache d'images pré-décodées (sinon les JPEG sont relus et décodés à chaque époque)
+    image_cache_dir = None
+    if args.image_cache:
+        image_cache_dir = base_dir / "image_cache" if args.image_cache == 'default' else Path(args.image_cache)
+    # Caractéristiques du backbone pour le mode head
+    feature_cache_dir = base_dir / "feature_cache"
+
+    # Checkpoints périodiques (écrits en arrière-plan) et reprise d'un entraînement interrompu
+    checkpointing = bool(args.checkpoint_dir or args.checkpoint_every or args.resume)
+    checkpoint_dir = Path(args.checkpoint_dir) if args.checkpoint_dir else base_dir / "checkpoints"
+    if checkpointing and args.mode == 'head':
+        raise ValueError("Le mode head ne prend pas en charge les checkpoints d'entraînement")
+
+    # Lancé par torchrun : un processus par rang, communication gloo
+    distributed = init_distributed()
+
+    # Workers, préchargement et persistance des DataLoader : mesurés sur le vrai dataset
+    # par le premier rang de chaque machine, mémorisés, puis relus
+    if args.num_workers is None:
+        with local_main_first():
+            loader = tune_training_loader(
+                image_dir, annotation_dir, batch_size,
+                image_cache_dir=str(image_cache_dir) if image_cache_dir else None,
+                shards=args.shards if args.mode == 'full' else None,
+                retune=args.retune_loader and get_local_rank() == 0
+            )
+    else:
+        loader = loader_options(args.num_workers)
+    num_workers = loader['num_workers']
+
+    if distributed:
+        if args.mode == 'head':
+            raise ValueError("Le mode head ne prend pas en charge l'entraînement distribué")
+        threads = configure_threads(num_workers, args.threads_per_rank)
+        if is_main_process():
+            print(f"Entraînement distribué: {get_world_size()} processus, {threads} threads de calcul chacun, "
+                  f"batch global {batch_size * get_world_size() * args.accumulation_steps}")
+
+    if is_main_process():
+        print(f"Base directory: {base_dir}")
+        print(f"Image directory exists: {image_dir.exists()}")
+        print(f"Annotation directory exists: {annotation_dir.exists()}")
+
+    # Initialisation du modèle (poids ImageNet téléchargés une seule fois par machine,
+    # inutiles si un checkpoint de départ est fourni)
+    with local_main_first():
+        model = GrapeClassifier(num_classes=3, pretrained=not args.init_checkpoint, arch=arch)
+    if args.init_checkpoint:
+        model.load_model(args.init_checkpoint)
+        source = f"{os.path.abspath(args.init_checkpoint)}:{os.stat(args.init_checkpoint).st_mtime_ns}"
+    else:
+        source = f"imagenet:{arch}"
+
+    if args.mode == 'head':
+        # Le backbone ne passe qu'une fois sur chaque image, avec les transformations de validation
+        train_dataset, val_dataset = create_datasets(
+            image_dir=str(image_dir),
+            annotation_dir=str(annotation_dir),
+            image_cache_dir=str(image_cache_dir) if image_cache_dir else None,
+            augment=False
+        )
+        print(f"Nombre d'images d'entraînement: {len(train_dataset)}")
+        print(f"Nombre d'images de validation: {len(val_dataset)}")
+
+        train_features, train_labels = load_or_extract_features(
+            model, train_dataset, feature_cache_dir, source, batch_size=batch_size,
+            num_workers=num_workers
+        )
+        val_features, val_labels = load_or_extract_features(
+            model, val_dataset, feature_cache_dir, source, batch_size=batch_size,
+            num_workers=num_workers
+        )
+        train_head(model, train_features, train_labels, val_features, val_labels,
+                   num_epochs=num_epochs, learning_rate=learning_rate)
+    else:
+        criterion = nn.CrossEntropyLoss()
+        eval_criterion = None
+        if args.mode == 'distill':
+            if args.shards:
+                raise ValueError("Le mode distill lit les images du dossier, pas les archives (--shards)")
+            teacher = load_model(args.teacher)
+            teacher_source = f"{os.path.abspath(args.teacher)}:{os.stat(args.teacher).st_mtime_ns}"
+            # Le professeur ne passe qu'une fois sur chaque image (transformations de validation,
+            # logits mis en cache), l'élève s'entraîne ensuite avec augmentation
+            with local_main_first():
+                teacher_dataset, _ = create_datasets(
+                    image_dir=str(image_dir),
+                    annotation_dir=str(annotation_dir),
+                    image_cache_dir=str(image_cache_dir) if image_cache_dir else None,
+                    augment=False
+                )
+                teacher_logits = load_or_compute_teacher_logits(
+                    teacher, teacher_dataset, feature_cache_dir, teacher_source,
+                    batch_size=batch_size, num_workers=num_workers
+                )
+                train_dataset, val_dataset = create_datasets(
+                    image_dir=str(image_dir),
+                    annotation_dir=str(annotation_dir),
+                    image_cache_dir=str(image_cache_dir) if image_cache_dir else None
+                )
+            train_loader, val_loader = create_distillation_loaders(
+                train_dataset, val_dataset, batch_size=batch_size, distributed=distributed, **loader
+            )
+            num_train, num_val = len(train_dataset), len(val_dataset)
+            # Validation sur les vrais labels uniquement
+            eval_criterion = criterion
+            criterion = DistillationLoss(teacher_logits, train_dataset.labels, args.temperature, args.alpha)
+        elif args.shards:
+            # Archives lues séquentiellement, réparties entre rangs et workers
+            train_loader, val_loader = create_shard_dataloaders(
+                args.shards, batch_size=batch_size, num_workers=num_workers,
+                shuffle_buffer=args.shuffle_buffer, prefetch_factor=loader.get('prefetch_factor'),
+                pin_memory=loader['pin_memory']
+            )
+            num_train, num_val = train_loader.dataset.num_samples, val_loader.dataset.num_samples
+        else:
+            # Création des dataloaders (caches construits par un seul rang par machine)
+            with local_main_first():
+                train_loader, val_loader = create_dataloaders(
+                    image_dir=str(image_dir),
+                    annotation_dir=str(annotation_dir),
+                    batch_size=batch_size,
+                    image_cache_dir=str(image_cache_dir) if image_cache_dir else None,
+                    distributed=distributed,
+                    **loader
+                )
+            num_train, num_val = len(train_loader.dataset), len(val_loader.dataset)
+
+        if is_main_process():
+            print(f"Nombre d'images d'entraînement: {num_train}")
+            print(f"Nombre d'images de validation: {num_val}")
+
+        # Configuration de l'entraînement
+        optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+
+        # Entraînement
+        use_engine = (distributed or args.shards or args.mode == 'distill' or args.engine or args.amp or args.channels_last or args.compile
+                      or args.accumulation_steps > 1 or args.validate or args.background_eval or checkpointing)
+        if use_engine:
+            # Validation en arrière-plan : le rang 0 envoie un instantané des poids à chaque époque
+            evaluator = None
+            if args.background_eval and is_main_process():
+                loader_args = {'batch_size': batch_size, 'num_workers': args.eval_workers}
+                if args.shards:
+                    loader_args['shards'] = args.shards
+                else:
+                    loader_args.update(image_dir=str(image_dir), annotation_dir=str(annotation_dir))
+                evaluator = BackgroundEvaluator(model, loader_args, num_threads=args.eval_threads, amp=args.amp)
+            checkpointer = None
+            if checkpointing and is_main_process():
+                checkpointer = CheckpointWriter(checkpoint_dir, keep_last=args.keep_checkpoints)
+            engine = TrainingEngine(
+                model, criterion, optimizer,
+                amp=args.amp,
+                channels_last=args.channels_last,
+                compile=args.compile,
+                accumulation_steps=args.accumulation_steps,
+                log_interval=args.log_interval,
+                eval_criterion=eval_criterion,
+                checkpointer=checkpointer,
+                checkpoint_interval=args.checkpoint_every
+            )
+            if args.resume:
+                # Seul le rang 0 écrit les checkpoints (pas de disque partagé entre les machines) :
+                # il choisit et lit le checkpoint, puis l'envoie aux autres rangs
+                resume_path = resume_state = None
+                if is_main_process():
+                    resume_path = latest_checkpoint(checkpoint_dir) if args.resume == 'latest' else Path(args.resume)
+                    if resume_path is not None:
+                        resume_state = load_training_checkpoint(resume_path)
+                resume_path, resume_state = broadcast_object((resume_path, resume_state))
+                if resume_path is None:
+                    if is_main_process():
+                        print(f"Aucun checkpoint dans {checkpoint_dir}, entraînement depuis le début")
+                else:
+                    if is_main_process():
+                        print(f"Reprise depuis {resume_path}")
+                    engine.load_state_dict(resume_state)
+                    del resume_state
+                    if checkpointer is not None:
+                        # Les checkpoints plus récents que celui repris ne sont plus de cette reprise
+                        for path in discard_newer_checkpoints(checkpoint_dir, engine.global_step):
+                            print(f"Checkpoint mis de côté: {path}")
+            try:
+                engine.fit(train_loader, num_epochs, val_loader=val_loader if args.validate else None,
+                           on_epoch_end=(lambda m, epoch, _: evaluator.submit(m, epoch)) if evaluator else None)
+            finally:
+                if evaluator is not None:
+                    print("Attente des dernières évaluations...")
+                    results = [r for r in evaluator.close().values() if 'error' not in r]
+                    if results:
+                        print_confusion_matrix(results[-1]['confusion_matrix'])
+                if checkpointer is not None:
+                    checkpointer.close()
+        else:
+            model.train_model(train_loader, criterion, optimizer, num_epochs)
+
+    # Sauvegarde du modèle (même format de checkpoint dans tous les modes, rang 0 uniquement)
+    if is_main_process():
+        model.save_model(output)
+        print("Modèle entraîné et sauvegardé avec succès!")
+
+        if args.mode == 'distill':
+            # Compromis précision/latence sur toute la validation, avec le modèle tel que chargé à l'inférence
+            _, report_loader = create_distillation_loaders(
+                train_dataset, val_dataset, batch_size=batch_size, num_workers=num_workers,
+                persistent_workers=False
+            )
+            report = compare_models({'professeur': teacher, f'élève ({arch})': load_model(output)},
+                                    report_loader, batch_size=batch_size)
+            print_report(report)
+            if args.report:
+                save_report(report, args.report)
 
 if __name__ == "__main__":
-    train_model() 
\ No newline at end of file
+    try:
+        train_model(parse_args())
+    finally:
+        cleanup_distributed()
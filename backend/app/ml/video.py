@@ -0,0 +1,381 @@
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+import torch
+
+from .backends import BACKENDS, load_backend
+from .predict import format_predictions
+from .preprocessing import eval_geometry, normalize_batch
+
+# Côté de l'empreinte perceptuelle (dHash) : 8x8 comparaisons, soit 64 bits
+HASH_SIZE = 8
+
+def _import_cv2():
+    try:
+        import cv2
+    except ImportError as e:
+        raise ImportError(
+            "La lecture de vidéos nécessite OpenCV (pip install opencv-python-headless)"
+        ) from e
+    return cv2
+
+def dhash(frame, hash_size=HASH_SIZE):
+    """
+    Empreinte perceptuelle (difference hash) d'une image.
+
+    L'image est sous-échantillonnée (quelques milliers de pixels seulement sont lus),
+    réduite en niveaux de gris à (hash_size, hash_size + 1) blocs, puis chaque bloc
+    est comparé à son voisin de droite. Deux images presque identiques ont des
+    empreintes à faible distance de Hamming, même après recompression.
+
+    Args:
+        frame (ndarray): Image RGB uint8 (H, W, 3)
+        hash_size (int): Côté de l'empreinte
+
+    Returns:
+        ndarray: Empreinte booléenne (hash_size * hash_size,)
+    """
+    height, width = frame.shape[:2]
+    rows, cols = hash_size, hash_size + 1
+    # Au plus 8x8 pixels lus par bloc
+    step_y, step_x = max(1, height // (rows * 8)), max(1, width // (cols * 8))
+    small = frame[::step_y, ::step_x]
+    h, w = (small.shape[0] // rows) * rows, (small.shape[1] // cols) * cols
+    gray = small[:h, :w].astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    blocks = gray.reshape(rows, h // rows, cols, w // cols).mean(axis=(1, 3))
+    return (blocks[:, 1:] > blocks[:, :-1]).ravel()
+
+def hamming(a, b):
+    return int(np.count_nonzero(a != b))
+
+def is_live_source(source):
+    """Caméra (index) ou flux réseau : les images doivent être lues au rythme de la source."""
+    return isinstance(source, int) or str(source).isdigit() or '://' in str(source)
+
+def iter_video_frames(source):
+    """
+    Décode une vidéo, une caméra ou un flux réseau avec OpenCV.
+
+    Args:
+        source: Chemin d'une vidéo, URL (rtsp://, http://) ou index de caméra
+
+    Yields:
+        tuple: (horodatage en secondes, image RGB uint8 (H, W, 3))
+    """
+    cv2 = _import_cv2()
+    live = is_live_source(source)
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else str(source))
+    if not capture.isOpened():
+        raise IOError(f"Impossible d'ouvrir la source vidéo: {source}")
+    start = time.monotonic()
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            # Fichier : temps de la vidéo ; source en direct : temps écoulé depuis l'ouverture
+            timestamp = time.monotonic() - start if live else capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            yield timestamp, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
+
+class FrameReader:
+    """
+    Décode les images dans un thread séparé, en parallèle de l'inférence.
+
+    Pour un fichier, la file est bornée et le décodage attend le modèle. Pour une
+    source en direct, le décodage ne doit jamais prendre de retard : quand la file
+    est pleine, l'image la plus ancienne est abandonnée (et comptée).
+    """
+
+    def __init__(self, frames, max_queue=32, drop_when_full=False):
+        """
+        Args:
+            frames: Itérable de (horodatage, image)
+            max_queue (int): Images décodées en attente au maximum
+            drop_when_full (bool): Abandonner les plus anciennes plutôt qu'attendre
+        """
+        self.frames = frames
+        self.queue = queue.Queue(max_queue)
+        self.drop_when_full = drop_when_full
+        self.decoded = 0
+        self.dropped = 0
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="video-decode", daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        if not self.drop_when_full:
+            self.queue.put(item)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        try:
+            for item in self.frames:
+                self.decoded += 1
+                self._put(item)
+        except Exception as e:
+            self.error = e
+        # Fin du flux (toujours transmise, même si la file est pleine)
+        self.queue.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+class StreamStats:
+    """Compteurs d'un flux : images décodées, ignorées (doublons), abandonnées et classées."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.decoded = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.classified = 0
+        self.batches = 0
+        self.inference_seconds = 0.0
+        self.video_seconds = 0.0
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.start
+        rate = lambda count: count / elapsed if elapsed > 0 else 0.0
+        return {
+            'elapsed_s': elapsed,
+            'video_s': self.video_seconds,
+            'decoded': self.decoded,
+            'skipped': self.skipped,
+            'dropped': self.dropped,
+            'classified': self.classified,
+            'batches': self.batches,
+            'decoded_per_s': rate(self.decoded),
+            'skipped_per_s': rate(self.skipped),
+            'classified_per_s': rate(self.classified),
+            'inference_ms_per_frame': 1000 * self.inference_seconds / max(self.classified, 1),
+            # > 1 : le traitement va plus vite que la vidéo
+            'realtime_factor': self.video_seconds / elapsed if elapsed > 0 else 0.0,
+        }
+
+class VideoClassifier:
+    """
+    Classe un flux d'images en ignorant les images quasi identiques.
+
+    Chaque image est comparée (dHash) à la dernière image retenue ; elle n'est
+    classée que si la distance de Hamming dépasse hash_threshold, ou si max_gap
+    secondes se sont écoulées depuis la dernière image retenue. Les images retenues
+    sont regroupées en batchs ; un batch incomplet part quand sa première image
+    attend depuis plus de max_latency secondes (temps de la vidéo).
+    """
+
+    def __init__(self, model, batch_size=8, hash_threshold=6, max_gap=2.0, max_latency=0.5):
+        """
+        Args:
+            model: Modèle ou backend (batch prétraité -> logits)
+            batch_size (int): Images par passe avant
+            hash_threshold (int): Distance (sur 64 bits) en dessous de laquelle une image est un doublon
+            max_gap (float): Durée maximale sans image classée, même sur une scène immobile
+            max_latency (float): Attente maximale d'un batch incomplet
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.hash_threshold = hash_threshold
+        self.max_gap = max_gap
+        self.max_latency = max_latency
+        self.transform = eval_geometry
+        self.stats = StreamStats()
+
+    def _infer(self, pending):
+        start = time.perf_counter()
+        batch = normalize_batch(torch.stack([tensor for _, _, tensor in pending]))
+        with torch.no_grad():
+            probabilities = torch.nn.functional.softmax(self.model(batch).float(), dim=1)
+        self.stats.inference_seconds += time.perf_counter() - start
+        self.stats.classified += len(pending)
+        self.stats.batches += 1
+        for (frame_index, timestamp, _), result in zip(pending, format_predictions(probabilities)):
+            yield {'frame': frame_index, 'timestamp': timestamp, **result}
+
+    def classify(self, frames, reader=None):
+        """
+        Classe un flux d'images.
+
+        Args:
+            frames: Itérable de (horodatage en secondes, image RGB uint8 (H, W, 3))
+            reader (FrameReader, optional): Lecteur dont reprendre les compteurs
+
+        Yields:
+            dict: Résultat horodaté de chaque image classée (même format que predict_image,
+                plus 'frame' et 'timestamp')
+        """
+        last_hash = None
+        last_kept = None
+        pending = []
+        for frame_index, (timestamp, frame) in enumerate(frames):
+            self.stats.decoded = reader.decoded if reader is not None else frame_index + 1
+            self.stats.dropped = reader.dropped if reader is not None else 0
+            self.stats.video_seconds = timestamp
+
+            frame_hash = dhash(frame)
+            if (last_hash is not None and timestamp - last_kept < self.max_gap
+                    and hamming(frame_hash, last_hash) <= self.hash_threshold):
+                self.stats.skipped += 1
+            else:
+                last_hash, last_kept = frame_hash, timestamp
+                pending.append((frame_index, timestamp, self.transform(frame)))
+
+            if pending and (len(pending) == self.batch_size
+                            or timestamp - pending[0][1] >= self.max_latency):
+                yield from self._infer(pending)
+                pending = []
+        if pending:
+            yield from self._infer(pending)
+        if reader is not None:
+            self.stats.decoded, self.stats.dropped = reader.decoded, reader.dropped
+
+def classify_video(model, source, batch_size=8, hash_threshold=6, max_gap=2.0, max_latency=0.5):
+    """
+    Classe une vidéo, une caméra ou un flux réseau au fil de la lecture.
+
+    Le décodage tourne dans un thread séparé ; pour une source en direct, les images
+    que le modèle n'a pas le temps de traiter sont abandonnées plutôt que mises en
+    retard.
+
+    Args:
+        model: Modèle ou backend
+        source: Chemin, URL, index de caméra, ou itérable de (horodatage, image RGB)
+        batch_size, hash_threshold, max_gap, max_latency: Voir VideoClassifier
+
+    Returns:
+        tuple: (générateur de résultats horodatés, VideoClassifier dont classifier.stats
+            donne les compteurs)
+    """
+    if isinstance(source, (str, int)):
+        frames = iter_video_frames(source)
+        live = is_live_source(source)
+    else:
+        frames, live = source, False
+    reader = FrameReader(frames, drop_when_full=live)
+    classifier = VideoClassifier(model, batch_size, hash_threshold, max_gap, max_latency)
+    return classifier.classify(reader, reader), classifier
+
+def synthetic_frames(seconds=10.0, fps=25, width=1280, height=720, seed=0):
+    """
+    Vidéo synthétique d'un rang de vigne : travellings entrecoupés d'arrêts.
+
+    Une longue bande de « grappes » défile horizontalement ; pendant les arrêts
+    (une seconde sur trois), la caméra est immobile et seules de légères variations
+    de bruit distinguent les images : ce sont les doublons à ignorer.
+
+    Yields:
+        tuple: (horodatage en secondes, image RGB uint8 (H, W, 3))
+    """
+    rng = np.random.default_rng(seed)
+    strip_width = width * 4
+    x = np.arange(strip_width, dtype=np.float32)
+    y = np.arange(height, dtype=np.float32)[:, None]
+    strip = np.empty((height, strip_width, 3), dtype=np.float32)
+    strip[..., 0] = 90 + 60 * np.sin(x / 97.0)
+    strip[..., 1] = 120 + 50 * np.cos(y / height * 4.0 + x / 311.0)
+    strip[..., 2] = 60 + 40 * np.sin((x + y) / 173.0)
+    for _ in range(strip_width // 40):
+        cx, cy = rng.uniform(0, strip_width), rng.uniform(0, height)
+        radius = rng.uniform(0.02, 0.08) * height
+        x0, x1 = int(max(0, cx - radius)), int(min(strip_width, cx + radius + 1))
+        y0, y1 = int(max(0, cy - radius)), int(min(height, cy + radius + 1))
+        mask = (x[None, x0:x1] - cx) ** 2 + (y[y0:y1] - cy) ** 2 < radius ** 2
+        strip[y0:y1, x0:x1][mask] = rng.uniform(30, 160, size=3)
+    strip = np.clip(strip, 0, 255).astype(np.uint8)
+
+    speed = width / (2.0 * fps)
+    offset = 0.0
+    for index in range(int(seconds * fps)):
+        timestamp = index / fps
+        if int(timestamp) % 3 != 2:
+            offset = (offset + speed) % (strip_width - width)
+        frame = strip[:, int(offset):int(offset) + width].copy()
+        noise = rng.integers(-3, 4, size=(height // 8, width // 8, 1), dtype=np.int16)
+        frame = np.clip(frame + np.kron(noise, np.ones((8, 8, 1), dtype=np.int16)), 0, 255).astype(np.uint8)
+        yield timestamp, frame
+
+def write_synthetic_video(path, seconds=10.0, fps=25, width=1280, height=720, seed=0):
+    """Écrit la vidéo synthétique dans un fichier (OpenCV, codec mp4v)."""
+    cv2 = _import_cv2()
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    try:
+        for _, frame in synthetic_frames(seconds, fps, width, height, seed):
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    finally:
+        writer.release()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Classification de vidéos et de flux caméra")
+    parser.add_argument('source', nargs='?', default=None,
+                        help="Vidéo, URL de flux (rtsp://...) ou index de caméra")
+    parser.add_argument('--synthetic', type=float, default=None, metavar='SECONDES',
+                        help="Classer une vidéo synthétique générée en mémoire")
+    parser.add_argument('--write-synthetic', default=None, metavar='FICHIER',
+                        help="Écrire la vidéo synthétique dans un fichier puis quitter")
+    parser.add_argument('--fps', type=int, default=25, help="Images par seconde de la vidéo synthétique")
+    parser.add_argument('--model', default=None, help="Chemin vers le modèle (artefact par défaut du backend sinon)")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='eager', help="Backend d'inférence")
+    parser.add_argument('--batch-size', type=int, default=8, help="Images par passe avant")
+    parser.add_argument('--hash-threshold', type=int, default=6,
+                        help="Distance dHash (sur 64) en dessous de laquelle une image est ignorée")
+    parser.add_argument('--max-gap', type=float, default=2.0, help="Secondes maximum sans image classée")
+    parser.add_argument('--max-latency', type=float, default=0.5, help="Attente maximale d'un batch incomplet")
+    parser.add_argument('--output', default=None, help="Fichier JSON Lines des résultats (défaut: sortie standard)")
+    args = parser.parse_args(argv)
+    if args.write_synthetic is None and (args.source is None) == (args.synthetic is None):
+        parser.error("indiquer une source ou --synthetic")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.write_synthetic:
+        write_synthetic_video(args.write_synthetic, args.synthetic or 10.0, args.fps)
+        print(f"Vidéo synthétique écrite: {args.write_synthetic}")
+        return
+
+    model = load_backend(args.backend, args.model)
+    source = synthetic_frames(args.synthetic, args.fps) if args.synthetic is not None else args.source
+    results, classifier = classify_video(model, source, args.batch_size, args.hash_threshold,
+                                         args.max_gap, args.max_latency)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+    finally:
+        if args.output:
+            output.close()
+
+    stats = classifier.stats.as_dict()
+    print(f"\n{stats['decoded']} images décodées ({stats['decoded_per_s']:.1f}/s), "
+          f"{stats['skipped']} doublons ignorés ({stats['skipped_per_s']:.1f}/s), "
+          f"{stats['dropped']} abandonnées, {stats['classified']} classées ({stats['classified_per_s']:.1f}/s) "
+          f"en {stats['batches']} batchs", file=sys.stderr)
+    print(f"{stats['video_s']:.1f} s de vidéo en {stats['elapsed_s']:.1f} s "
+          f"(x{stats['realtime_factor']:.2f} temps réel), "
+          f"{stats['inference_ms_per_frame']:.1f} ms d'inférence par image classée", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
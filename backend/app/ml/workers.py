@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+import torch.multiprocessing as mp
+
+from .distributed import available_cpus
+from .model import load_checkpoint, load_model
+from .predict import predict_images
+
+# Modes de chargement des poids dans les workers :
+#   shared  : le parent charge le modèle une fois et place ses tenseurs en mémoire
+#             partagée ; les workers reçoivent des descripteurs, sans copie
+#   mmap    : chaque worker mappe le checkpoint ; les pages du cache disque sont communes
+#   private : chaque worker lit le checkpoint dans sa propre mémoire (une copie par processus)
+SHARING_MODES = ('shared', 'mmap', 'private')
+
+def process_memory(pid=None):
+    """
+    Mémoire d'un processus lue dans /proc/<pid>/smaps_rollup (Linux).
+
+    La RSS compte entièrement les pages partagées dans chaque processus ; la PSS
+    les divise entre les processus qui les utilisent (la somme des PSS est la
+    mémoire réellement occupée) ; l'USS ne compte que les pages privées.
+
+    Args:
+        pid (int, optional): Processus (défaut: le processus courant)
+
+    Returns:
+        dict: rss_mb, pss_mb, uss_mb et shared_mb (None si /proc n'est pas disponible)
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid or 'self'}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        return {'rss_mb': None, 'pss_mb': None, 'uss_mb': None, 'shared_mb': None}
+    return {
+        'rss_mb': fields.get('Rss'),
+        'pss_mb': fields.get('Pss'),
+        'uss_mb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        'shared_mb': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+    }
+
+def child_pids(pid=None):
+    """
+    Processus enfants directs d'un processus, lus dans /proc (Linux).
+
+    Args:
+        pid (int, optional): Processus parent (défaut: le processus courant)
+
+    Returns:
+        set: PID des enfants (vide si /proc n'est pas disponible)
+    """
+    parent = pid or os.getpid()
+    children = set()
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Le nom du processus (entre parenthèses) peut contenir des espaces
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == parent:
+            children.add(int(entry))
+    return children
+
+def _worker_main(model, model_path, mode, num_threads, tasks, results):
+    # Threads fixés avant toute inférence : les workers ne se disputent pas les cœurs
+    torch.set_num_threads(num_threads)
+    if model is None:
+        model = load_model(model_path, mmap=mode == 'mmap')
+    results.put(('ready', os.getpid(), None))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, inputs, batch_size = task
+        try:
+            results.put((task_id, predict_images(model, inputs, batch_size), None))
+        except Exception as e:
+            results.put((task_id, None, f"{type(e).__name__}: {e}"))
+
+class InferencePool:
+    """
+    Pool de processus d'inférence qui partagent les poids du modèle.
+
+    En mode 'shared', le parent charge GrapeClassifier une seule fois et appelle
+    share_memory() : paramètres et buffers passent en mémoire partagée, et chaque
+    worker (lancé en 'spawn') reçoit des descripteurs vers ces mêmes pages. La
+    mémoire occupée par les poids ne grandit donc plus avec le nombre de workers.
+
+    Chaque worker reçoit une part fixe des cœurs (threads intra-op) pour éviter
+    la sur-souscription ; les images sont envoyées par paquets que les workers
+    libres prennent dans une file commune.
+    """
+
+    def __init__(self, model_path="grape_classifier.pth", num_workers=2, threads_per_worker=None,
+                 mode='shared', batch_size=16):
+        """
+        Args:
+            model_path (str): Checkpoint du modèle
+            num_workers (int): Nombre de processus d'inférence
+            threads_per_worker (int, optional): Threads intra-op par worker
+                (défaut: cœurs disponibles / num_workers)
+            mode (str): Chargement des poids (voir SHARING_MODES)
+            batch_size (int): Taille des batchs dans chaque worker
+        """
+        if mode not in SHARING_MODES:
+            raise ValueError(f"Mode inconnu: {mode} (choix: {', '.join(SHARING_MODES)})")
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(1, available_cpus() // num_workers)
+        self.mode = mode
+        self.batch_size = batch_size
+        self.model = None
+        if mode == 'shared':
+            self.model = load_model(model_path, mmap=False).share_memory()
+
+        context = mp.get_context('spawn')
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(target=_worker_main, daemon=True,
+                            args=(self.model, model_path, mode, self.threads_per_worker,
+                                  self.tasks, self.results))
+            for _ in range(num_workers)
+        ]
+        for process in self.processes:
+            process.start()
+        self.pids = [self.results.get()[1] for _ in self.processes]
+        self._next_task = 0
+
+    def map(self, inputs, chunk_size=None):
+        """
+        Classe des images en les répartissant entre les workers.
+
+        Si un paquet échoue, RuntimeError est levée une fois tous les paquets reçus.
+
+        Args:
+            inputs (list): Chemins des images
+            chunk_size (int, optional): Images par paquet (défaut: batch_size)
+
+        Returns:
+            list: Un résultat par image, dans l'ordre des entrées
+        """
+        chunk_size = chunk_size or self.batch_size
+        chunks = {}
+        for start in range(0, len(inputs), chunk_size):
+            task_id = self._next_task
+            self._next_task += 1
+            chunks[task_id] = start
+            self.tasks.put((task_id, inputs[start:start + chunk_size], self.batch_size))
+
+        results = [None] * len(inputs)
+        errors = []
+        # Tous les paquets sont relus, même après une erreur : aucun résultat de cet
+        # appel ne reste dans la file pour être lu par le suivant
+        for _ in range(len(chunks)):
+            task_id, chunk_results, error = self.results.get()
+            if error is not None:
+                errors.append(error)
+                continue
+            start = chunks[task_id]
+            results[start:start + len(chunk_results)] = chunk_results
+        if errors:
+            raise RuntimeError(f"Erreur dans un worker d'inférence: {errors[0]}"
+                               + (f" (et {len(errors) - 1} autres paquets)" if len(errors) > 1 else ""))
+        return results
+
+    def memory(self):
+        """
+        Mémoire du parent et de chaque worker.
+
+        Returns:
+            dict: 'parent', 'workers' (une entrée par worker) et 'total_pss_mb'
+        """
+        parent = process_memory()
+        workers = [process_memory(pid) for pid in self.pids]
+        pss = [entry['pss_mb'] for entry in [parent] + workers]
+        return {
+            'parent': parent,
+            'workers': workers,
+            'total_pss_mb': sum(pss) if None not in pss else None,
+        }
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def benchmark_pool(model_path, images, worker_counts=(1, 2, 4), modes=SHARING_MODES, batch_size=16,
+                   threads_per_worker=None):
+    """
+    Mesure débit et mémoire du pool pour plusieurs nombres de workers et modes de partage.
+
+    Args:
+        model_path (str): Checkpoint du modèle
+        images (list): Chemins des images classées à chaque mesure
+        worker_counts (tuple): Nombres de workers testés
+        modes (tuple): Modes de chargement des poids testés
+        batch_size (int): Taille des batchs dans chaque worker
+        threads_per_worker (int, optional): Threads intra-op par worker
+
+    Returns:
+        list: Une entrée par configuration
+    """
+    report = []
+    for mode in modes:
+        for num_workers in worker_counts:
+            with InferencePool(model_path, num_workers, threads_per_worker, mode, batch_size) as pool:
+                # Échauffement : un paquet par worker
+                pool.map(images[:num_workers * batch_size])
+                start = time.perf_counter()
+                pool.map(images)
+                elapsed = time.perf_counter() - start
+                memory = pool.memory()
+            report.append({
+                'mode': mode,
+                'workers': num_workers,
+                'threads_per_worker': pool.threads_per_worker,
+                'images': len(images),
+                'images_per_s': len(images) / elapsed,
+                'memory': memory,
+            })
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pool de workers d'inférence à poids partagés")
+    parser.add_argument('--model', default="grape_classifier.pth", help="Chemin vers le modèle entraîné")
+    parser.add_argument('--image-dir', default=None, help="Images à classer (défaut: images synthétiques)")
+    parser.add_argument('--num-images', type=int, default=128, help="Nombre d'images classées par mesure")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="Nombres de workers testés")
+    parser.add_argument('--modes', nargs='+', default=list(SHARING_MODES), choices=SHARING_MODES,
+                        help="Modes de chargement des poids testés")
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help="Threads intra-op par worker (défaut: cœurs / workers)")
+    parser.add_argument('--batch-size', type=int, default=16, help="Taille des batchs")
+    parser.add_argument('--output', default=None, help="Fichier JSON où écrire les résultats")
+    return parser.parse_args(argv)
+
+def _format_mb(value):
+    return f"{value:.0f}" if value is not None else "-"
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.image_dir:
+            images = sorted(str(p) for p in Path(args.image_dir).rglob('*')
+                            if p.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+        else:
+            from .benchmark import make_synthetic_image
+            images = []
+            for i in range(8):
+                path = Path(tmp_dir) / f"synthetic_{i}.jpg"
+                make_synthetic_image(path, 640, 480, seed=i)
+                images.append(str(path))
+        # Répéter les images si le dossier en contient moins que demandé
+        images = (images * (args.num_images // max(len(images), 1) + 1))[:args.num_images]
+        report = benchmark_pool(args.model, images, args.workers, args.modes, args.batch_size,
+                                args.threads_per_worker)
+
+    weights_mb = sum(t.numel() * t.element_size() for t in load_checkpoint(args.model).values()) / 2 ** 20
+    print(f"\nPoids du modèle: {weights_mb:.0f} Mo (copiés par worker en mode private uniquement)")
+    print(f"{'Mode':<8} {'Workers':>7} {'Threads':>7} {'images/s':>9} {'Parent PSS':>11} "
+          f"{'RSS/worker':>11} {'PSS/worker':>11} {'USS/worker':>11} {'PSS total':>10}")
+    for entry in report:
+        memory = entry['memory']
+        workers = memory['workers']
+
+        def mean(key):
+            values = [w[key] for w in workers]
+            return sum(values) / len(values) if None not in values else None
+
+        print(f"{entry['mode']:<8} {entry['workers']:>7} {entry['threads_per_worker']:>7} "
+              f"{entry['images_per_s']:>9.1f} {_format_mb(memory['parent']['pss_mb']):>8} Mo "
+              f"{_format_mb(mean('rss_mb')):>8} Mo {_format_mb(mean('pss_mb')):>8} Mo "
+              f"{_format_mb(mean('uss_mb')):>8} Mo {_format_mb(memory['total_pss_mb']):>7} Mo")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import streamlit as st
-import torch
 from PIL import Image
 import io
+import os
 import sys
 from pathlib import Path
 
@@ -9,8 +9,9 @@ from pathlib import Path
 backend_path = Path(__file__).parent.parent.parent
 sys.path.append(str(backend_path))
 
-from app.ml.model import GrapeClassifier
+from app.ml.model import load_model as load_checkpoint_model
 from app.ml.predict import predict_image
+from app.ml.prediction_cache import create_prediction_cache
 
 # Configuration de la page
 st.set_page_config(
@@ -86,13 +87,38 @@ st.markdown("""
     </div>
     """, unsafe_allow_html=True)
 
+# Serveur d'inférence optionnel (ex: http://127.0.0.1:8000), sinon le modèle est chargé localement
+API_URL = os.environ.get("GRAPPE_API_URL")
+
+def predict_via_api(image):
+    """Envoie l'image au serveur d'inférence et renvoie le même résultat que predict_image."""
+    import requests
+    response = requests.post(
+        f"{API_URL.rstrip('/')}/predict",
+        files={'file': (getattr(image, 'name', 'image.jpg'), image.getvalue())},
+        timeout=30
+    )
+    response.raise_for_status()
+    return response.json()
+
+# Checkpoint utilisé (ResNet50 ou modèle distillé : l'architecture est lue dans le checkpoint)
+MODEL_PATH = os.environ.get("GRAPPE_MODEL_PATH", "grape_classifier.pth")
+
 # Chargement du modèle
 @st.cache_resource
 def load_model():
-    model = GrapeClassifier(num_classes=3)
-    model.load_state_dict(torch.load("grape_classifier.pth"))
-    model.eval()
-    return model
+    # Pas de poids ImageNet à télécharger : le checkpoint est chargé directement
+    return load_checkpoint_model(MODEL_PATH)
+
+# Cache des prédictions : une photo déjà analysée n'est pas recalculée
+# (GRAPPE_PREDICTION_CACHE_DB active en plus un cache sur disque qui survit aux redémarrages)
+@st.cache_resource
+def get_prediction_cache():
+    return create_prediction_cache(
+        MODEL_PATH,
+        max_entries=256,
+        disk_path=os.environ.get("GRAPPE_PREDICTION_CACHE_DB")
+    )
 
 # Choix de la méthode d'entrée
 option = st.radio(
@@ -115,11 +141,15 @@ if image is not None:
     # Bouton de prédiction avec style personnalisé
     if st.button("Analyser l'image", key="analyze"):
         with st.spinner("Analyse en cours..."):
-            # Chargement du modèle
-            model = load_model()
-            
-            # Prédiction
-            result = predict_image(model, image)
+            if API_URL:
+                # Prédiction par le serveur (requêtes regroupées avec celles des autres utilisateurs)
+                result = predict_via_api(image)
+            else:
+                # Chargement du modèle
+                model = load_model()
+                
+                # Prédiction
+                result = predict_image(model, image, cache=get_prediction_cache())
             
             # Affichage des résultats dans une mise en page améliorée
             st.markdown("""
@@ -147,4 +177,13 @@ if image is not None:
                     st.markdown(f"<p style='color: #2c3e50; font-size: 16px; text-align: right;'>{class_name}</p>", unsafe_allow_html=True)
                 with col2:
                     st.progress(prob)
-                    st.markdown(f"<p style='color: #4a7c59; font-size: 14px; text-align: right;'>{prob*100:.2f}%</p>", unsafe_allow_html=True) 
\ No newline at end of file
+                    st.markdown(f"<p style='color: #4a7c59; font-size: 14px; text-align: right;'>{prob*100:.2f}%</p>", unsafe_allow_html=True) 
+
+# Statistiques du cache de prédictions (le cache hache le checkpoint : seulement s'il existe,
+# l'erreur de modèle manquant reste affichée au clic sur « Analyser »)
+if not API_URL and os.path.exists(MODEL_PATH):
+    cache_stats = get_prediction_cache().stats()
+    st.sidebar.caption(
+        f"Cache des prédictions : {cache_stats['hits']} succès, {cache_stats['misses']} échecs "
+        f"({cache_stats['memory_entries']}/{cache_stats['max_entries']} entrées)"
+    )
@@ -0,0 +1,42 @@
+import unittest
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from app.ml.distributed import ResumableSampler
+from app.ml.engine import TrainingEngine
+
+class ResumableSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        # 10 images, batchs de 4 : le dernier batch de l'époque est incomplet
+        self.dataset = TensorDataset(torch.randn(10, 2), torch.randint(0, 3, (10,)))
+
+    def test_resume_mid_epoch_skips_seen_images(self):
+        sampler = ResumableSampler(self.dataset)
+        sampler.set_epoch(1)
+        order = list(sampler)
+        sampler.set_start(4)
+        self.assertEqual(len(sampler), 6)
+        self.assertEqual(list(sampler), order[4:])
+
+    def test_resume_at_epoch_boundary(self):
+        # Checkpoint écrit après le dernier batch : 3 batchs de 4 = 12 > 10 images
+        sampler = ResumableSampler(self.dataset)
+        sampler.set_start(12)
+        self.assertEqual(len(sampler), 0)
+        self.assertEqual(list(sampler), [])
+
+    def test_engine_resumes_at_epoch_boundary(self):
+        model = torch.nn.Linear(2, 3)
+        engine = TrainingEngine(model, torch.nn.CrossEntropyLoss(), torch.optim.SGD(model.parameters(), lr=0.1))
+        loader = DataLoader(self.dataset, batch_size=4, sampler=ResumableSampler(self.dataset))
+        engine.resume_batch_size = 4
+        stats = engine.train_epoch(loader, epoch=0, start_batch=3)
+        self.assertEqual(stats['images'], 0)
+        # L'époque suivante repart du début
+        self.assertEqual(len(loader), 3)
+        self.assertEqual(engine.train_epoch(loader, epoch=1)['images'], 10)
+
+if __name__ == '__main__':
+    unittest.main()